@@ -1,18 +1,22 @@
-import pandas as pd
-import os
+import json
+import sys
 
-file_path = '/Users/a1111/Documents/trae_projects/for_leads/a_vroters_members (1).xlsx'
+from api.preview import preview
+
+# Usage: python analyze_excel.py <file.xlsx> [sample_rows]
+# Same mapping detection and profiling as POST /api/import/preview (no duplicate check: no database here)
+
+if len(sys.argv) < 2:
+    sys.exit("Usage: python analyze_excel.py <file.xlsx> [sample_rows]")
+
+file_path = sys.argv[1]
+sample_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 200
 
 try:
-    if not os.path.exists(file_path):
-        print(f"File not found: {file_path}")
-    else:
-        df = pd.read_excel(file_path)
-        print("Columns:")
-        print(df.columns.tolist())
-        print("\nFirst 3 rows:")
-        print(df.head(3).to_string())
-        print("\nData Types:")
-        print(df.dtypes)
+    with open(file_path, "rb") as f:
+        result = preview(f, sample_rows=sample_rows)
+    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+except FileNotFoundError:
+    print(f"File not found: {file_path}")
 except Exception as e:
     print(f"Error reading file: {e}")
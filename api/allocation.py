@@ -0,0 +1,92 @@
+"""
+Lead allocation engine behind /api/distribute.
+
+A distribution claims N unassigned, non-archived leads matching the package
+and links them to the LeadTransaction and recipient, in one statement:
+
+    UPDATE leads SET transaction_id = :tx, manager_name = :recipient, owner_id = :owner, assigned_at = :now
+    WHERE id IN (SELECT id FROM leads WHERE <pool filters> ORDER BY created_at, id
+                 LIMIT :n FOR UPDATE SKIP LOCKED)
+      AND transaction_id IS NULL
+
+On PostgreSQL, SKIP LOCKED lets several managers draw from the same pool in
+parallel: each one skips rows another transaction is claiming instead of
+waiting on them. SQLite has no row locks (the clause isn't rendered) but runs
+the whole UPDATE under its single writer lock, so the claim is still atomic.
+The outer `transaction_id IS NULL` guard keeps a lead from being claimed twice.
+owner_id is the recipient's user ID when the recipient is a user (see
+api/ownership.py), otherwise NULL.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import Lead
+
+# Which funnel stages each package draws from
+PACKAGE_STAGES = {
+    "Cold": ["Новый"],
+    "Warm": ["Заинтересован", "На этапе формирования запроса"],
+    "Premium": ["Видеосозвон", "На этапе согласования условий"],
+}
+
+
+def pool_filters(package_type: Optional[str] = None, batch_id: Optional[int] = None,
+                 max_age_days: Optional[int] = None, now: Optional[datetime] = None):
+    """WHERE clauses for the unassigned pool a package draws from."""
+    filters = [
+        Lead.transaction_id.is_(None),
+        Lead.manager_name.is_(None),
+        Lead.owner_id.is_(None),
+        Lead.is_archived == False,
+    ]
+    stages = PACKAGE_STAGES.get(package_type)
+    if stages:
+        filters.append(Lead.stage.in_(stages))
+    if batch_id is not None:
+        filters.append(Lead.batch_id == batch_id)
+    if max_age_days is not None:
+        filters.append(Lead.created_at >= (now or datetime.now()) - timedelta(days=max_age_days))
+    return filters
+
+
+def _claim_statement(transaction_id: int, recipient: str, owner_id: Optional[int], count: int, filters, returning: bool):
+    candidates = (
+        select(Lead.id)
+        .where(*filters)
+        .order_by(Lead.created_at, Lead.id)
+        .limit(count)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(Lead)
+        .where(Lead.id.in_(candidates), Lead.transaction_id.is_(None))
+        .values(transaction_id=transaction_id, manager_name=recipient, owner_id=owner_id, assigned_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    )
+    if returning:
+        stmt = stmt.returning(Lead.id)
+    return stmt
+
+
+def claim_leads(db: Session, transaction_id: int, recipient: str, count: int, owner_id: Optional[int] = None,
+                **pool) -> List[int]:
+    """Claim up to `count` leads for a transaction. Returns the claimed lead IDs; caller commits."""
+    returning = db.get_bind().dialect.update_returning
+    result = db.execute(_claim_statement(transaction_id, recipient, owner_id, count, pool_filters(**pool), returning))
+    if returning:
+        return list(result.scalars().all())
+    return list(db.execute(select(Lead.id).where(Lead.transaction_id == transaction_id)).scalars().all())
+
+
+async def claim_leads_async(db: AsyncSession, transaction_id: int, recipient: str, count: int,
+                            owner_id: Optional[int] = None, **pool) -> List[int]:
+    returning = db.get_bind().dialect.update_returning
+    result = await db.execute(_claim_statement(transaction_id, recipient, owner_id, count, pool_filters(**pool), returning))
+    if returning:
+        return list(result.scalars().all())
+    return list((await db.execute(select(Lead.id).where(Lead.transaction_id == transaction_id))).scalars().all())
@@ -0,0 +1,182 @@
+"""
+Hot/cold tiering for archived leads and old interactions.
+
+The active funnel only needs active leads and recent history, but archived
+leads and years of interactions sit in the same tables and indexes. The
+compaction job moves them to cold tables (leads_archive,
+interactions_archive) in the same database, chunk by chunk, with
+INSERT ... SELECT followed by DELETE:
+
+  * archived leads not touched for ARCHIVE_LEADS_AFTER_DAYS, together with
+    all their interactions,
+  * interactions older than ARCHIVE_INTERACTIONS_AFTER_DAYS of any lead.
+
+Cold rows keep their IDs, so restore and include_archived reads find them
+transparently. Stage events are not tiered: they are narrow rows, and funnel
+metrics have to count archived leads' history too.
+"""
+import os
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import delete, func, insert, literal, select, text, update
+from sqlalchemy.orm import Session
+
+from .database import Lead, Interaction, ArchivedLead, ArchivedInteraction, StageEvent, SessionLocal
+
+ARCHIVE_LEADS_AFTER_DAYS = int(os.getenv("ARCHIVE_LEADS_AFTER_DAYS", "30"))
+ARCHIVE_INTERACTIONS_AFTER_DAYS = int(os.getenv("ARCHIVE_INTERACTIONS_AFTER_DAYS", "365"))
+CHUNK_SIZE = 1000
+
+_LEAD_COLUMNS = [c.name for c in Lead.__table__.columns]
+_INTERACTION_COLUMNS = [c.name for c in Interaction.__table__.columns]
+
+
+class RestoreConflictError(Exception):
+    pass
+
+
+def _move(db: Session, source, target, columns, condition) -> int:
+    """Copy matching rows into the target table, then delete them from the source."""
+    now = datetime.now()
+    source_table, target_table = source.__table__, target.__table__
+    if "archived_at" in target_table.c:
+        db.execute(insert(target_table).from_select(
+            columns + ["archived_at"],
+            select(*[source_table.c[c] for c in columns], literal(now)).where(condition),
+        ))
+    else:
+        db.execute(insert(target_table).from_select(
+            columns, select(*[source_table.c[c] for c in columns]).where(condition)
+        ))
+    return db.execute(delete(source_table).where(condition)).rowcount
+
+
+def _chunks(db: Session, model, condition, chunk_size: int):
+    """Yield ascending ID upper bounds that split the matching rows into chunks."""
+    while True:
+        upper = db.execute(
+            select(model.id).where(condition).order_by(model.id).offset(chunk_size - 1).limit(1)
+        ).scalar()
+        if upper is None:
+            upper = db.execute(select(func.max(model.id)).where(condition)).scalar()
+        if upper is None:
+            return
+        yield upper
+
+
+def archive_leads(db: Session, older_than_days: int = None, job=None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """Move archived, untouched leads and their interactions to the cold tables."""
+    days = ARCHIVE_LEADS_AFTER_DAYS if older_than_days is None else older_than_days
+    cutoff = datetime.now() - timedelta(days=days)
+    eligible = (Lead.is_archived == True) & (Lead.updated_at < cutoff)
+    moved = {"leads": 0, "interactions": 0}
+    for upper in _chunks(db, Lead, eligible, chunk_size):
+        chunk = eligible & (Lead.id <= upper)
+        moved["interactions"] += _move(
+            db, Interaction, ArchivedInteraction, _INTERACTION_COLUMNS,
+            Interaction.lead_id.in_(select(Lead.id).where(chunk)),
+        )
+        moved["leads"] += _move(db, Lead, ArchivedLead, _LEAD_COLUMNS, chunk)
+        db.commit()
+        if job:
+            job.update(message=f"Moved {moved['leads']} archived leads")
+    return moved
+
+
+def archive_interactions(db: Session, older_than_days: int = None, job=None, chunk_size: int = CHUNK_SIZE) -> int:
+    """Move old interactions of any lead to the cold table."""
+    days = ARCHIVE_INTERACTIONS_AFTER_DAYS if older_than_days is None else older_than_days
+    eligible = Interaction.timestamp < datetime.now() - timedelta(days=days)
+    moved = 0
+    for upper in _chunks(db, Interaction, eligible, chunk_size):
+        moved += _move(db, Interaction, ArchivedInteraction, _INTERACTION_COLUMNS, eligible & (Interaction.id <= upper))
+        db.commit()
+        if job:
+            job.update(message=f"Moved {moved} old interactions")
+    return moved
+
+
+def restore_lead(db: Session, lead_id: int) -> Optional[int]:
+    """Bring a cold lead and its cold interactions back to the hot tables. Returns its hot ID; caller commits."""
+    cold = db.get(ArchivedLead, lead_id)
+    if cold is None:
+        return None
+    if cold.telegram_id is not None:
+        clash = db.execute(select(Lead.id).where(Lead.telegram_id == cold.telegram_id)).scalar()
+        if clash is not None:
+            raise RestoreConflictError(f"Lead {clash} already has telegram_id {cold.telegram_id}")
+
+    values = {c: getattr(cold, c) for c in _LEAD_COLUMNS}
+    values.update(is_archived=False, updated_at=datetime.now())
+    # Databases from before AUTOINCREMENT (see database.AUTOINCREMENT_TABLES) may have reused the ID for a newer hot lead
+    reused = db.get(Lead, lead_id) is not None
+    if reused:
+        del values["id"]
+    lead = Lead(**values)
+    db.add(lead)
+    db.flush()
+    if reused:
+        # Stage events stay put while a lead is cold; the ones from before archival are this lead's
+        db.execute(
+            update(StageEvent).where(StageEvent.lead_id == lead_id, StageEvent.timestamp <= cold.archived_at)
+            .values(lead_id=lead.id).execution_options(synchronize_session=False)
+        )
+
+    interactions = ArchivedInteraction.__table__
+    db.execute(insert(Interaction.__table__).from_select(
+        _INTERACTION_COLUMNS,
+        select(*[interactions.c[c] if c != "lead_id" else literal(lead.id) for c in _INTERACTION_COLUMNS])
+        .where(interactions.c.lead_id == lead_id),
+    ))
+    db.execute(delete(interactions).where(interactions.c.lead_id == lead_id))
+    db.execute(delete(ArchivedLead.__table__).where(ArchivedLead.__table__.c.id == lead_id))
+    return lead.id
+
+
+def cold_interactions(db: Session, lead_id: int) -> List[ArchivedInteraction]:
+    return db.query(ArchivedInteraction).filter(ArchivedInteraction.lead_id == lead_id).order_by(ArchivedInteraction.timestamp).all()
+
+
+def _table_size(db: Session, table: str) -> Optional[int]:
+    """On-disk bytes for a table and its indexes, where the database can tell us."""
+    dialect = db.get_bind().dialect.name
+    try:
+        if dialect == "postgresql":
+            return db.execute(text("SELECT pg_total_relation_size(:t)"), {"t": table}).scalar()
+        if dialect == "sqlite":
+            return db.execute(
+                text("SELECT SUM(pgsize) FROM dbstat WHERE name = :t OR name IN "
+                     "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t)"),
+                {"t": table},
+            ).scalar()
+    except Exception:
+        db.rollback()
+    return None
+
+
+def tier_report(db: Session) -> dict:
+    """Row counts (and sizes where available) of the hot and cold tiers."""
+    report = {}
+    for tier, models in (("hot", (Lead, Interaction)), ("cold", (ArchivedLead, ArchivedInteraction))):
+        report[tier] = {}
+        for model in models:
+            table = model.__table__.name
+            report[tier][table] = {
+                "rows": db.execute(select(func.count()).select_from(model.__table__)).scalar(),
+                "bytes": _table_size(db, table),
+            }
+    report["hot"]["active_leads"] = db.execute(select(func.count(Lead.id)).where(Lead.is_archived == False)).scalar()
+    return report
+
+
+def compact_job(job, leads_after_days: int = None, interactions_after_days: int = None) -> dict:
+    """Background job: move eligible rows to the cold tier and report hot-set size before/after."""
+    db = SessionLocal()
+    try:
+        before = tier_report(db)
+        moved = archive_leads(db, leads_after_days, job)
+        moved["old_interactions"] = archive_interactions(db, interactions_after_days, job)
+        return {"moved": moved, "before": before, "after": tier_report(db)}
+    finally:
+        db.close()
@@ -4,15 +4,18 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from .database import get_db, User
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import get_db, get_async_db, User
+from .logs import get_logger
 import os
 import re
 
 # Configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-in-production-9x8y7z6w5v4u3t2s1r0q")
 if SECRET_KEY == "your-super-secret-key-change-in-production-9x8y7z6w5v4u3t2s1r0q":
-    print("WARNING: Using default SECRET_KEY. Set SECRET_KEY environment variable in production!")
+    get_logger(__name__).warning("using default SECRET_KEY; set SECRET_KEY in production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
@@ -52,21 +55,41 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _username_from_token(token: str) -> str:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            raise _credentials_exception()
     except JWTError:
-        raise credentials_exception
-    
+        raise _credentials_exception()
+    return username
+
+# Plain def: FastAPI runs it in the threadpool, so the sync query doesn't block the event loop.
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    username = _username_from_token(token)
     user = db.query(User).filter(User.username == username).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    return user
+
+async def get_current_user_async(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Same as get_current_user, but the user is bound to the request's AsyncSession."""
+    username = _username_from_token(token)
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalars().first()
+    if user is None:
+        raise _credentials_exception()
     return user
+
+def get_current_admin(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
@@ -0,0 +1,189 @@
+"""
+Per-batch performance metrics, precomputed.
+
+Comparing member exports (which file converts better) needs every lead and
+its stage history per batch. That work is done here, one batch at a time
+(indexed on batch_id and stage_events.lead_id), and the results are stored
+in batch_metrics. /api/batches then reads one row per batch and never joins
+leads at request time.
+
+Freshness:
+  * import computes its new batch right away;
+  * writes that change a batch's numbers (stage moves, archive/restore,
+    deletes, merges) only flag its row stale, a single UPDATE;
+  * stale or missing rows are recomputed in the background after a list
+    request, synchronously for a single-batch request, or all at once by
+    refresh_all() (the POST /api/batches/metrics/refresh job).
+
+Leads in the cold tier count as archived. "Contacted" means the lead has at
+least one stage event. Time to first contact runs from the lead's creation to
+its first event, so history from before stage events existed needs the
+stage-event backfill first.
+"""
+import json
+import statistics
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import exists, false, func, literal, or_, select, true, union_all, update
+from sqlalchemy.orm import Session
+
+from .database import Lead, ArchivedLead, LeadBatch, StageEvent, BatchMetrics, SessionLocal
+
+# Current closing stage, plus the name the Streamlit app used
+CONVERTED_STAGES = ("Заключен", "Заключение сделки")
+
+
+def _batch_leads(batch_id: int):
+    return union_all(
+        select(Lead.id, Lead.stage, Lead.is_archived.label("archived"), Lead.created_at).where(Lead.batch_id == batch_id),
+        select(ArchivedLead.id, ArchivedLead.stage, literal(True).label("archived"), ArchivedLead.created_at)
+        .where(ArchivedLead.batch_id == batch_id),
+    ).subquery()
+
+
+def compute(db: Session, batch_id: int) -> dict:
+    """Metric values for one batch, read from its leads and their stage events."""
+    leads = _batch_leads(batch_id)
+    by_stage, total, archived = {}, 0, 0
+    for stage, is_archived, count in db.execute(
+        select(leads.c.stage, leads.c.archived, func.count()).group_by(leads.c.stage, leads.c.archived)
+    ):
+        by_stage[stage or ""] = by_stage.get(stage or "", 0) + count
+        total += count
+        archived += count if is_archived else 0
+
+    first_contacts = db.execute(
+        select(leads.c.created_at, func.min(StageEvent.timestamp))
+        .join(StageEvent, StageEvent.lead_id == leads.c.id)
+        .group_by(leads.c.id, leads.c.created_at)
+    ).all()
+    hours = [
+        (first - created).total_seconds() / 3600
+        for created, first in first_contacts if created is not None and first is not None and first >= created
+    ]
+
+    converted = db.execute(
+        select(func.count()).select_from(leads).where(or_(
+            leads.c.stage.in_(CONVERTED_STAGES),
+            exists().where(StageEvent.lead_id == leads.c.id, StageEvent.to_stage.in_(CONVERTED_STAGES)),
+        ))
+    ).scalar()
+
+    return {
+        "leads": total,
+        "by_stage": json.dumps(by_stage, ensure_ascii=False),
+        "archived": archived,
+        "contacted": len(first_contacts),
+        "converted": converted,
+        "median_hours_to_first_contact": round(statistics.median(hours), 2) if hours else None,
+    }
+
+
+def refresh(db: Session, batch_id: int) -> BatchMetrics:
+    """Recompute and store one batch's metrics. Caller commits."""
+    values = compute(db, batch_id)
+    values.update(stale=False, refreshed_at=datetime.now())
+    row = db.get(BatchMetrics, batch_id)
+    if row is None:
+        row = BatchMetrics(batch_id=batch_id, **values)
+        db.add(row)
+    else:
+        for key, value in values.items():
+            setattr(row, key, value)
+    return row
+
+
+def stale_batch_ids(db: Session, batch_ids: Optional[Iterable[int]] = None) -> List[int]:
+    """Batches whose metrics are missing or flagged stale."""
+    stmt = select(LeadBatch.id).outerjoin(BatchMetrics, BatchMetrics.batch_id == LeadBatch.id).where(
+        or_(BatchMetrics.batch_id.is_(None), BatchMetrics.stale == true())
+    )
+    if batch_ids is not None:
+        stmt = stmt.where(LeadBatch.id.in_(list(batch_ids)))
+    return [batch_id for (batch_id,) in db.execute(stmt)]
+
+
+def refresh_stale(db: Session, batch_ids: Optional[Iterable[int]] = None, job=None) -> int:
+    """Recompute stale batches, committing after each. Returns how many were refreshed."""
+    pending = stale_batch_ids(db, batch_ids)
+    if job:
+        job.update(progress=0, total=len(pending))
+    for done, batch_id in enumerate(pending, 1):
+        refresh(db, batch_id)
+        db.commit()
+        if job:
+            job.update(progress=done)
+    return len(pending)
+
+
+def mark_stale(db: Session, lead_ids: Optional[Iterable[int]] = None) -> None:
+    """Flag the batches of these leads (hot or cold) for recomputation; all batches when lead_ids is None."""
+    stmt = update(BatchMetrics).where(BatchMetrics.stale == false())
+    if lead_ids is not None:
+        lead_ids = list(lead_ids)
+        if not lead_ids:
+            return
+        stmt = stmt.where(BatchMetrics.batch_id.in_(union_all(
+            select(Lead.batch_id).where(Lead.id.in_(lead_ids)),
+            select(ArchivedLead.batch_id).where(ArchivedLead.id.in_(lead_ids)),
+        )))
+    db.execute(stmt.values(stale=True).execution_options(synchronize_session=False))
+
+
+def as_response(row: Optional[BatchMetrics]) -> Optional[dict]:
+    """Metrics dict for LeadBatchResponse.metrics, with shares derived from the counts."""
+    if row is None:
+        return None
+    total = row.leads or 0
+
+    def share(count):
+        return round(count / total, 4) if total else 0.0
+
+    return {
+        "leads": total,
+        "by_stage": json.loads(row.by_stage or "{}"),
+        "archived": row.archived,
+        "archived_share": share(row.archived),
+        "contacted": row.contacted,
+        "contacted_share": share(row.contacted),
+        "converted": row.converted,
+        "conversion_rate": share(row.converted),
+        "median_hours_to_first_contact": row.median_hours_to_first_contact,
+        "stale": row.stale,
+        "refreshed_at": row.refreshed_at,
+    }
+
+
+def attach(db: Session, batches: List[dict]) -> List[int]:
+    """Set "metrics" on batch dicts from stored rows (one query). Returns IDs needing a refresh."""
+    rows = {
+        row.batch_id: row
+        for row in db.query(BatchMetrics).filter(BatchMetrics.batch_id.in_([b["id"] for b in batches]))
+    } if batches else {}
+    pending = []
+    for batch in batches:
+        row = rows.get(batch["id"])
+        batch["metrics"] = as_response(row)
+        if row is None or row.stale:
+            pending.append(batch["id"])
+    return pending
+
+
+def refresh_all_job(job) -> dict:
+    db = SessionLocal()
+    try:
+        db.execute(update(BatchMetrics).values(stale=True))
+        db.commit()
+        return {"refreshed": refresh_stale(db, job=job)}
+    finally:
+        db.close()
+
+
+def refresh_stale_task(batch_ids: List[int]) -> None:
+    """BackgroundTasks entry point after a list request found stale rows."""
+    db = SessionLocal()
+    try:
+        refresh_stale(db, batch_ids)
+    finally:
+        db.close()
@@ -0,0 +1,145 @@
+"""
+Kanban board: per-stage top N cards plus column totals.
+
+The first page of every column comes from one window-function query:
+
+    SELECT * FROM (
+        SELECT <card columns>,
+               row_number() OVER (PARTITION BY stage ORDER BY <order>) AS rn,
+               count(*)     OVER (PARTITION BY stage)                 AS total
+        FROM leads WHERE is_archived = false [AND owner_id = :owner]
+    ) WHERE rn <= :per_column
+
+Each column returns an opaque cursor; later pages are keyset queries on
+(stage, sort key, id), so a column can load more cards independently.
+A manager's board is scoped to owner_id, which the (owner_id, stage, sort
+key, id) indexes serve.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import Session
+
+from . import ownership
+from .database import Lead
+
+ORDERS = ("updated_at", "next_contact_date")
+CARD_COLUMNS = (
+    Lead.id, Lead.full_name, Lead.username, Lead.phone, Lead.stage,
+    Lead.telegram_id, Lead.updated_at, Lead.next_contact_date,
+)
+
+
+def _order_by(order: str):
+    if order == "next_contact_date":
+        # Soonest contact first, leads without a date last
+        return [Lead.next_contact_date.is_(None), Lead.next_contact_date.asc(), Lead.id.asc()]
+    return [Lead.updated_at.desc(), Lead.id.desc()]
+
+
+def _after(order: str, value: Optional[datetime], lead_id: int):
+    """Keyset condition: rows that sort after (value, lead_id)."""
+    if order == "next_contact_date":
+        if value is None:
+            return and_(Lead.next_contact_date.is_(None), Lead.id > lead_id)
+        return or_(
+            Lead.next_contact_date.is_(None),
+            Lead.next_contact_date > value,
+            and_(Lead.next_contact_date == value, Lead.id > lead_id),
+        )
+    return or_(Lead.updated_at < value, and_(Lead.updated_at == value, Lead.id < lead_id))
+
+
+def encode_cursor(stage: str, order: str, card: dict) -> str:
+    value = card[order]
+    payload = {"s": stage, "o": order, "v": value.isoformat() if value else None, "i": card["id"]}
+    return base64.urlsafe_b64encode(json.dumps(payload, ensure_ascii=False).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return {
+            "stage": payload["s"],
+            "order": payload["o"] if payload["o"] in ORDERS else "updated_at",
+            "value": datetime.fromisoformat(payload["v"]) if payload["v"] else None,
+            "id": int(payload["i"]),
+        }
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def _column(stage: str, total: int, cards: List[dict], per_column: int, order: str) -> dict:
+    has_more = len(cards) > per_column
+    cards = cards[:per_column]
+    return {
+        "stage": stage,
+        "total": total,
+        "cards": cards,
+        "next_cursor": encode_cursor(stage, order, cards[-1]) if has_more else None,
+    }
+
+
+def board(db: Session, per_column: int = 20, order: str = "updated_at", stages: Optional[List[str]] = None,
+          owner_id: Optional[int] = None) -> dict:
+    """First page of every column (of one owner's leads unless owner_id is None)."""
+    filters = [Lead.is_archived == False, *ownership.conditions(Lead, owner_id)]
+    if stages:
+        filters.append(Lead.stage.in_(stages))
+    ranked = select(
+        *CARD_COLUMNS,
+        func.row_number().over(partition_by=Lead.stage, order_by=_order_by(order)).label("rn"),
+        func.count().over(partition_by=Lead.stage).label("total"),
+    ).where(*filters).subquery()
+    rows = db.execute(
+        select(ranked).where(ranked.c.rn <= per_column + 1).order_by(ranked.c.stage, ranked.c.rn)
+    ).mappings()
+
+    cards: Dict[str, List[dict]] = {}
+    totals: Dict[str, int] = {}
+    for row in rows:
+        totals[row["stage"]] = row["total"]
+        cards.setdefault(row["stage"], []).append({c.name: row[c.name] for c in CARD_COLUMNS})
+
+    ordered_stages = list(stages) if stages else sorted(totals)
+    return {
+        "order": order,
+        "columns": [
+            _column(stage, totals.get(stage, 0), cards.get(stage, []), per_column, order)
+            for stage in ordered_stages
+        ],
+    }
+
+
+def more_cards(db: Session, cursors: List[str], per_column: int = 20, owner_id: Optional[int] = None) -> dict:
+    """Next page for each column that sent a cursor."""
+    positions = [decode_cursor(c) for c in cursors]
+    stages = [p["stage"] for p in positions]
+    scoped = ownership.conditions(Lead, owner_id)
+    totals = dict(db.execute(
+        select(Lead.stage, func.count(Lead.id))
+        .where(Lead.is_archived == False, Lead.stage.in_(stages), *scoped)
+        .group_by(Lead.stage)
+    ).all())
+
+    columns = []
+    order = positions[0]["order"] if positions else "updated_at"
+    for position in positions:
+        order = position["order"]
+        rows = db.execute(
+            select(*CARD_COLUMNS)
+            .where(
+                Lead.is_archived == False,
+                Lead.stage == position["stage"],
+                *scoped,
+                _after(order, position["value"], position["id"]),
+            )
+            .order_by(*_order_by(order))
+            .limit(per_column + 1)
+        ).mappings()
+        cards = [dict(row) for row in rows]
+        columns.append(_column(position["stage"], totals.get(position["stage"], 0), cards, per_column, order))
+    return {"order": order, "columns": columns}
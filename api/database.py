@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Text, Float, Boolean, BigInteger
+from sqlalchemy import create_engine, event, make_url, exc, inspect, pool, text, Column, Index, Table, UniqueConstraint, Integer, String, Date, DateTime, ForeignKey, Text, Float, Boolean, BigInteger
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
+from sqlalchemy.schema import CreateTable
 from datetime import datetime
 import os
+import threading
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -30,9 +33,27 @@ class LeadBatch(Base):
     file_name = Column(String, nullable=True)
     imported_at = Column(DateTime, default=datetime.now)
     count = Column(Integer, default=0)
+    content_hash = Column(String(64), nullable=True, unique=True, index=True) # Upload sha256, see api/importing.py
+    state = Column(String, default="done") # processing, done, failed
+    processed_rows = Column(Integer, default=0) # File rows covered by committed chunks; a resumed import starts here
+    claimed_at = Column(DateTime, nullable=True) # Renewed by the importing worker with every chunk; stale claims can be taken over
 
     leads = relationship("Lead", back_populates="batch")
 
+class BatchMetrics(Base):
+    """Precomputed per-batch performance (see api/batch_metrics.py)."""
+    __tablename__ = 'batch_metrics'
+
+    batch_id = Column(Integer, ForeignKey('lead_batches.id', ondelete='CASCADE'), primary_key=True)
+    leads = Column(Integer, nullable=False, default=0)
+    by_stage = Column(Text, nullable=False, default="{}") # JSON {stage: count}
+    archived = Column(Integer, nullable=False, default=0)
+    contacted = Column(Integer, nullable=False, default=0)
+    converted = Column(Integer, nullable=False, default=0)
+    median_hours_to_first_contact = Column(Float, nullable=True)
+    stale = Column(Boolean, nullable=False, default=False)
+    refreshed_at = Column(DateTime, default=datetime.now)
+
 class Lead(Base):
     __tablename__ = 'leads'
 
@@ -43,27 +64,155 @@ class Lead(Base):
     username = Column(String, nullable=True)
     bio = Column(Text, nullable=True)
     stage = Column(String, default="Первый контакт")
-    manager_name = Column(String, nullable=True)
+    manager_name = Column(String, nullable=True) # Display name; ownership is owner_id
+    owner_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=True) # See api/ownership.py
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     next_contact_date = Column(DateTime, nullable=True)
     is_archived = Column(Boolean, default=False)
-    batch_id = Column(Integer, ForeignKey('lead_batches.id'), nullable=True)
+    batch_id = Column(Integer, ForeignKey('lead_batches.id', ondelete='SET NULL'), nullable=True, index=True)
+    transaction_id = Column(Integer, ForeignKey('lead_transactions.id'), nullable=True, index=True) # Distribution that claimed this lead
+    assigned_at = Column(DateTime, nullable=True)
+    # Normalized blocking keys for duplicate detection (see api/dedupe.py)
+    phone_key = Column(String, nullable=True, index=True)
+    username_key = Column(String, nullable=True, index=True)
+    name_key = Column(String, nullable=True, index=True)
 
     interactions = relationship("Interaction", back_populates="lead")
     batch = relationship("LeadBatch", back_populates="leads")
+    transaction = relationship("LeadTransaction", back_populates="leads")
+
+    __table_args__ = (
+        # The pool the allocation engine claims from: unassigned, active leads by stage, oldest first
+        Index(
+            'ix_leads_unassigned_pool', 'stage', 'created_at', 'id',
+            postgresql_where=text("transaction_id IS NULL AND is_archived = false"),
+            sqlite_where=text("transaction_id IS NULL AND is_archived = 0"),
+        ),
+        # Kanban columns (api/board.py): per-stage ordering by either sort key
+        Index('ix_leads_board_updated', 'stage', 'updated_at', 'id'),
+        Index('ix_leads_board_next_contact', 'stage', 'next_contact_date', 'id'),
+        # "My leads": a manager's board and lists; also serve as the owner_id foreign key index
+        Index('ix_leads_owner_board_updated', 'owner_id', 'stage', 'updated_at', 'id'),
+        Index('ix_leads_owner_board_next_contact', 'owner_id', 'stage', 'next_contact_date', 'id'),
+        # Daily reminders (api/repository.py due_reminders): a one-day range across all stages
+        Index('ix_leads_next_contact', 'next_contact_date'),
+        # Cold rows keep their IDs, so SQLite must never hand out an ID again (see AUTOINCREMENT_TABLES)
+        {'sqlite_autoincrement': True},
+    )
 
 class Interaction(Base):
     __tablename__ = 'interactions'
 
     id = Column(Integer, primary_key=True)
-    lead_id = Column(Integer, ForeignKey('leads.id'))
+    lead_id = Column(Integer, ForeignKey('leads.id', ondelete='CASCADE'), index=True)
     timestamp = Column(DateTime, default=datetime.now)
     contact_method = Column(String)
     content = Column(Text)
     
     lead = relationship("Lead", back_populates="interactions")
 
+    __table_args__ = {'sqlite_autoincrement': True}
+
+# --- Cold tier (see api/archive.py) ---
+# Same columns as the hot tables, minus unique constraints and foreign keys.
+
+def _cold_columns(table):
+    return [
+        Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False, nullable=c.nullable)
+        for c in table.columns
+    ]
+
+class ArchivedInteraction(Base):
+    __table__ = Table(
+        'interactions_archive', Base.metadata,
+        *_cold_columns(Interaction.__table__),
+        Column('archived_at', DateTime, default=datetime.now),
+        Index('ix_interactions_archive_lead_id', 'lead_id'),
+    )
+
+class ArchivedLead(Base):
+    __table__ = Table(
+        'leads_archive', Base.metadata,
+        *_cold_columns(Lead.__table__),
+        Column('archived_at', DateTime, default=datetime.now),
+        Index('ix_leads_archive_telegram_id', 'telegram_id'),
+        Index('ix_leads_archive_batch_id', 'batch_id'),
+        Index('ix_leads_archive_owner_id', 'owner_id'),
+    )
+
+    interactions = relationship(
+        ArchivedInteraction,
+        primaryjoin="ArchivedLead.id == foreign(ArchivedInteraction.lead_id)",
+        viewonly=True,
+    )
+
+class StageEvent(Base):
+    """One funnel move (see api/transitions.py).
+
+    lead_id deliberately has no foreign key: archiving moves a lead to
+    leads_archive under the same ID, and its funnel history must survive
+    that (a cascade would delete it, a plain FK would block the move).
+    Purges and merges handle it through LEAD_DEPENDENTS.
+    """
+    __tablename__ = 'stage_events'
+
+    id = Column(Integer, primary_key=True)
+    lead_id = Column(Integer, nullable=False)
+    from_stage = Column(String, nullable=True)
+    to_stage = Column(String, nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    timestamp = Column(DateTime, default=datetime.now, nullable=False)
+    source = Column(String, nullable=True) # interaction, bulk, backfill
+    interaction_id = Column(Integer, nullable=True, index=True) # The "Move Stage" interaction it came from
+
+    __table_args__ = (
+        # "distinct leads moved to X between a and b" is a range scan covered by this index
+        Index('ix_stage_events_to_stage_time', 'to_stage', 'timestamp', 'lead_id'),
+        Index('ix_stage_events_lead_time', 'lead_id', 'timestamp'),
+        Index('ix_stage_events_timestamp', 'timestamp'),
+    )
+
+class FunnelDaily(Base):
+    """Daily funnel rollup per stage, user and batch (see api/rollups.py).
+
+    user_id and batch_id use 0 for "none" so the natural key can be unique.
+    """
+    __tablename__ = 'funnel_daily'
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    stage = Column(String, nullable=False)
+    user_id = Column(Integer, nullable=False, default=0)
+    batch_id = Column(Integer, nullable=False, default=0)
+    entered = Column(Integer, nullable=False, default=0) # moves into the stage
+    exited = Column(Integer, nullable=False, default=0) # moves out of the stage
+    dwell_seconds = Column(Float, nullable=False, default=0) # total time spent in the stage by those exits
+
+    __table_args__ = (
+        UniqueConstraint('day', 'stage', 'user_id', 'batch_id', name='uq_funnel_daily_key'),
+        Index('ix_funnel_daily_stage_day', 'stage', 'day'),
+    )
+
+class RollupState(Base):
+    """High-water marks for incremental rollups."""
+    __tablename__ = 'rollup_state'
+
+    name = Column(String, primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    scanned_at = Column(DateTime, nullable=True) # when last_id was read; the next run re-scans a window before it
+    locked_until = Column(DateTime, nullable=True) # lease held by the refresh or rebuild writing the rollup
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# Cold tables mirror these hot tables; upgrade_schema() adds columns they gain later
+COLD_MIRRORS = {"leads_archive": "leads", "interactions_archive": "interactions"}
+
+# Hot tables whose IDs live on in a cold table, which SQLite must not reuse
+AUTOINCREMENT_TABLES = {"leads": "leads_archive", "interactions": "interactions_archive"}
+
+# Tables with a lead_id that must follow a lead when it is merged or purged
+LEAD_DEPENDENTS = [Interaction, ArchivedInteraction, StageEvent]
+
 class LeadTransaction(Base):
     __tablename__ = 'lead_transactions'
 
@@ -75,6 +224,19 @@ class LeadTransaction(Base):
     timestamp = Column(DateTime, default=datetime.now)
     
     user = relationship("User", back_populates="transactions")
+    leads = relationship("Lead", back_populates="transaction")
+
+class BalanceLedgerEntry(Base):
+    """Append-only record of every balance change (debits are negative)."""
+    __tablename__ = 'balance_ledger'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    delta = Column(Integer, nullable=False)
+    balance_after = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False) # distribute, refund, ...
+    transaction_id = Column(Integer, ForeignKey('lead_transactions.id'), nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
 
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -87,11 +249,480 @@ if os.environ.get("VERCEL") and DATABASE_URL.startswith("sqlite:///./crm.db"):
 if DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
+# --- Engine profiles ---
+#
+# serverless: Vercel / Lambda. Every instance gets its own pool, so we keep none
+#             (NullPool) unless DB_POOL_SIZE asks for a tiny one. Safe behind PgBouncer.
+# server:     long-running uvicorn. A tuned QueuePool with pre-ping and recycling.
+# sqlite:     local file database. WAL so readers don't block the importer.
+
+ENGINE_PROFILES = ("serverless", "server", "sqlite")
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    try:
+        return int(value) if value not in (None, "") else default
+    except ValueError:
+        return default
+
+
+def select_engine_profile(url=None):
+    """Pick an engine profile: DB_ENGINE_PROFILE wins, otherwise infer from URL and environment."""
+    url = url or DATABASE_URL
+    profile = os.getenv("DB_ENGINE_PROFILE", "").strip().lower()
+    if profile in ENGINE_PROFILES:
+        return profile
+    if url.startswith("sqlite"):
+        return "sqlite"
+    if os.environ.get("VERCEL") or os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+        return "serverless"
+    return "server"
+
+
+class PoolMetrics:
+    """Connection pool counters, updated from pool events."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.connects = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.invalidations = 0
+            self.checkout_timeouts = 0
+            self.checkout_wait_total = 0.0
+            self.checkout_wait_max = 0.0
+
+    def record_wait(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkout_wait_total += seconds
+            if seconds > self.checkout_wait_max:
+                self.checkout_wait_max = seconds
+            if timed_out:
+                self.checkout_timeouts += 1
+
+    def incr(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            avg_wait = self.checkout_wait_total / self.checkouts if self.checkouts else 0.0
+            return {
+                "connects": self.connects,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "invalidations": self.invalidations,
+                "checkout_timeouts": self.checkout_timeouts,
+                "checkout_wait_total_ms": round(self.checkout_wait_total * 1000, 3),
+                "checkout_wait_avg_ms": round(avg_wait * 1000, 3),
+                "checkout_wait_max_ms": round(self.checkout_wait_max * 1000, 3),
+            }
+
+
+class _TimedPoolMixin:
+    """Measures how long callers wait for a connection (queueing + connect)."""
+
+    metrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return conn
+
+
+def _timed_pool_class(base, metrics):
+    return type(f"Timed{base.__name__}", (_TimedPoolMixin, base), {"metrics": metrics})
+
+
+def _sqlite_pragmas():
+    return {
+        "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+        "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+        "busy_timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+        # Negative cache_size is in KiB: 64 MiB page cache per connection.
+        "cache_size": -_env_int("SQLITE_CACHE_SIZE_KB", 64000),
+        "mmap_size": _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        "temp_store": "MEMORY",
+        # Needed for ON DELETE CASCADE / SET NULL to apply
+        "foreign_keys": "ON",
+    }
+
+
+def engine_options(profile, url):
+    """Keyword arguments for create_engine() for the given profile."""
+    if profile == "sqlite":
+        options = {"connect_args": {"check_same_thread": False, "timeout": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000) / 1000}}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            options["poolclass"] = pool.StaticPool
+        else:
+            options["poolclass"] = pool.QueuePool
+            options["pool_size"] = _env_int("DB_POOL_SIZE", 5)
+            options["max_overflow"] = _env_int("DB_MAX_OVERFLOW", 10)
+            options["pool_timeout"] = _env_int("DB_POOL_TIMEOUT", 30)
+        return options
+
+    connect_args = {"connect_timeout": _env_int("DB_CONNECT_TIMEOUT", 10)} if url.startswith("postgresql") else {}
+
+    if profile == "serverless":
+        pool_size = _env_int("DB_POOL_SIZE", 0)
+        options = {"connect_args": connect_args, "pool_pre_ping": True}
+        if pool_size <= 0:
+            options["poolclass"] = pool.NullPool
+        else:
+            options["poolclass"] = pool.QueuePool
+            options["pool_size"] = pool_size
+            options["max_overflow"] = 0
+            options["pool_timeout"] = _env_int("DB_POOL_TIMEOUT", 10)
+            # PgBouncer and hosted Postgres drop idle connections aggressively
+            options["pool_recycle"] = _env_int("DB_POOL_RECYCLE", 300)
+        return options
+
+    return {
+        "connect_args": connect_args,
+        "poolclass": pool.QueuePool,
+        "pool_size": _env_int("DB_POOL_SIZE", 10),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 20),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": True,
+        "pool_use_lifo": True,
+    }
+
+
+def _install_pool_listeners(target, metrics):
+    @event.listens_for(target, "connect")
+    def _on_connect(dbapi_conn, conn_record):
+        metrics.incr("connects")
+
+    @event.listens_for(target, "checkout")
+    def _on_checkout(dbapi_conn, conn_record, conn_proxy):
+        metrics.incr("checkouts")
+
+    @event.listens_for(target, "checkin")
+    def _on_checkin(dbapi_conn, conn_record):
+        metrics.incr("checkins")
+
+    @event.listens_for(target, "invalidate")
+    def _on_invalidate(dbapi_conn, conn_record, exception):
+        metrics.incr("invalidations")
+
+
+def _install_sqlite_pragmas(target):
+    pragmas = _sqlite_pragmas()
+
+    @event.listens_for(target, "connect")
+    def _set_pragmas(dbapi_conn, conn_record):
+        cursor = dbapi_conn.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def _install_slow_query_log(target):
+    """Opt-in (SLOW_QUERY_MS); imported lazily so scripts don't pull in the web stack."""
+    if os.getenv("SLOW_QUERY_MS"):
+        from . import slowlog
+        slowlog.install(target)
+
+
+def make_engine(url=None, profile=None, metrics=None):
+    """Create an engine configured for the deployment profile."""
+    url = url or DATABASE_URL
+    profile = profile or select_engine_profile(url)
+    metrics = metrics or PoolMetrics()
+    options = engine_options(profile, url)
+    pool_class = options.get("poolclass", pool.QueuePool)
+    options["poolclass"] = _timed_pool_class(pool_class, metrics)
+
+    new_engine = create_engine(url, **options)
+    _install_pool_listeners(new_engine, metrics)
+    if profile == "sqlite":
+        _install_sqlite_pragmas(new_engine)
+    new_engine.info = {"profile": profile, "pool_class": pool_class.__name__, "metrics": metrics}
+    _install_slow_query_log(new_engine)
+    return new_engine
+
+
+def get_pool_metrics(target=None):
+    """Pool status and counters for an engine (defaults to the main engine)."""
+    target = getattr(target, "sync_engine", target or engine)
+    current = target.pool
+    data = {
+        "profile": target.info["profile"],
+        "pool_class": target.info["pool_class"],
+        "status": current.status(),
+    }
+    if isinstance(current, pool.QueuePool):
+        data.update({
+            "size": current.size(),
+            "checked_in": current.checkedin(),
+            "checked_out": current.checkedout(),
+            "overflow": current.overflow(),
+        })
+    data.update(target.info["metrics"].snapshot())
+    return data
+
+
+# libpq URL parameters that asyncpg.connect() rejects as unknown keywords; sslmode becomes its ssl= argument
+_LIBPQ_ONLY_PARAMS = ("sslmode", "channel_binding")
+
+
+def _without_libpq_params(url):
+    parsed = make_url(url)
+    if not any(name in parsed.query for name in _LIBPQ_ONLY_PARAMS):
+        return url
+    return parsed.difference_update_query(_LIBPQ_ONLY_PARAMS).render_as_string(hide_password=False)
+
+
+def async_database_url(url=None):
+    """Map a sync database URL onto its async driver (asyncpg / aiosqlite)."""
+    url = url or DATABASE_URL
+    if url.startswith("postgresql://"):
+        return _without_libpq_params(url.replace("postgresql://", "postgresql+asyncpg://", 1))
+    if url.startswith("postgresql+psycopg2://"):
+        return _without_libpq_params(url.replace("postgresql+psycopg2://", "postgresql+asyncpg://", 1))
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    if url == "sqlite://":
+        return "sqlite+aiosqlite://"
+    return url
+
+
+def asyncpg_connect_args(url=None, connect_args=None) -> dict:
+    """Keyword arguments for asyncpg.connect() on top of the URL, from the sync profile's connect_args."""
+    url = url or DATABASE_URL
+    args = dict(connect_args or {})
+    timeout = args.pop("connect_timeout", None)
+    if timeout:
+        args["timeout"] = timeout
+    # PgBouncer (transaction pooling) can't keep prepared statements between transactions
+    args["statement_cache_size"] = 0
+    args["prepared_statement_cache_size"] = 0
+    sslmode = make_url(url).query.get("sslmode")
+    if isinstance(sslmode, tuple):
+        sslmode = sslmode[-1]
+    if sslmode:
+        # asyncpg takes the libpq mode names (disable, prefer, require, verify-full, ...)
+        args["ssl"] = sslmode
+    return args
+
+
+def make_async_engine(url=None, profile=None, metrics=None):
+    """Async counterpart of make_engine(), sharing the same profiles."""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = url or DATABASE_URL
+    profile = profile or select_engine_profile(url)
+    metrics = metrics or PoolMetrics()
+    options = engine_options(profile, url)
+    pool_class = options.get("poolclass", pool.QueuePool)
+    if pool_class is pool.QueuePool:
+        pool_class = pool.AsyncAdaptedQueuePool
+    options["poolclass"] = _timed_pool_class(pool_class, metrics)
+
+    async_url = async_database_url(url)
+    if async_url.startswith("postgresql+asyncpg"):
+        options["connect_args"] = asyncpg_connect_args(url, options["connect_args"])
+
+    new_engine = create_async_engine(async_url, **options)
+    _install_pool_listeners(new_engine.sync_engine, metrics)
+    if profile == "sqlite":
+        _install_sqlite_pragmas(new_engine.sync_engine)
+    new_engine.sync_engine.info = {"profile": profile, "pool_class": pool_class.__name__, "metrics": metrics}
+    _install_slow_query_log(new_engine.sync_engine)
+    return new_engine
+
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# The async engine is created lazily so that sync-only entry points don't import the async drivers.
+_async_engine = None
+_AsyncSessionLocal = None
+
+
+def get_async_engine():
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = make_async_engine(DATABASE_URL)
+    return _async_engine
+
+
+def AsyncSessionLocal():
+    """Open an AsyncSession on the shared async engine."""
+    global _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _AsyncSessionLocal = async_sessionmaker(
+            bind=get_async_engine(), autoflush=False, expire_on_commit=False
+        )
+    return _AsyncSessionLocal()
+
+# Columns added after the first release. create_all() only creates missing tables,
+# so these are added to existing tables by upgrade_schema().
+SCHEMA_UPGRADES = [
+    ("leads", "transaction_id", "INTEGER REFERENCES lead_transactions(id)"),
+    ("leads", "assigned_at", "TIMESTAMP"),
+    ("leads", "phone_key", "VARCHAR"),
+    ("leads", "username_key", "VARCHAR"),
+    ("leads", "name_key", "VARCHAR"),
+    ("leads", "owner_id", "INTEGER REFERENCES users(id) ON DELETE SET NULL"),
+    ("lead_batches", "content_hash", "VARCHAR(64)"),
+    ("lead_batches", "state", "VARCHAR DEFAULT 'done'"),
+    ("lead_batches", "processed_rows", "INTEGER DEFAULT 0"),
+    ("lead_batches", "claimed_at", "TIMESTAMP"),
+    ("rollup_state", "scanned_at", "TIMESTAMP"),
+    ("rollup_state", "locked_until", "TIMESTAMP"),
+    # crm.db files created by the Streamlit console's old schema (before database.py re-exported this one)
+    ("leads", "is_archived", "BOOLEAN DEFAULT FALSE"),
+    ("leads", "batch_id", "INTEGER REFERENCES lead_batches(id) ON DELETE SET NULL"),
+]
+
+# Foreign keys whose ON DELETE rule changed after the first release: (table, column, rule).
+# SQLite can't alter constraints, so there only new databases get them.
+FOREIGN_KEY_UPGRADES = [
+    ("interactions", "lead_id", "CASCADE"),
+    ("leads", "batch_id", "SET NULL"),
+]
+
+def _upgrade_foreign_keys(conn, inspector, tables):
+    changed = []
+    for table, column, rule in FOREIGN_KEY_UPGRADES:
+        if table not in tables:
+            continue
+        for fk in inspector.get_foreign_keys(table):
+            if fk["constrained_columns"] != [column] or not fk.get("name"):
+                continue
+            if (fk.get("options") or {}).get("ondelete", "").upper() == rule:
+                continue
+            referred = f'{fk["referred_table"]}({", ".join(fk["referred_columns"])})'
+            conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT {fk["name"]}'))
+            conn.execute(text(
+                f'ALTER TABLE {table} ADD CONSTRAINT {fk["name"]} FOREIGN KEY ({column}) REFERENCES {referred} ON DELETE {rule}'
+            ))
+            changed.append(fk["name"])
+    return changed
+
+
+def _upgrade_sqlite_autoincrement(bind):
+    """Rebuild hot tables created without AUTOINCREMENT (SQLite reuses the highest free rowid otherwise).
+
+    SQLite can't add AUTOINCREMENT to a table, so this follows its documented
+    rebuild: create the new table, copy the rows as they are, drop, rename,
+    restore indexes and triggers, with foreign key enforcement off so the
+    drop doesn't cascade.
+    sqlite_sequence starts past the highest hot or cold ID. Returns what was rebuilt.
+    """
+    raw = getattr(bind, "engine", bind).raw_connection()
+    dbapi_conn = raw.driver_connection
+    isolation_level = dbapi_conn.isolation_level
+    dbapi_conn.isolation_level = None
+    cursor = dbapi_conn.cursor()
+    rebuilt = []
+    try:
+        created = dict(cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'table'").fetchall())
+        pending = [
+            (table, cold) for table, cold in AUTOINCREMENT_TABLES.items()
+            if table in created and "AUTOINCREMENT" not in created[table].upper()
+        ]
+        if not pending:
+            return rebuilt
+        cursor.execute("PRAGMA foreign_keys=OFF")
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            for table, cold in pending:
+                saved = [sql for (sql,) in cursor.execute(
+                    "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+                    (table,),
+                ).fetchall()]
+                existing = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})").fetchall()}
+                model = Base.metadata.tables[table]
+                columns = ", ".join(c.name for c in model.columns if c.name in existing)
+                staging = f"{table}_autoincrement"
+                ddl = str(CreateTable(model).compile(dialect=bind.dialect))
+                cursor.execute(ddl.replace(f"CREATE TABLE {table} (", f"CREATE TABLE {staging} (", 1))
+                cursor.execute(f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {table}")
+                cursor.execute(f"DROP TABLE {table}")
+                cursor.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+                for sql in saved:
+                    cursor.execute(sql)
+                sources = [table, cold] if cold in created else [table]
+                highest = max(cursor.execute(f"SELECT coalesce(max(id), 0) FROM {name}").fetchone()[0] for name in sources)
+                cursor.execute("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, highest))
+                rebuilt.append(f"{table} AUTOINCREMENT")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+        dbapi_conn.isolation_level = isolation_level
+        raw.close()
+    return rebuilt
+
+
+def upgrade_schema(bind=None):
+    """Add missing columns and indexes to existing tables. Returns what was added."""
+    bind = bind or engine
+    added = []
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        tables = set(inspector.get_table_names())
+        columns = {}
+        for table, column, ddl in SCHEMA_UPGRADES:
+            if table not in tables:
+                continue
+            if table not in columns:
+                columns[table] = {c["name"] for c in inspector.get_columns(table)}
+            if column not in columns[table]:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                columns[table].add(column)
+                added.append(f"{table}.{column}")
+        for cold, hot in COLD_MIRRORS.items():
+            if cold not in tables:
+                continue
+            existing = {c["name"] for c in inspector.get_columns(cold)}
+            for column in Base.metadata.tables[hot].columns:
+                if column.name not in existing:
+                    ddl = column.type.compile(dialect=conn.dialect)
+                    conn.execute(text(f"ALTER TABLE {cold} ADD COLUMN {column.name} {ddl}"))
+                    added.append(f"{cold}.{column.name}")
+        for table in Base.metadata.sorted_tables:
+            if table.name not in tables:
+                continue
+            existing = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(conn, checkfirst=True)
+                    added.append(index.name)
+        if conn.dialect.name == "postgresql":
+            added.extend(_upgrade_foreign_keys(conn, inspector, tables))
+        # FTS5 table and triggers / GIN indexes: raw DDL per dialect, see api/search.py
+        from . import search
+        added.extend(search.ensure_index(conn))
+    if bind.dialect.name == "sqlite":
+        added.extend(_upgrade_sqlite_autoincrement(bind))
+    return added
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    return upgrade_schema(engine)
 
 def get_db():
     db = SessionLocal()
@@ -99,3 +730,7 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
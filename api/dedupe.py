@@ -0,0 +1,259 @@
+"""
+Duplicate detection and merge across lead batches.
+
+Import dedupe only looks at telegram_id, so the same person imported from
+different member exports (no ID, different phone format, same username)
+ends up as several leads. Each lead stores normalized blocking keys
+(phone_key, username_key, name_key, all indexed) and candidates are only
+compared within a block of leads sharing a key:
+
+  * incremental: leads of a new LeadBatch against existing leads with the
+    same keys (indexed IN lookups),
+  * full: the database groups each key column (GROUP BY ... HAVING
+    COUNT(*) > 1) and only those blocks are streamed back and compared.
+
+Matches are joined with union-find into merge groups. merge_group() keeps
+the oldest lead, fills its empty fields from the others and reparents their
+history onto it.
+"""
+import re
+from itertools import groupby
+from typing import List, Optional
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from .database import Lead, LEAD_DEPENDENTS, SessionLocal
+
+KEY_COLUMNS = ("phone_key", "username_key", "name_key")
+# Blocks larger than this are junk keys (placeholder phones, very common names) and are skipped
+MAX_BLOCK_SIZE = 200
+CHUNK_SIZE = 5000
+MERGE_FIELDS = (
+    "telegram_id", "phone", "full_name", "username", "bio", "manager_name", "owner_id",
+    "next_contact_date", "transaction_id", "assigned_at", "batch_id",
+)
+NEW_STAGES = ("Новый", "Первый контакт")
+
+_NON_DIGITS = re.compile(r"\D")
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+_ROW_COLUMNS = (Lead.id, Lead.telegram_id, Lead.phone_key, Lead.username_key, Lead.name_key, Lead.bio)
+
+
+def normalize_phone(phone) -> Optional[str]:
+    """Digits only, Russian numbers in 7XXXXXXXXXX form."""
+    if not phone:
+        return None
+    digits = _NON_DIGITS.sub("", str(phone))
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    elif len(digits) == 10 and digits.startswith("9"):
+        digits = "7" + digits
+    return digits if len(digits) >= 7 else None
+
+
+def normalize_username(username) -> Optional[str]:
+    if not username:
+        return None
+    value = str(username).strip().lstrip("@").lower()
+    return value or None
+
+
+def normalize_name(full_name) -> Optional[str]:
+    """Lowercase, ё -> е, punctuation dropped, tokens sorted ("Иванов Пётр" == "петр иванов")."""
+    if not full_name:
+        return None
+    value = _NON_WORD.sub(" ", str(full_name).lower().replace("ё", "е"))
+    return " ".join(sorted(value.split())) or None
+
+
+def _normalize_bio(bio) -> Optional[str]:
+    if not bio:
+        return None
+    return _SPACES.sub(" ", str(bio).strip().lower()) or None
+
+
+def lead_keys(phone=None, username=None, full_name=None) -> dict:
+    """Blocking key columns for a lead."""
+    return {
+        "phone_key": normalize_phone(phone),
+        "username_key": normalize_username(username),
+        "name_key": normalize_name(full_name),
+    }
+
+
+def _conflict(a, b, field) -> bool:
+    left, right = getattr(a, field), getattr(b, field)
+    return bool(left and right and left != right)
+
+
+def is_duplicate(kind: str, a, b) -> bool:
+    """Decide whether two leads sharing the `kind` key are the same person."""
+    if _conflict(a, b, "telegram_id"):
+        return False
+    if kind == "username_key":
+        return True
+    if kind == "phone_key":
+        return not _conflict(a, b, "username_key")
+    # A shared name is weak evidence: also require the same profile description
+    if _conflict(a, b, "phone_key") or _conflict(a, b, "username_key"):
+        return False
+    bio = _normalize_bio(a.bio)
+    return bool(bio) and bio == _normalize_bio(b.bio)
+
+
+class _DisjointSet:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while x != root:
+            parent[x], x = root, parent.get(x, x)
+        return root
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            if rb < ra:
+                ra, rb = rb, ra
+            self.parent[rb] = ra
+            self.parent.setdefault(ra, ra)
+
+    def groups(self) -> List[List[int]]:
+        members = {}
+        for x in list(self.parent):
+            members.setdefault(self.find(x), []).append(x)
+        return sorted(sorted(g) for g in members.values() if len(g) > 1)
+
+
+def _link_block(ds: _DisjointSet, kind: str, block, anchors=None):
+    if len(block) < 2 or len(block) > MAX_BLOCK_SIZE:
+        return
+    for i, a in enumerate(block):
+        for b in block[i + 1:]:
+            if anchors is not None and a.id not in anchors and b.id not in anchors:
+                continue
+            if is_duplicate(kind, a, b):
+                ds.union(a.id, b.id)
+
+
+def backfill_keys(db: Session, job=None, chunk_size: int = CHUNK_SIZE) -> int:
+    """Compute blocking keys for leads that don't have them yet, in committed chunks."""
+    missing = or_(
+        Lead.phone_key.is_(None) & Lead.phone.isnot(None),
+        Lead.username_key.is_(None) & Lead.username.isnot(None),
+        Lead.name_key.is_(None) & Lead.full_name.isnot(None),
+    )
+    last_id = 0
+    processed = 0
+    while True:
+        rows = db.execute(
+            select(Lead.id, Lead.phone, Lead.username, Lead.full_name)
+            .where(Lead.id > last_id, missing)
+            .order_by(Lead.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        db.execute(update(Lead), [{"id": r.id, **lead_keys(r.phone, r.username, r.full_name)} for r in rows])
+        db.commit()
+        processed += len(rows)
+        last_id = rows[-1].id
+        if job:
+            job.update(message=f"Computed keys for {processed} leads")
+    return processed
+
+
+def find_duplicate_groups(db: Session, job=None) -> List[List[int]]:
+    """Full scan: merge groups over the whole leads table."""
+    ds = _DisjointSet()
+    for n, kind in enumerate(KEY_COLUMNS):
+        column = getattr(Lead, kind)
+        duplicated_keys = select(column).where(column.isnot(None)).group_by(column).having(func.count() > 1)
+        rows = db.execute(
+            select(*_ROW_COLUMNS)
+            .where(column.in_(duplicated_keys))
+            .order_by(column, Lead.id)
+            .execution_options(yield_per=CHUNK_SIZE)
+        )
+        for _, block in groupby(rows, key=lambda r: getattr(r, kind)):
+            _link_block(ds, kind, list(block))
+        if job:
+            job.update(progress=n + 1, total=len(KEY_COLUMNS), message=f"Compared {kind} blocks")
+    return ds.groups()
+
+
+def find_batch_duplicate_groups(db: Session, batch_id: int) -> List[List[int]]:
+    """Incremental: merge groups involving at least one lead of the given batch."""
+    new_rows = db.execute(select(*_ROW_COLUMNS).where(Lead.batch_id == batch_id)).all()
+    anchors = {r.id for r in new_rows}
+    rows = {r.id: r for r in new_rows}
+    for kind in KEY_COLUMNS:
+        column = getattr(Lead, kind)
+        keys = sorted({getattr(r, kind) for r in new_rows if getattr(r, kind)})
+        for i in range(0, len(keys), 500):
+            for r in db.execute(select(*_ROW_COLUMNS).where(column.in_(keys[i:i + 500]))):
+                rows[r.id] = r
+
+    ds = _DisjointSet()
+    for kind in KEY_COLUMNS:
+        blocks = {}
+        for r in rows.values():
+            key = getattr(r, kind)
+            if key:
+                blocks.setdefault(key, []).append(r)
+        for block in blocks.values():
+            _link_block(ds, kind, block, anchors)
+    return ds.groups()
+
+
+def merge_group(db: Session, lead_ids: List[int]) -> int:
+    """Merge leads into the oldest one. Returns the surviving lead ID; caller commits."""
+    leads = db.query(Lead).filter(Lead.id.in_(lead_ids)).order_by(Lead.id).all()
+    if len(leads) < 2:
+        raise ValueError("Need at least two existing leads to merge")
+    survivor, others = leads[0], leads[1:]
+    other_ids = [l.id for l in others]
+
+    values = {}
+    for field in MERGE_FIELDS:
+        if getattr(survivor, field) is None:
+            values[field] = next((getattr(l, field) for l in others if getattr(l, field) is not None), None)
+    if survivor.stage in NEW_STAGES:
+        values["stage"] = next((l.stage for l in others if l.stage not in NEW_STAGES), survivor.stage)
+    values["is_archived"] = all(l.is_archived for l in leads)
+
+    for model in LEAD_DEPENDENTS:
+        db.execute(
+            update(model).where(model.lead_id.in_(other_ids)).values(lead_id=survivor.id)
+            .execution_options(synchronize_session=False)
+        )
+    # Delete first: telegram_id is unique and may move onto the survivor
+    for lead in others:
+        db.expunge(lead)
+    db.execute(delete(Lead).where(Lead.id.in_(other_ids)).execution_options(synchronize_session=False))
+    db.flush()
+
+    for field, value in values.items():
+        setattr(survivor, field, value)
+    for field, value in lead_keys(survivor.phone, survivor.username, survivor.full_name).items():
+        setattr(survivor, field, value)
+    db.flush()
+    return survivor.id
+
+
+def scan_job(job) -> dict:
+    """Background job: backfill keys, then a full duplicate scan."""
+    db = SessionLocal()
+    try:
+        backfilled = backfill_keys(db, job)
+        groups = find_duplicate_groups(db, job)
+        return {"backfilled": backfilled, "group_count": len(groups), "groups": groups}
+    finally:
+        db.close()
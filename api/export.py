@@ -0,0 +1,202 @@
+"""
+Streaming lead export (CSV and XLSX).
+
+Rows come from a server-side cursor (stream_results + yield_per: a named
+cursor on PostgreSQL, plain incremental fetches on SQLite) and are encoded
+a chunk at a time, so memory stays flat and the first bytes go out as soon
+as the first chunk is fetched, however large the export is.
+
+The first columns are exactly the ones /api/import reads (IMPORT_COLUMNS),
+with the same headers, so an export can be uploaded again as is. The
+remaining columns are informational and import ignores them.
+
+XLSX is written as a minimal SpreadsheetML package into a zip that is
+itself streamed: zipfile writes to an unseekable sink using data
+descriptors, and the sheet XML is produced row by row with inline strings.
+Control characters XML can't carry are dropped from XLSX cells (CSV keeps
+them), as openpyxl does.
+openpyxl's write-only mode also keeps memory flat, but it can only save the
+finished workbook, so nothing would reach the client until the last row.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import datetime
+from typing import Iterator
+from xml.sax.saxutils import escape
+
+from sqlalchemy import select
+
+from .database import Lead, ArchivedLead, LeadBatch, SessionLocal
+
+# Lead field -> header, in the member-export layout /api/import expects
+IMPORT_COLUMNS = {
+    "telegram_id": "ID",
+    "phone": "Номер телефона",
+    "full_name": "Полное имя",
+    "username": "Юзернейм",
+    "bio": "Описание профиля",
+}
+EXTRA_COLUMNS = {
+    "stage": "Этап",
+    "manager_name": "Менеджер",
+    "created_at": "Дата создания",
+    "updated_at": "Дата обновления",
+    "next_contact_date": "Следующий контакт",
+    "is_archived": "В архиве",
+    "batch_name": "Партия",
+}
+HEADERS = list(IMPORT_COLUMNS.values()) + list(EXTRA_COLUMNS.values())
+CHUNK_ROWS = 1000
+
+# Control characters XML 1.0 forbids (openpyxl's ILLEGAL_CHARACTERS_RE); one would make the sheet unreadable
+_ILLEGAL_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def lead_rows(db, model, filters) -> Iterator[tuple]:
+    """Export rows for one lead table, in ID order, through a server-side cursor."""
+    fields = [getattr(model, name) for name in IMPORT_COLUMNS] + [
+        getattr(model, name) for name in EXTRA_COLUMNS if name != "batch_name"
+    ]
+    stmt = (
+        select(*fields, LeadBatch.name)
+        .outerjoin(LeadBatch, LeadBatch.id == model.batch_id)
+        .where(*filters(model))
+        .order_by(model.id)
+        .execution_options(stream_results=True, yield_per=CHUNK_ROWS)
+    )
+    yield from db.execute(stmt)
+
+
+def export_rows(filters, include_archived: bool = False, session_factory=SessionLocal) -> Iterator[tuple]:
+    """Rows from the hot table, then the cold tier when archived leads are included."""
+    db = session_factory()
+    try:
+        yield from lead_rows(db, Lead, filters)
+        if include_archived:
+            yield from lead_rows(db, ArchivedLead, filters)
+    finally:
+        db.close()
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "Да" if value else "Нет"
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return str(value)
+
+
+def stream_csv(rows: Iterator[tuple]) -> Iterator[bytes]:
+    """UTF-8 CSV with a BOM (so Excel detects the encoding), flushed every CHUNK_ROWS rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write("\ufeff")
+    writer.writerow(HEADERS)
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_text(v) for v in row])
+        if i % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# --- XLSX ---
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Leads" sheetId="1" r:id="rId1"/></sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+class _Sink:
+    """Unseekable write target; the generator drains what zipfile wrote so far."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self.parts = b"".join(self.parts), []
+        return data
+
+
+def _cell(value) -> str:
+    # Numbers stay numeric (telegram IDs are read back as numbers), everything else is an inline string
+    if isinstance(value, int) and not isinstance(value, bool):
+        return f'<c t="n"><v>{value}</v></c>'
+    text = _ILLEGAL_XML.sub("", _text(value))
+    if not text:
+        return "<c/>"
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _row(values) -> str:
+    return "<row>" + "".join(_cell(v) for v in values) + "</row>"
+
+
+def stream_xlsx(rows: Iterator[tuple]) -> Iterator[bytes]:
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        package.writestr("_rels/.rels", _ROOT_RELS)
+        package.writestr("xl/workbook.xml", _WORKBOOK)
+        package.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        with package.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            chunk = [_SHEET_START, _row(HEADERS)]
+            for i, row in enumerate(rows, 1):
+                chunk.append(_row(row))
+                if i % CHUNK_ROWS == 0:
+                    sheet.write("".join(chunk).encode("utf-8"))
+                    chunk = []
+                    data = sink.drain()
+                    if data:
+                        yield data
+            chunk.append(_SHEET_END)
+            sheet.write("".join(chunk).encode("utf-8"))
+    yield sink.drain()
+
+
+def filename(fmt: str) -> str:
+    return f"leads_{datetime.now().strftime('%Y%m%d_%H%M')}.{fmt}"
@@ -0,0 +1,551 @@
+"""
+Import file readers and row normalization.
+
+Every format is read as a sequence of DataFrame chunks and goes through the
+same mapping detection (api/preview.py), normalization and dedupe keys, so
+the import endpoint does not care where rows came from:
+
+  * Excel: pd.read_excel, one frame. It is by far the slowest to parse.
+  * CSV: pd.read_csv in CSV_CHUNK_ROWS chunks with every column read as
+    text (phones and IDs stay exact). The encoding is detected from the
+    first bytes: UTF-8 with or without BOM, then cp1251, the usual encoding
+    for Cyrillic exports from Windows tools. The delimiter is sniffed
+    among , ; and tab.
+  * Parquet: pyarrow reads one row group at a time (iter_batches). pyarrow
+    is imported only when a Parquet file arrives.
+
+The format comes from the file extension unless the caller names it.
+read_rows() normalizes one frame at a time (the mapping is fixed from the
+first), and a single upload is written as it is read, so memory is bounded
+by a frame rather than by the file. parse_rows() is the same as one list.
+
+Multi-source imports (several files, every sheet of a workbook) parse each
+source in a process pool and feed the normalized rows to a single writer in
+the calling thread. The writer creates one LeadBatch per source, skips
+telegram IDs already in the database or in an earlier source, and inserts
+with executemany. Results are consumed in source order, so which batch a
+repeated lead lands in does not depend on which worker finished first.
+Workers are spawned rather than forked: the API process has threads and
+open database connections that a fork would copy. The pool is created on
+first use and reused; IMPORT_WORKERS caps its size (default: CPU count).
+
+Imports are idempotent per source. LeadBatch.content_hash is the sha256 of
+the upload (qualified by sheet and explicit mapping), so uploading the same
+file again returns the existing batch without parsing it. Rows are written
+in IMPORT_CHUNK_ROWS chunks, each committed together with the batch's
+processed_rows offset. A batch left in "processing" (the client timed out
+and the worker died) or "failed" resumes from that offset on the next
+upload of the same file. A source being imported right now is claimed in
+the database (state "processing", claimed_at renewed with every chunk), so
+a concurrent upload of it gets an error from any worker. A claim older than
+IMPORT_CLAIM_STALE_SECONDS is taken over, and the stalled import stops at
+its next chunk.
+"""
+import csv
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from itertools import chain
+from multiprocessing import get_context
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import pandas as pd
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from . import batch_metrics, dedupe, preview, repository
+from .database import LeadBatch, SessionLocal
+from .logs import get_logger
+
+logger = get_logger(__name__)
+
+FORMATS = ("xlsx", "csv", "parquet")
+CSV_CHUNK_ROWS = 50000
+PARQUET_BATCH_ROWS = 65536
+_EXTENSIONS = {
+    "csv": "csv", "tsv": "csv", "txt": "csv",
+    "parquet": "parquet", "pq": "parquet",
+    "xlsx": "xlsx", "xlsm": "xlsx", "xls": "xlsx",
+}
+
+
+class UnsupportedFormatError(ValueError):
+    pass
+
+
+def detect_format(filename: Optional[str], requested: Optional[str] = None) -> str:
+    if requested:
+        if requested not in FORMATS:
+            raise UnsupportedFormatError(f"Unknown format {requested}; expected one of {', '.join(FORMATS)}")
+        return requested
+    extension = (filename or "").rsplit(".", 1)[-1].lower() if "." in (filename or "") else ""
+    return _EXTENSIONS.get(extension, "xlsx")
+
+
+def detect_encoding(head: bytes) -> str:
+    if head.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
+    try:
+        # A multi-byte sequence cut at the end of the sample is not an error
+        head.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        if e.start >= len(head) - 3:
+            return "utf-8"
+    return "cp1251"
+
+
+def _sniff_delimiter(text: str) -> str:
+    try:
+        return csv.Sniffer().sniff(text, delimiters=",;\t").delimiter
+    except csv.Error:
+        return ","
+
+
+def _csv_frames(fileobj, encoding: Optional[str] = None, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    head = fileobj.read(65536)
+    fileobj.seek(0)
+    encoding = encoding or detect_encoding(head)
+    delimiter = _sniff_delimiter(head.decode(encoding, errors="ignore"))
+    yield from pd.read_csv(fileobj, encoding=encoding, sep=delimiter, dtype=str, chunksize=chunk_rows)
+
+
+def _parquet_frames(fileobj, batch_rows: int = PARQUET_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise UnsupportedFormatError("Parquet import needs pyarrow (pip install pyarrow)")
+    parquet = pq.ParquetFile(fileobj)
+    for batch in parquet.iter_batches(batch_size=batch_rows):
+        yield batch.to_pandas()
+
+
+def read_frames(fileobj, fmt: str, encoding: Optional[str] = None, sheet: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """DataFrame chunks of an import file (of one sheet for Excel; the first by default)."""
+    if fmt == "csv":
+        return _csv_frames(fileobj, encoding)
+    if fmt == "parquet":
+        return _parquet_frames(fileobj)
+    return iter([pd.read_excel(fileobj, sheet_name=sheet if sheet is not None else 0)])
+
+
+def sheet_names(path: str) -> List[str]:
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def read_sample(fileobj, fmt: str, sample_rows: int, encoding: Optional[str] = None) -> dict:
+    """CSV/Parquet counterpart of preview.read_sample: header and the first sample_rows rows."""
+    if fmt == "parquet":
+        frames = _parquet_frames(fileobj, batch_rows=sample_rows)
+        total = None
+        try:
+            import pyarrow.parquet as pq
+            fileobj.seek(0)
+            total = pq.ParquetFile(fileobj).metadata.num_rows
+        except ImportError:
+            pass
+        fileobj.seek(0)
+    else:
+        frames, total = _csv_frames(fileobj, encoding, chunk_rows=sample_rows), None
+    frame = next(iter(frames), pd.DataFrame())
+    frame = frame.head(sample_rows).astype(object).where(frame.notna(), None)
+    headers = list(frame.columns)
+    return {
+        "sheets": [{"name": fmt, "rows": total, "columns": len(headers)}],
+        "sheet": fmt,
+        "headers": headers,
+        "rows": [list(row) for row in frame.itertuples(index=False)],
+    }
+
+
+# --- Normalization ---
+
+def parse_telegram_id(raw_id):
+    """Handle float/int ID correctly."""
+    if pd.notna(raw_id):
+        try:
+            return int(float(raw_id))
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def parse_phone(phone_val):
+    phone = None
+    if pd.notna(phone_val):
+        # Handle float phone numbers (e.g. 79991234567.0 -> "79991234567")
+        try:
+            # Clean up string first if it's a string
+            s_val = str(phone_val).strip()
+
+            # If it looks like a float/int
+            if s_val.replace('.','',1).isdigit():
+                if isinstance(phone_val, float) or '.' in s_val:
+                    phone = str(int(float(s_val)))
+                else:
+                    phone = s_val
+            else:
+                # Just keep as string if it's text (e.g. "+7...")
+                phone = s_val
+
+            # Remove .0 suffix if it persists
+            if phone and phone.endswith(".0"):
+                phone = phone[:-2]
+        except (TypeError, ValueError):
+            phone = None # Ignore invalid phones
+    return str(phone) if phone else None
+
+
+def _text(value):
+    return str(value) if pd.notna(value) else None
+
+
+def import_columns(df: pd.DataFrame, mapping: Optional[dict]) -> dict:
+    """{field: header} from an explicit mapping, or detected the same way the preview does."""
+    if mapping is None:
+        sample = df.head(preview.DEFAULT_SAMPLE_ROWS)
+        detected = preview.detect_mapping(
+            list(df.columns), {i: sample[c].dropna().tolist() for i, c in enumerate(df.columns)}
+        )
+        mapping = {field: m["column"] for field, m in detected.items()}
+    unknown = [c for c in mapping.values() if c is not None and c not in df.columns]
+    if unknown:
+        raise ValueError(f"Columns not in file: {', '.join(map(str, unknown))}")
+    if not any(mapping.get(f) for f in preview.IDENTIFYING_FIELDS):
+        raise ValueError("No ID, phone, name or username column found; check the preview and pass a mapping")
+    return {field: mapping.get(field) for field in preview.FIELDS}
+
+
+def normalize_frame(df: pd.DataFrame, columns: dict) -> List[dict]:
+    """Lead field dicts (with dedupe keys) for one chunk, column-wise instead of iterrows()."""
+    def values(field, parse):
+        header = columns[field]
+        return [parse(v) for v in df[header].tolist()] if header is not None else [None] * len(df)
+
+    rows = []
+    for telegram_id, phone, full_name, username, bio in zip(
+        values("telegram_id", parse_telegram_id), values("phone", parse_phone),
+        values("full_name", _text), values("username", _text), values("bio", _text),
+    ):
+        lead = {"telegram_id": telegram_id, "phone": phone, "full_name": full_name, "username": username, "bio": bio}
+        lead.update(dedupe.lead_keys(phone, username, full_name))
+        rows.append(lead)
+    return rows
+
+
+def read_rows(fileobj, fmt: str = "xlsx", mapping: Optional[dict] = None, encoding: Optional[str] = None,
+              sheet: Optional[str] = None, skip_rows: int = 0) -> Iterator[List[dict]]:
+    """Normalized lead fields of an import file, one frame at a time. The mapping is fixed from the first frame.
+
+    Rows before skip_rows (a resumed import's offset) are not normalized; whole frames before it are passed over.
+    """
+    columns, position = None, 0
+    for frame in read_frames(fileobj, fmt, encoding, sheet):
+        if columns is None:
+            columns = import_columns(frame, mapping)
+        start, position = position, position + len(frame)
+        if position <= skip_rows:
+            continue
+        if start < skip_rows:
+            frame = frame.iloc[skip_rows - start:]
+        yield normalize_frame(frame, columns)
+    if columns is None:
+        raise ValueError("File has no rows")
+
+
+def parse_rows(fileobj, fmt: str = "xlsx", mapping: Optional[dict] = None, encoding: Optional[str] = None,
+               sheet: Optional[str] = None) -> List[dict]:
+    """read_rows() as one list, for callers that want the whole file (the console, benchmarks, pool workers)."""
+    return [row for chunk in read_rows(fileobj, fmt, mapping, encoding, sheet) for row in chunk]
+
+
+# --- Multi-source import ---
+
+IMPORT_CHUNK_ROWS = 5000
+IMPORT_STAGE = "Новый"
+_pool = None
+_pool_lock = threading.Lock()
+CLAIM_STALE_SECONDS = int(os.getenv("IMPORT_CLAIM_STALE_SECONDS", "900"))
+
+
+class ImportInProgressError(Exception):
+    pass
+
+
+def _workers() -> int:
+    return max(1, int(os.getenv("IMPORT_WORKERS") or os.cpu_count() or 1))
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=_workers(), mp_context=get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a pool whose worker died so the next import starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def sources(files: List[dict], all_sheets: bool = True) -> List[dict]:
+    """One source per file, or per sheet of each workbook when all_sheets is set.
+
+    files are {"path", "file_name", "format", "digest"} dicts; formats are resolved
+    already and a missing digest is computed here.
+    """
+    result = []
+    for f in files:
+        if not f.get("digest"):
+            with open(f["path"], "rb") as fileobj:
+                f = {**f, "digest": file_digest(fileobj)}
+        sheets = sheet_names(f["path"]) if f["format"] == "xlsx" and all_sheets else [None]
+        for sheet in sheets:
+            result.append({**f, "sheet": sheet if len(sheets) > 1 else None})
+    return result
+
+
+def parse_source(source: dict, mapping: Optional[dict] = None, encoding: Optional[str] = None) -> List[dict]:
+    """Pool worker: normalized rows of one file or sheet."""
+    with open(source["path"], "rb") as fileobj:
+        return parse_rows(fileobj, source["format"], mapping, encoding, source.get("sheet"))
+
+
+def stream_source(source: dict, mapping: Optional[dict] = None, encoding: Optional[str] = None,
+                  skip_rows: int = 0) -> Iterator[List[dict]]:
+    """read_rows() of one file or sheet, for sources written without the pool."""
+    with open(source["path"], "rb") as fileobj:
+        yield from read_rows(fileobj, source["format"], mapping, encoding, source.get("sheet"), skip_rows)
+
+
+def file_digest(fileobj) -> str:
+    """sha256 of an upload, streamed; the file is rewound afterwards."""
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(1 << 20), b""):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def source_key(digest: str, sheet: Optional[str] = None, mapping: Optional[dict] = None) -> str:
+    """LeadBatch.content_hash of a source: the file digest, qualified by sheet and explicit mapping."""
+    if sheet is None and mapping is None:
+        return digest
+    qualified = json.dumps([digest, sheet, mapping], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(qualified.encode("utf-8")).hexdigest()
+
+
+def find_batch(db, key: str) -> Optional[LeadBatch]:
+    return db.execute(select(LeadBatch).where(LeadBatch.content_hash == key)).scalar_one_or_none()
+
+
+def _claim(db, batch_id: int) -> Optional[datetime]:
+    """Mark an unfinished batch as processing unless a live import holds it. Commits; returns the claim or None."""
+    now = datetime.now()
+    claimed = db.execute(
+        update(LeadBatch)
+        .where(LeadBatch.id == batch_id, LeadBatch.state != "done", or_(
+            LeadBatch.state != "processing",
+            LeadBatch.claimed_at.is_(None),
+            LeadBatch.claimed_at < now - timedelta(seconds=CLAIM_STALE_SECONDS),
+        ))
+        .values(state="processing", claimed_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return now if claimed == 1 else None
+
+
+def _batched(chunks: Iterable[List[dict]], size: int) -> Iterator[List[dict]]:
+    """Re-slice a stream of row lists into lists of `size`."""
+    buffer = []
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= size:
+            yield buffer[:size]
+            buffer = buffer[size:]
+    if buffer:
+        yield buffer
+
+
+def _write_chunks(db, batch: LeadBatch, chunks: Iterable[List[dict]], seen_ids: set, claimed_at: datetime) -> tuple:
+    """Insert rows streamed from batch.processed_rows on, committing the offset with every chunk.
+
+    Every chunk also renews the claim, provided it is still ours; a chunk of
+    an import that was taken over is rolled back. Returns (inserted, rows written).
+    """
+    inserted = written = 0
+    offset = batch.processed_rows or 0
+    for chunk in _batched(chunks, IMPORT_CHUNK_ROWS):
+        fresh = repository.insert_leads(db, chunk, IMPORT_STAGE, batch.id, seen_ids)
+        renewed = datetime.now()
+        if not db.execute(
+            update(LeadBatch).where(LeadBatch.id == batch.id, LeadBatch.claimed_at == claimed_at)
+            .values(claimed_at=renewed).execution_options(synchronize_session=False)
+        ).rowcount:
+            db.rollback()
+            raise ImportInProgressError("This file is already being imported")
+        claimed_at = renewed
+        offset += len(chunk)
+        batch.count = (batch.count or 0) + fresh
+        batch.processed_rows = offset
+        db.commit()
+        inserted += fresh
+        written += len(chunk)
+    return inserted, written
+
+
+def _fail(db, batch: LeadBatch) -> None:
+    db.rollback()
+    batch.state = "failed"
+    batch.claimed_at = None
+    db.commit()
+
+
+def import_source(db, key: str, load: Callable[[int], Iterable[List[dict]]], name: str, file_name: Optional[str],
+                  seen_ids: Optional[set] = None) -> dict:
+    """Import one source as its own batch, at most once per content hash.
+
+    load(skip_rows) returns the source's rows from skip_rows on as a stream
+    of lists (read_rows()), which is written as it is read. A finished batch
+    with the same hash is returned as is, without calling load(). An
+    unfinished one (timed out, crashed, failed) is resumed from its committed
+    offset, without normalizing the rows before it. seen_ids carries telegram
+    IDs across sources.
+    """
+    seen_ids = set() if seen_ids is None else seen_ids
+    batch = find_batch(db, key)
+    if batch is not None and batch.state == "done":
+        return {"batch_id": batch.id, "imported_count": batch.count, "already_imported": True}
+
+    if batch is None:
+        # Read the first chunk before creating the batch, so a file that can't be read or mapped leaves nothing behind
+        chunks = iter(load(0))
+        chunks = chain([next(chunks, [])], chunks)
+        claimed_at = datetime.now()
+        batch = LeadBatch(name=name, file_name=file_name, imported_at=claimed_at, count=0,
+                          content_hash=key, state="processing", processed_rows=0, claimed_at=claimed_at)
+        db.add(batch)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another process created it between our lookup and insert
+            db.rollback()
+            raise ImportInProgressError("This file is already being imported")
+    else:
+        claimed_at = _claim(db, batch.id)
+        db.refresh(batch)
+        if claimed_at is None:
+            if batch.state == "done":
+                return {"batch_id": batch.id, "imported_count": batch.count, "already_imported": True}
+            raise ImportInProgressError("This file is already being imported")
+        chunks = None
+    resumed_from = batch.processed_rows or 0
+    try:
+        if chunks is None:
+            chunks = load(resumed_from)
+        inserted, written = _write_chunks(db, batch, chunks, seen_ids, claimed_at)
+    except ImportInProgressError:
+        raise
+    except Exception:
+        _fail(db, batch)
+        raise
+    batch.state = "done"
+    batch.claimed_at = None
+    db.commit()
+
+    batch_metrics.refresh(db, batch.id)
+    db.commit()
+    groups = dedupe.find_batch_duplicate_groups(db, batch.id)
+    return {
+        "batch_id": batch.id,
+        "imported_count": batch.count,
+        "inserted": inserted,
+        "skipped": written - inserted,
+        "resumed_from": resumed_from or None,
+        "already_imported": False,
+        "duplicate_groups": len(groups),
+    }
+
+
+def import_upload(fileobj, file_name: Optional[str], fmt: str, mapping: Optional[dict] = None,
+                  encoding: Optional[str] = None, batch_name: Optional[str] = None) -> dict:
+    """/api/import: hash, parse and write one upload on a sync session (run it in a thread)."""
+    key = source_key(file_digest(fileobj), None, mapping)
+    db = SessionLocal()
+    try:
+        return import_source(
+            db, key, lambda skip_rows: read_rows(fileobj, fmt, mapping, encoding, skip_rows=skip_rows),
+            batch_name or f"Импорт {datetime.now().strftime('%Y-%m-%d %H:%M')}", file_name,
+        )
+    finally:
+        db.close()
+
+
+def _batch_name(base: str, source: dict) -> str:
+    name = f"{base}: {source['file_name']}"
+    return f"{name} [{source['sheet']}]" if source.get("sheet") else name
+
+
+def import_many_job(job, files: List[dict], all_sheets: bool = True, batch_name: Optional[str] = None,
+                    mapping: Optional[dict] = None, encoding: Optional[str] = None, cleanup: Optional[str] = None) -> dict:
+    """Parse every pending source in the process pool and write them one batch each, in source order."""
+    db = SessionLocal()
+    try:
+        todo = sources(files, all_sheets)
+        keys = [source_key(source["digest"], source.get("sheet"), mapping) for source in todo]
+        finished = {key for key in keys if (batch := find_batch(db, key)) is not None and batch.state == "done"}
+        job.update(progress=0, total=len(todo))
+        base = batch_name or f"Импорт {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+
+        # One loader per source; calling it returns the rows or raises that source's parse error.
+        # Sources imported before are never parsed. Pool workers hand back a whole source (results
+        # cross a process boundary); without the pool a source is streamed like a single upload.
+        pending = [source for source, key in zip(todo, keys) if key not in finished]
+        pool = _executor() if len(pending) > 1 and _workers() > 1 else None
+        loaders = [
+            None if key in finished
+            else (lambda skip_rows, future=pool.submit(parse_source, source, mapping, encoding): [future.result()[skip_rows:]])
+            if pool else (lambda skip_rows, source=source: stream_source(source, mapping, encoding, skip_rows))
+            for source, key in zip(todo, keys)
+        ]
+
+        results, seen_ids = [], set()
+        for i, (source, key, load) in enumerate(zip(todo, keys, loaders), start=1):
+            entry = {"file_name": source["file_name"], "sheet": source.get("sheet")}
+            try:
+                entry.update(import_source(db, key, load, _batch_name(base, source), source["file_name"], seen_ids))
+            except Exception as e:
+                db.rollback()
+                if isinstance(e, BrokenProcessPool):
+                    _discard_pool(pool)
+                logger.warning("import source failed", extra={"file_name": source["file_name"], "sheet": source.get("sheet"), "error": str(e)})
+                entry["error"] = str(e)
+            results.append(entry)
+            job.update(progress=i, message=_batch_name(base, source))
+        return {
+            "sources": results,
+            "imported_count": sum(r.get("imported_count", 0) for r in results if not r.get("already_imported")),
+            "already_imported": sum(1 for r in results if r.get("already_imported")),
+            "failed": sum(1 for r in results if "error" in r),
+        }
+    finally:
+        db.close()
+        if cleanup:
+            shutil.rmtree(cleanup, ignore_errors=True)
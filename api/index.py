@@ -1,27 +1,45 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status, Request
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status, Request, BackgroundTasks, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select, text, union_all
 from typing import List, Optional
-from datetime import datetime, timedelta
-import pandas as pd
-import io
+from datetime import date, datetime, timedelta
+import json
 import os
+import shutil
+import tempfile
 import uuid
 import re
 from telegram import Update, Bot, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, ContextTypes
 
-from .database import get_db, init_db, Lead, Interaction, User, LeadTransaction, LeadBatch, SessionLocal
+from . import allocation, archive, batch_metrics, board, database, dedupe, export, importing, jobs, ledger, listing, metrics, ownership, preview, purge, replicas, repository, rollups, search, slowlog, transitions
+from .logs import get_logger
+from .responses import CompressionMiddleware, FastJSONResponse
+from .database import (
+    get_db, get_async_db, init_db, Lead, Interaction, User, LeadTransaction, LeadBatch,
+    ArchivedLead, ArchivedInteraction, BatchMetrics,
+    SessionLocal, AsyncSessionLocal, get_pool_metrics
+)
 from .models import (
     LeadCreate, LeadResponse, InteractionCreate, StatsResponse, 
     UserCreate, UserResponse, Token, TransactionCreate, TransactionResponse,
-    ConnectTelegramResponse, LeadBatchCreate, LeadBatchResponse
+    ConnectTelegramResponse, LeadBatchCreate, LeadBatchResponse, JobResponse, InteractionResponse,
+    DuplicateGroupsResponse, MergeRequest, BoardResponse, BulkStageMove, BatchMetricsResponse, SearchResponse
+)
+from .replicas import get_read_db
+from .auth import (
+    verify_password, get_password_hash, create_access_token, get_current_user, get_current_user_async, get_current_admin,
+    ACCESS_TOKEN_EXPIRE_MINUTES, validate_password
 )
-from .auth import verify_password, get_password_hash, create_access_token, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES, validate_password
 
-app = FastAPI()
+logger = get_logger(__name__)
+
+app = FastAPI(default_response_class=FastJSONResponse)
 
 # Configure CORS - restrict to frontend URLs only
 allowed_origins = os.getenv("ALLOWED_ORIGINS", "localhost:3000,127.0.0.1:3000").split(",")
@@ -39,6 +57,11 @@ app.add_middleware(
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["Content-Type", "Authorization"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(replicas.ReadYourWritesMiddleware)
+# Outermost, so latency includes compression and CORS
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engines()
 
 # Telegram Bot Setup
 TG_TOKEN = os.getenv("TG_TOKEN")
@@ -80,13 +103,12 @@ def record_login_attempt(ip_address: str, success: bool = False) -> None:
 @app.on_event("startup")
 def on_startup():
     try:
-        print("[DEBUG] Application starting up...")
+        logger.info("application starting up")
         init_db()
-        print("[DEBUG] Database initialized")
         ensure_admin_exists()
-        print("[DEBUG] Startup complete")
-    except Exception as e:
-        print(f"[ERROR] Startup error: {e}")
+        logger.info("startup complete")
+    except Exception:
+        logger.exception("startup error")
 
 @app.get("/api/fix_schema")
 def fix_schema(db: Session = Depends(get_db)):
@@ -120,9 +142,10 @@ def migrate_schema():
     try:
         messages = []
 
-        # Create all tables if they don't exist
-        init_db()
+        # Create all tables if they don't exist, add columns/indexes introduced later
+        added = init_db()
         messages.append("Created/verified all tables")
+        messages.extend(f"Added {name}" for name in added)
 
         # For PostgreSQL, add missing columns manually (SQLAlchemy doesn't auto-migrate)
         db = SessionLocal()
@@ -160,6 +183,52 @@ def migrate_schema():
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/api/metrics")
+def prometheus_metrics(request: Request):
+    """Request latency, SQL counts and pool metrics in Prometheus text format.
+
+    Open unless METRICS_TOKEN is set, in which case scrapers send it as a bearer token.
+    """
+    token = os.getenv("METRICS_TOKEN")
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    pools = {"sync": get_pool_metrics()}
+    if database._async_engine is not None:
+        pools["async"] = get_pool_metrics(database._async_engine)
+    if replicas._engine is not None:
+        pools["replica"] = get_pool_metrics(replicas._engine)
+    return PlainTextResponse(metrics.render_prometheus(pools), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/admin/slow-queries")
+def get_slow_queries(limit: int = Query(50, ge=1, le=1000), current_user: User = Depends(get_current_admin)):
+    """Most recent slow statements with their plans (needs SLOW_QUERY_MS)."""
+    log = slowlog.recorder
+    if log is None:
+        return {"enabled": False, "threshold_ms": None, "recorded": 0, "queries": []}
+    return {
+        "enabled": True,
+        "threshold_ms": log.threshold * 1000,
+        "sample_rate": log.sample_rate,
+        "recorded": log.seen,
+        "queries": log.snapshot(limit),
+    }
+
+@app.delete("/api/admin/slow-queries")
+def clear_slow_queries(current_user: User = Depends(get_current_admin)):
+    if slowlog.recorder is not None:
+        slowlog.recorder.clear()
+    return {"status": "success"}
+
+@app.get("/api/db/pool")
+def db_pool_metrics(current_user: User = Depends(get_current_user)):
+    """Connection pool status, checkout wait times and connection counters."""
+    data = {"sync": get_pool_metrics()}
+    if database._async_engine is not None:
+        data["async"] = get_pool_metrics(database._async_engine)
+    if replicas._engine is not None:
+        data["replica"] = get_pool_metrics(replicas._engine)
+    return data
+
 def ensure_admin_exists():
     """Helper to ensure admin exists. Call on startup and if login fails."""
     try:
@@ -167,15 +236,11 @@ def ensure_admin_exists():
         # Use environment variable for admin password, or generate a secure default
         admin_password = os.getenv("ADMIN_PASSWORD", "Admin@2024Secure!Password")
 
-        # Debug logging
-        has_env_password = "ADMIN_PASSWORD" in os.environ
-        print(f"[DEBUG] ADMIN_PASSWORD env var present: {has_env_password}")
-        print(f"[DEBUG] Using {'custom' if has_env_password else 'default'} password")
+        logger.debug("ensuring admin user", extra={"custom_password": "ADMIN_PASSWORD" in os.environ})
 
         user = db.query(User).filter(User.username == "admin").first()
 
         if not user:
-            print("[DEBUG] Creating default admin user...")
             admin = User(
                 username="admin",
                 hashed_password=get_password_hash(admin_password),
@@ -184,24 +249,20 @@ def ensure_admin_exists():
             )
             db.add(admin)
             db.commit()
-            print("[DEBUG] Admin user created successfully")
+            logger.info("admin user created")
         else:
-            print("[DEBUG] Admin user exists, checking password...")
             # Check if password needs update
             if not verify_password(admin_password, user.hashed_password):
-                print("[DEBUG] Password mismatch - updating admin password from environment variable...")
                 user.hashed_password = get_password_hash(admin_password)
                 db.commit()
-                print("[DEBUG] Admin password updated successfully")
-            else:
-                print("[DEBUG] Admin password matches environment variable")
+                logger.info("admin password updated from environment")
 
         if admin_password == "Admin@2024Secure!Password":
-            print("WARNING: Using default admin password. Set ADMIN_PASSWORD environment variable in production!")
+            logger.warning("using default admin password; set ADMIN_PASSWORD in production")
 
         db.close()
-    except Exception as e:
-        print(f"Error ensuring admin exists: {e}")
+    except Exception:
+        logger.exception("error ensuring admin exists")
 
 # --- Auth Endpoints ---
 
@@ -209,10 +270,8 @@ def ensure_admin_exists():
 async def login_for_access_token(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    print(f"[DEBUG] Login attempt for username: {form_data.username}")
-
     # Get client IP address
     client_ip = request.client.host if request.client else "unknown"
 
@@ -223,18 +282,17 @@ async def login_for_access_token(
             detail=f"Too many login attempts. Please try again after {LOCKOUT_DURATION // 60} minutes.",
         )
 
-    user = db.query(User).filter(User.username == form_data.username).first()
-    print(f"[DEBUG] User found in database: {user is not None}")
+    result = await db.execute(select(User).where(User.username == form_data.username))
+    user = result.scalars().first()
 
     # Lazy admin creation: if admin not found, try to create him (handling Vercel cold starts)
     if not user and form_data.username == "admin":
-        print("[DEBUG] Admin not found, calling ensure_admin_exists...")
-        ensure_admin_exists()
-        user = db.query(User).filter(User.username == "admin").first()
-        print(f"[DEBUG] Admin user after ensure: {user is not None}")
+        await run_in_threadpool(ensure_admin_exists)
+        result = await db.execute(select(User).where(User.username == "admin"))
+        user = result.scalars().first()
 
     if not user:
-        print("[DEBUG] User not found after all attempts")
+        logger.info("login failed", extra={"username": form_data.username, "reason": "unknown user"})
         record_login_attempt(client_ip, success=False)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -242,10 +300,11 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    password_valid = verify_password(form_data.password, user.hashed_password)
-    print(f"[DEBUG] Password verification result: {password_valid}")
+    # bcrypt is CPU-bound; keep it off the event loop
+    password_valid = await run_in_threadpool(verify_password, form_data.password, user.hashed_password)
 
     if not password_valid:
+        logger.info("login failed", extra={"username": form_data.username, "reason": "bad password"})
         record_login_attempt(client_ip, success=False)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -254,7 +313,7 @@ async def login_for_access_token(
         )
 
     # Successful login - record attempt
-    print(f"[DEBUG] Login successful for user: {user.username}")
+    logger.debug("login succeeded", extra={"username": user.username})
     record_login_attempt(client_ip, success=True)
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -296,6 +355,27 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
 
 # --- Leads Endpoints ---
 
+def lead_scope(
+    scope: str = Query("mine", pattern="^(mine|all)$"),
+    owner_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user)
+) -> Optional[int]:
+    """Owner that lead queries are limited to, None for everyone (admins only). See api/ownership.py."""
+    try:
+        return ownership.resolve_scope(current_user, scope, owner_id)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+def owned_lead(lead, current_user: User):
+    """The lead, if the caller owns it or is an admin: 404 when missing, 403 otherwise. See api/ownership.py."""
+    try:
+        ownership.check_lead(current_user, lead)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    return lead
+
 @app.get("/api/leads", response_model=List[LeadResponse])
 def get_leads(
     skip: int = 0,
@@ -303,52 +383,146 @@ def get_leads(
     search: Optional[str] = None,
     stage: Optional[str] = None,
     include_archived: bool = False,
-    db: Session = Depends(get_db),
+    batch_id: Optional[int] = None,
+    owner: Optional[int] = Depends(lead_scope),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    query = db.query(Lead)
+    # Read-only list: plain rows straight to JSON, no ORM objects
+    stmt = listing.lead_select(Lead)
     
     # Filter out archived leads by default
     if not include_archived:
-        query = query.filter(Lead.is_archived == False)
+        stmt = stmt.filter(Lead.is_archived == False)
     
+    stmt = _filter_leads(stmt, Lead, search, stage, batch_id, owner)
+        
+    leads = listing.lead_dicts(db, stmt.offset(skip).limit(limit), Interaction)
+
+    # Leads compacted into the cold tier come after the hot ones
+    if include_archived and len(leads) < limit:
+        cold_skip = 0 if leads else max(0, skip - db.scalar(select(func.count()).select_from(stmt.subquery())))
+        cold_stmt = _filter_leads(listing.lead_select(ArchivedLead), ArchivedLead, search, stage, batch_id, owner)
+        leads += listing.lead_dicts(
+            db, cold_stmt.order_by(ArchivedLead.id).offset(cold_skip).limit(limit - len(leads)), ArchivedInteraction
+        )
+    return FastJSONResponse(leads)
+
+def _lead_conditions(model, search: Optional[str], stage: Optional[str], batch_id: Optional[int] = None,
+                     owner_id: Optional[int] = None):
+    conditions = ownership.conditions(model, owner_id)
     if search:
-        query = query.filter(
-            (Lead.full_name.contains(search)) | 
-            (Lead.phone.contains(search)) | 
-            (Lead.username.contains(search))
+        conditions.append(
+            (model.full_name.contains(search)) | 
+            (model.phone.contains(search)) | 
+            (model.username.contains(search))
         )
     
     if stage:
-        query = query.filter(Lead.stage == stage)
-        
-    leads = query.offset(skip).limit(limit).all()
-    return leads
+        conditions.append(model.stage == stage)
+    if batch_id is not None:
+        conditions.append(model.batch_id == batch_id)
+    return conditions
+
+def _filter_leads(query, model, search: Optional[str], stage: Optional[str], batch_id: Optional[int] = None,
+                  owner_id: Optional[int] = None):
+    return query.filter(*_lead_conditions(model, search, stage, batch_id, owner_id))
+
+@app.get("/api/leads/search", response_model=SearchResponse)
+def search_leads(
+    q: str = Query(..., min_length=1, max_length=200),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    owner: Optional[int] = Depends(lead_scope),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Leads whose bio or interaction notes match q, ranked, with highlighted snippets. See api/search.py."""
+    try:
+        return search.search(db, q, owner, skip, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except search.SearchUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 @app.get("/api/leads/count")
 def get_leads_count(
-    db: Session = Depends(get_db),
+    owner: Optional[int] = Depends(lead_scope),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Returns total count of non-archived leads (client leads)."""
+    """Returns total count of non-archived leads (client leads) in scope."""
     try:
-        count = db.query(Lead).filter(Lead.is_archived == False).count()
-        return {"count": count}
-    except Exception as e:
-        print(f"[DEBUG] Error counting leads: {e}")
+        return {"count": repository.count_leads(db, owner_id=owner)}
+    except Exception:
+        logger.exception("error counting leads")
         # If table doesn't exist or other error, return 0
         return {"count": 0}
 
+@app.get("/api/leads/export")
+def export_leads(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    search: Optional[str] = None,
+    stage: Optional[str] = None,
+    include_archived: bool = False,
+    batch_id: Optional[int] = None,
+    owner: Optional[int] = Depends(lead_scope),
+    current_user: User = Depends(get_current_user)
+):
+    """Stream the filtered leads as CSV or XLSX in the import column layout."""
+    def filters(model):
+        conditions = _lead_conditions(model, search, stage, batch_id, owner)
+        if model is Lead and not include_archived:
+            conditions.append(Lead.is_archived == False)
+        return conditions
+
+    rows = export.export_rows(filters, include_archived, replicas.session_factory(request.scope))
+    body = export.stream_xlsx(rows) if format == "xlsx" else export.stream_csv(rows)
+    return StreamingResponse(
+        body,
+        media_type=export.XLSX_MEDIA_TYPE if format == "xlsx" else export.CSV_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{export.filename(format)}"'},
+    )
+
+@app.get("/api/board", response_model=BoardResponse)
+def get_board(
+    per_column: int = Query(20, ge=1, le=500),
+    order: str = "updated_at",
+    stages: Optional[List[str]] = Query(None),
+    cursor: Optional[List[str]] = Query(None),
+    owner: Optional[int] = Depends(lead_scope),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Kanban columns: total per stage plus the first N cards. Pass column cursors to load more."""
+    if order not in board.ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of {', '.join(board.ORDERS)}")
+    if cursor:
+        try:
+            return board.more_cards(db, cursor, per_column, owner)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return board.board(db, per_column, order, stages, owner)
+
 @app.get("/api/leads/{lead_id}", response_model=LeadResponse)
 def get_lead_details(
     lead_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     lead = db.query(Lead).filter(Lead.id == lead_id).first()
     if not lead:
-        raise HTTPException(status_code=404, detail="Lead not found")
-    return lead
+        return owned_lead(db.get(ArchivedLead, lead_id), current_user)
+    owned_lead(lead, current_user)
+
+    # Older history may have been compacted into the cold tier
+    cold = archive.cold_interactions(db, lead_id)
+    if not cold:
+        return lead
+    response = LeadResponse.model_validate(lead)
+    response.interactions = [InteractionResponse.model_validate(i) for i in cold] + response.interactions
+    return response
 
 @app.post("/api/interactions")
 def add_interaction(
@@ -356,39 +530,42 @@ def add_interaction(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    print(f"[DEBUG] add_interaction called. Lead ID: {interaction.lead_id}, New Stage: {interaction.new_stage}")
+    db_lead = owned_lead(db.query(Lead).filter(Lead.id == interaction.lead_id).first(), current_user)
     
-    db_lead = db.query(Lead).filter(Lead.id == interaction.lead_id).first()
-    if not db_lead:
-        print(f"[DEBUG] Lead {interaction.lead_id} not found!")
-        raise HTTPException(status_code=404, detail="Lead not found")
-    
-    new_interaction = Interaction(
-        lead_id=interaction.lead_id,
-        contact_method=interaction.contact_method,
-        content=interaction.content
+    if interaction.new_stage and interaction.new_stage != db_lead.stage:
+        logger.debug("stage change", extra={"lead_id": db_lead.id, "from_stage": db_lead.stage, "to_stage": interaction.new_stage})
+    repository.record_interaction(
+        db, db_lead, interaction.contact_method, interaction.content,
+        interaction.new_stage, interaction.next_contact_date, current_user.id,
     )
-    db.add(new_interaction)
-    
-    if interaction.new_stage:
-        print(f"[DEBUG] Updating stage from '{db_lead.stage}' to '{interaction.new_stage}'")
-        db_lead.stage = interaction.new_stage
-    
-    if interaction.next_contact_date:
-        db_lead.next_contact_date = interaction.next_contact_date
-        
-    db_lead.updated_at = datetime.now()
     
     try:
         db.commit()
-        print("[DEBUG] Interaction saved and lead updated.")
     except Exception as e:
-        print(f"[ERROR] Failed to commit interaction: {e}")
+        logger.exception("failed to commit interaction", extra={"lead_id": interaction.lead_id})
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
         
     return {"status": "success"}
 
+@app.post("/api/leads/bulk/stage")
+def bulk_move_stage(
+    move: BulkStageMove,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Move many leads to one stage, recording a stage event and interaction for each."""
+    if not move.stage or not move.stage.strip():
+        raise HTTPException(status_code=400, detail="Stage is required")
+    try:
+        ownership.check_leads(db, current_user, move.lead_ids)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    moved = transitions.move_leads(db, move.lead_ids, move.stage.strip(), current_user.id)
+    batch_metrics.mark_stale(db, move.lead_ids)
+    db.commit()
+    return {"status": "success", "moved": moved}
+
 @app.post("/api/leads/{lead_id}/archive")
 def archive_lead(
     lead_id: int,
@@ -396,12 +573,11 @@ def archive_lead(
     current_user: User = Depends(get_current_user)
 ):
     """Archive a lead (soft delete)"""
-    lead = db.query(Lead).filter(Lead.id == lead_id).first()
-    if not lead:
-        raise HTTPException(status_code=404, detail="Lead not found")
+    lead = owned_lead(db.query(Lead).filter(Lead.id == lead_id).first(), current_user)
     
     lead.is_archived = True
     lead.updated_at = datetime.now()
+    batch_metrics.mark_stale(db, [lead_id])
     db.commit()
     return {"status": "success", "message": "Lead archived"}
 
@@ -414,10 +590,22 @@ def restore_lead(
     """Restore an archived lead"""
     lead = db.query(Lead).filter(Lead.id == lead_id).first()
     if not lead:
-        raise HTTPException(status_code=404, detail="Lead not found")
+        # Not in the hot table: bring it back from the cold tier
+        owned_lead(db.get(ArchivedLead, lead_id), current_user)
+        try:
+            restored_id = archive.restore_lead(db, lead_id)
+        except archive.RestoreConflictError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if restored_id is None:
+            raise HTTPException(status_code=404, detail="Lead not found")
+        batch_metrics.mark_stale(db, [restored_id])
+        db.commit()
+        return {"status": "success", "message": "Lead restored", "lead_id": restored_id}
     
+    owned_lead(lead, current_user)
     lead.is_archived = False
     lead.updated_at = datetime.now()
+    batch_metrics.mark_stale(db, [lead_id])
     db.commit()
     return {"status": "success", "message": "Lead restored"}
 
@@ -428,49 +616,49 @@ def delete_lead(
     current_user: User = Depends(get_current_user)
 ):
     """Permanently delete a lead"""
-    lead = db.query(Lead).filter(Lead.id == lead_id).first()
-    if not lead:
+    owned_lead(db.get(Lead, lead_id) or db.get(ArchivedLead, lead_id), current_user)
+    batch_metrics.mark_stale(db, [lead_id])
+    if not purge.delete_lead(db, lead_id):
         raise HTTPException(status_code=404, detail="Lead not found")
-    
-    # Delete interactions first
-    db.query(Interaction).filter(Interaction.lead_id == lead_id).delete()
-    db.delete(lead)
     db.commit()
     return {"status": "success", "message": "Lead deleted permanently"}
 
 # --- B2B Analytics & Distribution ---
 
 @app.get("/api/stats", response_model=StatsResponse)
-def get_stats(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+def get_stats(
+    owner: Optional[int] = Depends(lead_scope),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Dashboard counters for the leads in scope (the caller's by default)."""
     try:
-        total_leads = db.query(Lead).count()
-        active_leads = db.query(Lead).filter(Lead.is_archived == False).count()
-        total_interactions = db.query(Interaction).count()
-
-        stages = db.query(Lead.stage).filter(Lead.is_archived == False).all()
-        stage_counts = {}
-        for (stage,) in stages:
-            stage_counts[stage] = stage_counts.get(stage, 0) + 1
+        stage_counts = repository.stage_counts(db, owner)
+        # total_leads has always meant active leads: archived ones, hot or cold, are not counted
+        active_leads = sum(stage_counts.values())
+        if owner is None:
+            total_interactions = db.query(Interaction).count() + db.query(ArchivedInteraction).count()
+        else:
+            owned_ids = union_all(
+                select(Lead.id).where(Lead.owner_id == owner),
+                select(ArchivedLead.id).where(ArchivedLead.owner_id == owner),
+            )
+            total_interactions = sum(
+                db.query(model).filter(model.lead_id.in_(owned_ids)).count()
+                for model in (Interaction, ArchivedInteraction)
+            )
 
         # Recent transactions for this user
         transactions = db.query(LeadTransaction).filter(LeadTransaction.user_id == current_user.id).order_by(LeadTransaction.timestamp.desc()).limit(10).all()
         
-        # Calculate daily outreach: distinctive leads moved to "Первое сообщение" today
+        # Daily outreach: distinct leads moved to "Первое сообщение" today (indexed range counts on stage_events)
         today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        daily_outreach_count = db.query(Interaction.lead_id).filter(
-            Interaction.timestamp >= today_start,
-            Interaction.contact_method == "Move Stage",
-            Interaction.content.like("%to Первое сообщение")
-        ).distinct().count()
-        
+        daily_outreach_count = transitions.count_moves(db, transitions.OUTREACH_STAGE, today_start, user_id=owner)
+        daily_conversion_count = transitions.count_moves(db, transitions.CONVERSION_STAGE, today_start, user_id=owner)
+
         # Calculate yesterday's outreach for growth
         yesterday_start = today_start - timedelta(days=1)
-        yesterday_count = db.query(Interaction.lead_id).filter(
-            Interaction.timestamp >= yesterday_start,
-            Interaction.timestamp < today_start,
-            Interaction.contact_method == "Move Stage",
-            Interaction.content.like("%to Первое сообщение")
-        ).distinct().count()
+        yesterday_count = transitions.count_moves(db, transitions.OUTREACH_STAGE, yesterday_start, today_start, owner)
         
         if yesterday_count > 0:
             growth_val = ((daily_outreach_count - yesterday_count) / yesterday_count) * 100
@@ -478,14 +666,15 @@ def get_stats(db: Session = Depends(get_db), current_user: User = Depends(get_cu
         else:
             daily_growth = "+100%" if daily_outreach_count > 0 else "0%"
         
-    except Exception as e:
-        print(f"[DEBUG] Error fetching stats: {e}")
+    except Exception:
+        logger.exception("error fetching stats")
         # Return empty stats if tables don't exist
         active_leads = 0
         total_interactions = 0
         stage_counts = {}
         transactions = []
         daily_outreach_count = 0
+        daily_conversion_count = 0
         daily_growth = "0%"
 
     return StatsResponse(
@@ -496,14 +685,64 @@ def get_stats(db: Session = Depends(get_db), current_user: User = Depends(get_cu
         telegram_connected=bool(current_user.telegram_chat_id),
         recent_transactions=transactions,
         daily_outreach_count=daily_outreach_count,
+        daily_conversion_count=daily_conversion_count,
         daily_growth=daily_growth
     )
 
+@app.get("/api/analytics/funnel")
+def get_funnel_analytics(
+    background_tasks: BackgroundTasks,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    interval: str = Query("day", pattern="^(day|week)$"),
+    user_id: Optional[int] = None,
+    batch_id: Optional[int] = None,
+    owner: Optional[int] = Depends(lead_scope),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Time series and stage conversion from the daily rollups (last 30 days by default).
+
+    The rollups are per manager who made the move, so a scoped funnel (the
+    caller's by default) is that manager's moves; user_id is for admins.
+    Read-only: new events are rolled up by the scheduler, or by a background refresh queued here.
+    """
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if user_id is None:
+        user_id = owner
+    elif user_id != owner and current_user.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view other managers' funnels")
+    refresh_pending = rollups.pending(db)
+    if refresh_pending:
+        background_tasks.add_task(rollups.refresh_job)
+    return {
+        "start": start,
+        "end": end,
+        "interval": interval,
+        "refreshed_at": rollups.refreshed_at(db),
+        "refresh_pending": refresh_pending,
+        "series": rollups.series(db, start, end, interval, user_id, batch_id),
+        "funnel": rollups.funnel(db, start, end, user_id, batch_id),
+    }
+
+@app.post("/api/analytics/rebuild", response_model=JobResponse)
+def start_rollup_rebuild(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin)
+):
+    """Recompute all funnel rollups from stage events as a background job."""
+    job = jobs.create_job("rollup_rebuild")
+    background_tasks.add_task(jobs.run_job, job, rollups.rebuild_job)
+    return job.to_dict()
+
 @app.post("/api/distribute")
 async def distribute_leads(
     transaction: TransactionCreate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user_async)
 ):
     # Validate input
     if not transaction.recipient or not transaction.recipient.strip():
@@ -512,13 +751,6 @@ async def distribute_leads(
     if transaction.count <= 0:
         raise HTTPException(status_code=400, detail="Count must be greater than 0")
 
-    # Check balance
-    if current_user.balance < transaction.count:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
-
-    # Deduct balance
-    current_user.balance -= transaction.count
-
     # Record transaction
     new_tx = LeadTransaction(
         user_id=current_user.id,
@@ -526,10 +758,31 @@ async def distribute_leads(
         package_type=transaction.package_type,
         count=transaction.count
     )
-    db.add(current_user)
     db.add(new_tx)
-    db.commit()
-    db.refresh(current_user)
+    await db.flush()
+
+    # Deduct balance atomically (conditional UPDATE, no read-modify-write)
+    try:
+        remaining_balance = await ledger.debit_async(db, current_user.id, transaction.count, "distribute", new_tx.id)
+    except ledger.InsufficientBalanceError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+
+    # Claim the actual leads from the pool (all or nothing); the recipient owns them if it is a user
+    owner_id = await ownership.owner_for_async(db, new_tx.recipient)
+    lead_ids = await allocation.claim_leads_async(
+        db, new_tx.id, new_tx.recipient, transaction.count, owner_id,
+        package_type=transaction.package_type,
+        batch_id=transaction.batch_id,
+        max_age_days=transaction.max_age_days,
+    )
+    if len(lead_ids) < transaction.count:
+        await db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail=f"Only {len(lead_ids)} unassigned leads available for package {transaction.package_type}",
+        )
+    await db.commit()
 
     # Send Telegram message if recipient is a TG ID
     if bot and transaction.recipient.isdigit():
@@ -538,102 +791,116 @@ async def distribute_leads(
                 chat_id=transaction.recipient,
                 text=f"🎁 You have received {transaction.count} leads of type {transaction.package_type}!"
             )
-        except Exception as e:
-            print(f"Failed to send Telegram message: {e}")
-
-    return {"status": "success", "remaining_balance": current_user.balance}
+        except Exception:
+            logger.exception("failed to send Telegram message", extra={"recipient": transaction.recipient})
+
+    return {"status": "success", "remaining_balance": remaining_balance, "transaction_id": new_tx.id, "lead_ids": lead_ids}
+
+@app.post("/api/import/preview")
+def preview_import(
+    file: UploadFile = File(...),
+    sample_rows: int = Query(preview.DEFAULT_SAMPLE_ROWS, ge=1, le=preview.MAX_SAMPLE_ROWS),
+    sheet: Optional[str] = None,
+    format: Optional[str] = None,
+    encoding: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Proposed column mapping, sampled column profile and duplicate estimate, without importing."""
+    try:
+        fmt = importing.detect_format(file.filename, format)
+        return preview.preview(file.file, db, sample_rows, sheet, fmt, encoding)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Sheet not found: {sheet}")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read file: {e}")
 
 @app.post("/api/import")
 async def import_leads(
     file: UploadFile = File(...), 
     batch_name: Optional[str] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    mapping: Optional[str] = None,
+    format: Optional[str] = None,
+    encoding: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async)
 ):
-    contents = await file.read()
+    """Import an Excel, CSV or Parquet file (format from the extension unless given).
+
+    mapping is optional JSON {field: header}; by default columns are detected.
+    Re-uploading a file returns its existing batch, or resumes it if the first
+    upload didn't finish.
+    """
     try:
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Create a LeadBatch record
-        batch = LeadBatch(
-            name=batch_name or f"Импорт {datetime.now().strftime('%Y-%m-%d %H:%M')}",
-            file_name=file.filename,
-            imported_at=datetime.now(),
-            count=0
+        fmt = importing.detect_format(file.filename, format)
+        columns = json.loads(mapping) if mapping else None
+        # Hashing, parsing and chunked writes run on a sync session off the event loop
+        result = await run_in_threadpool(
+            importing.import_upload, file.file, file.filename, fmt, columns, encoding, batch_name
         )
-        db.add(batch)
-        db.flush()  # Get the batch ID
-        
-        count = 0
-        for index, row in df.iterrows():
-            # Handle float/int ID correctly
-            raw_id = row.get('ID')
-            telegram_id = None
-            if pd.notna(raw_id):
-                try:
-                    telegram_id = int(float(raw_id))
-                except:
-                    telegram_id = None
-
-            if telegram_id:
-                 existing = db.query(Lead).filter(Lead.telegram_id == telegram_id).first()
-                 if existing:
-                     continue
-            
-            # Handle phone
-            phone_val = row.get('Номер телефона')
-            phone = None
-            if pd.notna(phone_val):
-                # Handle float phone numbers (e.g. 79991234567.0 -> "79991234567")
-                try:
-                    # Clean up string first if it's a string
-                    s_val = str(phone_val).strip()
-                    
-                    # If it looks like a float/int
-                    if s_val.replace('.','',1).isdigit():
-                        if isinstance(phone_val, float) or '.' in s_val:
-                            phone = str(int(float(s_val)))
-                        else:
-                            phone = s_val
-                    else:
-                        # Just keep as string if it's text (e.g. "+7...")
-                        phone = s_val
-                        
-                    # Remove .0 suffix if it persists
-                    if phone and phone.endswith(".0"):
-                        phone = phone[:-2]
-                except:
-                    phone = None # Ignore invalid phones
-
-            lead = Lead(
-                telegram_id=telegram_id,
-                phone=str(phone) if phone else None,
-                full_name=str(row.get('Полное имя')) if pd.notna(row.get('Полное имя')) else None,
-                username=str(row.get('Юзернейм')) if pd.notna(row.get('Юзернейм')) else None,
-                bio=str(row.get('Описание профиля')) if pd.notna(row.get('Описание профиля')) else None,
-                stage="Новый",
-                batch_id=batch.id
-            )
-            db.add(lead)
-            count += 1
-        
-        # Update batch count
-        batch.count = count
-        db.commit()
-        return {"status": "success", "imported_count": count, "batch_id": batch.id}
+        return {"status": "success", **result}
+    except importing.ImportInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/api/import/multi", response_model=JobResponse)
+def import_many(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    all_sheets: bool = True,
+    batch_name: Optional[str] = None,
+    mapping: Optional[str] = None,
+    format: Optional[str] = None,
+    encoding: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """Import several files (and every sheet of each workbook) as a job, one batch per source."""
+    try:
+        columns = json.loads(mapping) if mapping else None
+        formats = [importing.detect_format(f.filename, format) for f in files]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Uploads are gone once the response is sent; the pool workers read these copies
+    workdir = tempfile.mkdtemp(prefix="import-")
+    saved = []
+    for i, (upload, fmt) in enumerate(zip(files, formats)):
+        path = os.path.join(workdir, f"{i}.{fmt}")
+        with open(path, "wb") as out:
+            shutil.copyfileobj(upload.file, out)
+        saved.append({"path": path, "file_name": upload.filename, "format": fmt})
+
+    job = jobs.create_job("import_many", {"files": [f["file_name"] for f in saved], "all_sheets": all_sheets})
+    background_tasks.add_task(
+        jobs.run_job, job, importing.import_many_job, saved, all_sheets, batch_name, columns, encoding, workdir
+    )
+    return job.to_dict()
+
 # --- Lead Batches Endpoints ---
 
 @app.get("/api/batches", response_model=List[LeadBatchResponse])
 def get_batches(
-    db: Session = Depends(get_db),
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """List all import batches"""
-    batches = db.query(LeadBatch).order_by(LeadBatch.imported_at.desc()).all()
-    return batches
+    """List all import batches with their stored metrics (stale ones are refreshed in the background)."""
+    stmt = select(*[getattr(LeadBatch, name) for name in listing.BATCH_FIELDS]).order_by(LeadBatch.imported_at.desc())
+    batches = listing.batch_dicts(db, stmt)
+    pending = batch_metrics.attach(db, batches)
+    if pending:
+        background_tasks.add_task(batch_metrics.refresh_stale_task, pending)
+    return FastJSONResponse(batches)
+
+@app.post("/api/batches/metrics/refresh", response_model=JobResponse)
+def start_batch_metrics_refresh(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin)
+):
+    """Recompute metrics for every batch as a background job (admins only)."""
+    job = jobs.create_job("batch_metrics_refresh")
+    background_tasks.add_task(jobs.run_job, job, batch_metrics.refresh_all_job)
+    return job.to_dict()
 
 @app.get("/api/batches/{batch_id}", response_model=LeadBatchResponse)
 def get_batch(
@@ -641,36 +908,131 @@ def get_batch(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get a specific batch"""
+    """Get a specific batch with its metrics (recomputed first if stale)."""
     batch = db.query(LeadBatch).filter(LeadBatch.id == batch_id).first()
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
-    return batch
+    metrics_row = db.get(BatchMetrics, batch_id)
+    if metrics_row is None or metrics_row.stale:
+        metrics_row = batch_metrics.refresh(db, batch_id)
+        db.commit()
+    response = LeadBatchResponse.model_validate(batch)
+    response.metrics = BatchMetricsResponse.model_validate(batch_metrics.as_response(metrics_row))
+    return response
 
 @app.delete("/api/batches/{batch_id}")
 def delete_batch(
     batch_id: int,
+    background_tasks: BackgroundTasks,
     delete_leads: bool = False,
+    background: bool = False,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_admin)
 ):
-    """Delete a batch. Optionally delete associated leads."""
+    """Delete a batch. Optionally delete associated leads (in chunks, or as a background job).
+
+    A batch's leads belong to many managers, so admins only.
+    """
     batch = db.query(LeadBatch).filter(LeadBatch.id == batch_id).first()
     if not batch:
         raise HTTPException(status_code=404, detail="Batch not found")
     
-    if delete_leads:
-        # Delete interactions first
-        lead_ids = [l.id for l in batch.leads]
-        db.query(Interaction).filter(Interaction.lead_id.in_(lead_ids)).delete(synchronize_session=False)
-        db.query(Lead).filter(Lead.batch_id == batch_id).delete(synchronize_session=False)
-    else:
-        # Just unlink leads from batch
-        db.query(Lead).filter(Lead.batch_id == batch_id).update({"batch_id": None})
-    
-    db.delete(batch)
+    if background:
+        job = jobs.create_job("batch_delete", {"batch_id": batch_id, "delete_leads": delete_leads})
+        background_tasks.add_task(jobs.run_job, job, purge.delete_batch_job, batch_id, delete_leads)
+        return {"status": "accepted", "message": "Batch deletion started", "job": job.to_dict()}
+
+    deleted = purge.delete_batch(db, batch_id, delete_leads)
+    return {"status": "success", "message": "Batch deleted", "deleted_leads": deleted}
+
+# --- Duplicate Detection ---
+
+@app.get("/api/dedupe/batches/{batch_id}", response_model=DuplicateGroupsResponse)
+def get_batch_duplicates(
+    batch_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Merge groups involving leads of one import batch."""
+    groups = dedupe.find_batch_duplicate_groups(db, batch_id)
+    return {"group_count": len(groups), "groups": groups}
+
+@app.post("/api/dedupe/scan", response_model=JobResponse)
+def start_dedupe_scan(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin)
+):
+    """Start a full duplicate scan of every batch as a background job (admins only). Poll /api/jobs/{id} for the groups."""
+    job = jobs.create_job("dedupe_scan")
+    background_tasks.add_task(jobs.run_job, job, dedupe.scan_job)
+    return job.to_dict()
+
+@app.post("/api/leads/owners/backfill", response_model=JobResponse)
+def start_owner_backfill(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin)
+):
+    """Set owner_id from manager_name on unowned leads. The result lists names that match no user."""
+    job = jobs.create_job("owner_backfill")
+    background_tasks.add_task(jobs.run_job, job, ownership.backfill_job)
+    return job.to_dict()
+
+@app.post("/api/stage-events/backfill", response_model=JobResponse)
+def start_stage_event_backfill(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin)
+):
+    """Rebuild stage events from "Moved from X to Y" interactions as a background job (safe to rerun)."""
+    job = jobs.create_job("stage_event_backfill")
+    background_tasks.add_task(jobs.run_job, job, transitions.backfill_job)
+    return job.to_dict()
+
+@app.post("/api/dedupe/merge")
+def merge_duplicates(
+    request: MergeRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin)
+):
+    """Merge each group into its oldest lead, reparenting interactions. Irreversible, so admins only."""
+    survivors = []
+    batch_metrics.mark_stale(db, [lead_id for group in request.groups for lead_id in group])
+    for group in request.groups:
+        try:
+            survivors.append(dedupe.merge_group(db, group))
+        except ValueError:
+            continue
     db.commit()
-    return {"status": "success", "message": "Batch deleted"}
+    return {"status": "success", "merged_groups": len(survivors), "survivor_ids": survivors}
+
+# --- Archive Tier ---
+
+@app.get("/api/archive/report")
+def get_archive_report(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Row counts and sizes of the hot and cold tiers."""
+    return archive.tier_report(db)
+
+@app.post("/api/archive/compact", response_model=JobResponse)
+def start_archive_compaction(
+    background_tasks: BackgroundTasks,
+    leads_after_days: Optional[int] = None,
+    interactions_after_days: Optional[int] = None,
+    current_user: User = Depends(get_current_admin)
+):
+    """Move archived leads and old interactions of every owner to the cold tier as a background job (admins only)."""
+    params = {"leads_after_days": leads_after_days, "interactions_after_days": interactions_after_days}
+    job = jobs.create_job("archive_compact", params)
+    background_tasks.add_task(jobs.run_job, job, archive.compact_job, **params)
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+def get_job_status(job_id: str, current_user: User = Depends(get_current_user)):
+    job = jobs.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
 
 # --- Telegram Webhook & Integration ---
 
@@ -707,13 +1069,13 @@ async def telegram_webhook(request: Request):
     try:
         update = Update.de_json(data, bot)
     except Exception as e:
-        print(f"Error parsing update: {e}")
+        logger.warning("error parsing Telegram update", extra={"error": str(e)})
         return {"status": "error", "detail": str(e)}
     
     if not update.message and not update.callback_query:
         return {"status": "ok"}
         
-    db = SessionLocal()
+    db = AsyncSessionLocal()
     try:
         if update.message and update.message.text:
             text = update.message.text.strip()
@@ -724,17 +1086,17 @@ async def telegram_webhook(request: Request):
                 parts = text.split()
                 if len(parts) == 2:
                     token = parts[1]
-                    user = db.query(User).filter(User.connect_token == token).first()
+                    user = (await db.execute(select(User).where(User.connect_token == token))).scalars().first()
                     if user:
                         user.telegram_chat_id = str(chat_id)
                         user.connect_token = None # Clear token
-                        db.commit()
+                        await db.commit()
                         await bot.send_message(chat_id=chat_id, text=f"✅ Account connected successfully! Hello, {user.username}.")
                     else:
                         await bot.send_message(chat_id=chat_id, text="❌ Invalid or expired token. Please generate a new one on the dashboard.")
                 else:
                     # Check if already connected
-                    user = db.query(User).filter(User.telegram_chat_id == str(chat_id)).first()
+                    user = (await db.execute(select(User).where(User.telegram_chat_id == str(chat_id)))).scalars().first()
                     if user:
                         await bot.send_message(chat_id=chat_id, text=f"👋 Welcome back, {user.username}! Use /balance to check your leads.")
                     else:
@@ -742,7 +1104,7 @@ async def telegram_webhook(request: Request):
             
             # /balance
             elif text == "/balance":
-                user = db.query(User).filter(User.telegram_chat_id == str(chat_id)).first()
+                user = (await db.execute(select(User).where(User.telegram_chat_id == str(chat_id)))).scalars().first()
                 if user:
                     await bot.send_message(chat_id=chat_id, text=f"💰 Your balance: {user.balance} leads")
                 else:
@@ -750,11 +1112,13 @@ async def telegram_webhook(request: Request):
             
             # /leads
             elif text == "/leads":
-                user = db.query(User).filter(User.telegram_chat_id == str(chat_id)).first()
+                user = (await db.execute(select(User).where(User.telegram_chat_id == str(chat_id)))).scalars().first()
                 if user:
                     # Logic to fetch leads assigned to this user (future feature)
                     # For now just show recent transactions
-                    txs = db.query(LeadTransaction).filter(LeadTransaction.user_id == user.id).order_by(LeadTransaction.timestamp.desc()).limit(5).all()
+                    txs = (await db.execute(
+                        select(LeadTransaction).where(LeadTransaction.user_id == user.id).order_by(LeadTransaction.timestamp.desc()).limit(5)
+                    )).scalars().all()
                     if txs:
                         msg = "Recent Distributions:\n" + "\n".join([f"- {t.count} ({t.package_type}) to {t.recipient}" for t in txs])
                     else:
@@ -771,9 +1135,9 @@ async def telegram_webhook(request: Request):
         # if update.callback_query:
         #    ...
 
-    except Exception as e:
-        print(f"Webhook error: {e}")
+    except Exception:
+        logger.exception("webhook error")
     finally:
-        db.close()
+        await db.close()
         
     return {"status": "ok"}
@@ -0,0 +1,85 @@
+"""
+In-process background jobs with progress (dedupe scans, batch purges, ...).
+
+Jobs run through FastAPI BackgroundTasks and are tracked in memory, like the
+login rate limiter: status is per process and is lost on restart.
+"""
+import threading
+import uuid
+from datetime import datetime
+
+from .logs import get_logger
+
+logger = get_logger(__name__)
+
+_jobs = {}
+_lock = threading.Lock()
+MAX_FINISHED_JOBS = 200
+
+
+class Job:
+    def __init__(self, kind, params=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = "pending" # pending, running, done, failed
+        self.progress = 0
+        self.total = None
+        self.message = None
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+
+    def update(self, progress=None, total=None, message=None):
+        if progress is not None:
+            self.progress = progress
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "message": self.message,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def create_job(kind, params=None):
+    job = Job(kind, params)
+    with _lock:
+        _jobs[job.id] = job
+        finished = [j for j in _jobs.values() if j.finished_at]
+        for old in sorted(finished, key=lambda j: j.finished_at)[:-MAX_FINISHED_JOBS]:
+            del _jobs[old.id]
+    return job
+
+
+def get_job(job_id):
+    with _lock:
+        return _jobs.get(job_id)
+
+
+def run_job(job, fn, *args, **kwargs):
+    """Run fn(job, *args, **kwargs), recording its result or error on the job."""
+    job.status = "running"
+    try:
+        job.result = fn(job, *args, **kwargs)
+        job.status = "done"
+    except Exception as e:
+        logger.exception("job failed", extra={"job_id": job.id, "kind": job.kind})
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.now()
+    return job
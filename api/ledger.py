@@ -0,0 +1,95 @@
+"""
+Contention-safe lead balance.
+
+Balances are never read-modify-written in Python. A debit is a single
+conditional UPDATE that only matches while the balance covers it:
+
+    UPDATE users SET balance = balance - :n WHERE id = :id AND balance >= :n
+
+so concurrent distributions can't overdraw or lose updates, and the row is
+only locked for the rest of the caller's (short) transaction. Every change
+is also appended to balance_ledger in the same transaction for auditing.
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import User, BalanceLedgerEntry
+
+
+class InsufficientBalanceError(Exception):
+    pass
+
+
+def _change_statement(user_id: int, delta: int, returning: bool):
+    stmt = update(User).where(User.id == user_id).values(balance=User.balance + delta)
+    if delta < 0:
+        stmt = stmt.where(User.balance >= -delta)
+    if returning:
+        stmt = stmt.returning(User.balance)
+    return stmt.execution_options(synchronize_session=False)
+
+
+def _ledger_entry(user_id, delta, balance_after, reason, transaction_id):
+    return BalanceLedgerEntry(
+        user_id=user_id,
+        delta=delta,
+        balance_after=balance_after,
+        reason=reason,
+        transaction_id=transaction_id,
+    )
+
+
+def _apply(db: Session, user_id: int, delta: int, reason: str, transaction_id=None) -> int:
+    returning = db.get_bind().dialect.update_returning
+    result = db.execute(_change_statement(user_id, delta, returning))
+    if returning:
+        balance = result.scalar()
+        if balance is None:
+            raise InsufficientBalanceError()
+    else:
+        if result.rowcount == 0:
+            raise InsufficientBalanceError()
+        balance = db.execute(select(User.balance).where(User.id == user_id)).scalar()
+    db.add(_ledger_entry(user_id, delta, balance, reason, transaction_id))
+    return balance
+
+
+async def _apply_async(db: AsyncSession, user_id: int, delta: int, reason: str, transaction_id=None) -> int:
+    returning = db.get_bind().dialect.update_returning
+    result = await db.execute(_change_statement(user_id, delta, returning))
+    if returning:
+        balance = result.scalar()
+        if balance is None:
+            raise InsufficientBalanceError()
+    else:
+        if result.rowcount == 0:
+            raise InsufficientBalanceError()
+        balance = (await db.execute(select(User.balance).where(User.id == user_id))).scalar()
+    db.add(_ledger_entry(user_id, delta, balance, reason, transaction_id))
+    return balance
+
+
+def debit(db: Session, user_id: int, amount: int, reason: str, transaction_id=None) -> int:
+    """Atomically take `amount` from the balance. Returns the new balance; caller commits."""
+    return _apply(db, user_id, -amount, reason, transaction_id)
+
+
+def credit(db: Session, user_id: int, amount: int, reason: str, transaction_id=None) -> int:
+    """Atomically add `amount` to the balance. Returns the new balance; caller commits."""
+    return _apply(db, user_id, amount, reason, transaction_id)
+
+
+async def debit_async(db: AsyncSession, user_id: int, amount: int, reason: str, transaction_id=None) -> int:
+    return await _apply_async(db, user_id, -amount, reason, transaction_id)
+
+
+async def credit_async(db: AsyncSession, user_id: int, amount: int, reason: str, transaction_id=None) -> int:
+    return await _apply_async(db, user_id, amount, reason, transaction_id)
+
+
+def ledger_total(db: Session, user_id: int) -> int:
+    """Sum of all recorded balance changes for a user."""
+    return db.execute(
+        select(func.coalesce(func.sum(BalanceLedgerEntry.delta), 0)).where(BalanceLedgerEntry.user_id == user_id)
+    ).scalar()
@@ -0,0 +1,51 @@
+"""
+Read-only list queries that skip ORM hydration.
+
+Rows are selected as plain column tuples and turned straight into dicts
+shaped like the response models, then rendered by FastJSONResponse. Child
+interactions are loaded for the whole page with one query per chunk of
+lead IDs instead of one lazy load per lead.
+"""
+from typing import List
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .models import InteractionResponse, LeadBatchResponse, LeadResponse
+
+LEAD_FIELDS = [name for name in LeadResponse.model_fields if name != "interactions"]
+INTERACTION_FIELDS = list(InteractionResponse.model_fields)
+BATCH_FIELDS = [name for name in LeadBatchResponse.model_fields if name != "metrics"]
+CHUNK_SIZE = 500
+
+
+def lead_select(model):
+    """SELECT of the LeadResponse columns from a lead table (hot or cold)."""
+    return select(*[getattr(model, name) for name in LEAD_FIELDS])
+
+
+def lead_dicts(db: Session, stmt, interaction_model) -> List[dict]:
+    """Run a lead_select() statement and attach each lead's interactions."""
+    leads = [dict(row) for row in db.execute(stmt).mappings()]
+    if not leads:
+        return leads
+    by_id = {}
+    for lead in leads:
+        lead["interactions"] = []
+        by_id[lead["id"]] = lead
+
+    ids = list(by_id)
+    columns = [getattr(interaction_model, name) for name in INTERACTION_FIELDS]
+    for i in range(0, len(ids), CHUNK_SIZE):
+        rows = db.execute(
+            select(interaction_model.lead_id, *columns)
+            .where(interaction_model.lead_id.in_(ids[i:i + CHUNK_SIZE]))
+            .order_by(interaction_model.id)
+        )
+        for row in rows:
+            by_id[row[0]]["interactions"].append(dict(zip(INTERACTION_FIELDS, row[1:])))
+    return leads
+
+
+def batch_dicts(db: Session, stmt) -> List[dict]:
+    return [dict(row) for row in db.execute(stmt).mappings()]
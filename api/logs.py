@@ -0,0 +1,67 @@
+"""
+Structured, level-gated logging for the API.
+
+Every record is one JSON line: time, level, logger, message, plus whatever was
+passed in ``extra=``. Hot paths log at DEBUG with their fields in ``extra``
+rather than in an f-string, so with the default LOG_LEVEL=INFO a disabled
+call costs one level check and nothing is formatted.
+
+    LOG_LEVEL    DEBUG / INFO / WARNING / ERROR (default INFO)
+    LOG_FORMAT   json (default) or text for local development
+"""
+import json
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else came from extra=
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update((k, v) for k, v in vars(record).items() if k not in _RESERVED)
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = f"{record.levelname:7s} {record.name}: {record.getMessage()}"
+        fields = " ".join(f"{k}={v}" for k, v in vars(record).items() if k not in _RESERVED)
+        if fields:
+            line = f"{line} {fields}"
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
+def configure_logging(level=None, fmt=None):
+    """Install the handler on the "api" logger tree (idempotent)."""
+    root = logging.getLogger("api")
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    fmt = (fmt or os.getenv("LOG_FORMAT", "json")).lower()
+    handler = next((h for h in root.handlers if getattr(h, "_crm_handler", False)), None)
+    if handler is None:
+        handler = logging.StreamHandler(sys.stderr)
+        handler._crm_handler = True
+        root.addHandler(handler)
+        root.propagate = False
+    handler.setFormatter(TextFormatter() if fmt == "text" else JSONFormatter())
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the "api" tree, e.g. get_logger(__name__) inside the package."""
+    return logging.getLogger(name if name.startswith("api") else f"api.{name}")
+
+
+configure_logging()
@@ -0,0 +1,246 @@
+"""
+Per-request instrumentation: latency histograms, SQL accounting, N+1 detection.
+
+MetricsMiddleware times every HTTP request and files it under its route
+template (``/api/leads/{lead_id}``, not the concrete URL, so label
+cardinality stays bounded). While the request runs, engine cursor events add
+each statement to a per-request RequestStats held in a context variable;
+sync endpoints run in the threadpool with a copy of that context, so they
+update the same object. When a request finishes:
+
+  * latency goes into a per-route histogram, statement count and DB time
+    into per-route totals;
+  * if one statement text ran N_PLUS_ONE_THRESHOLD times or more, the
+    request is counted as an N+1 suspect and a warning is logged with it;
+  * a Server-Timing header carries the DB time and query count, so the
+    numbers are visible in browser dev tools.
+
+render_prometheus() exposes everything (plus connection pool counters) in
+the Prometheus text format for /api/metrics.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+from .logs import get_logger
+
+logger = get_logger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500)
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+
+class RequestStats:
+    """SQL work done on behalf of one request."""
+
+    __slots__ = ("queries", "db_time", "statements", "scope")
+
+    def __init__(self, scope=None):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = Counter()
+        self.scope = scope
+
+    def endpoint(self):
+        """"GET /api/leads/{lead_id}" once routing has matched, else the raw path."""
+        if not self.scope:
+            return None
+        route = getattr(self.scope.get("route"), "path", None) or self.scope.get("path")
+        return f"{self.scope.get('method')} {route}"
+
+    def repeated(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """(statement, count) for the most repeated statement if it reaches threshold."""
+        if not self.statements:
+            return None
+        statement, count = self.statements.most_common(1)[0]
+        return (statement, count) if count >= threshold else None
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+def current_stats():
+    return _current.get()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Registry:
+    """Process-wide request metrics, keyed by (method, route, status)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.queries = {}
+            self.db_seconds = Counter()
+            self.n_plus_one = Counter()
+            self.background_queries = 0
+            self.background_db_seconds = 0.0
+
+    def record_request(self, method, route, status, seconds, stats):
+        with self._lock:
+            self.latency.setdefault((method, route, str(status)), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault((method, route), Histogram(QUERY_BUCKETS)).observe(stats.queries)
+            self.db_seconds[(method, route)] += stats.db_time
+            if stats.repeated():
+                self.n_plus_one[(method, route)] += 1
+
+    def record_background(self, seconds):
+        with self._lock:
+            self.background_queries += 1
+            self.background_db_seconds += seconds
+
+
+registry = Registry()
+
+
+# --- SQLAlchemy hooks ---
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    elapsed = time.perf_counter() - starts.pop() if starts else 0.0
+    stats = _current.get()
+    if stats is None:
+        registry.record_background(elapsed)
+        return
+    stats.queries += 1
+    stats.db_time += elapsed
+    stats.statements[statement] += 1
+
+
+def instrument_engines():
+    """Attach query accounting to every Engine, including the sync side of async engines."""
+    if not event.contains(Engine, "before_cursor_execute", _before_execute):
+        event.listen(Engine, "before_cursor_execute", _before_execute)
+        event.listen(Engine, "after_cursor_execute", _after_execute)
+
+
+# --- ASGI middleware ---
+
+class MetricsMiddleware:
+    """Times requests and attaches a fresh RequestStats for the SQL hooks."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("server-timing", f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"')
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - start
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            registry.record_request(scope["method"], route, status, elapsed, stats)
+            repeated = stats.repeated()
+            if repeated:
+                logger.warning("possible N+1 query pattern", extra={
+                    "route": route, "method": scope["method"], "repeats": repeated[1],
+                    "statement": repeated[0][:500], "queries": stats.queries,
+                })
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("request", extra={
+                    "route": route, "method": scope["method"], "status": status,
+                    "ms": round(elapsed * 1000, 2), "queries": stats.queries,
+                    "db_ms": round(stats.db_time * 1000, 2),
+                })
+
+
+# --- Prometheus text exposition ---
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name, histograms, label_names):
+    lines = []
+    for key, h in sorted(histograms.items()):
+        labels = dict(zip(label_names, key))
+        cumulative = 0
+        for bound, count in zip(h.buckets, h.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {h.count}")
+        lines.append(f"{name}_sum{_labels(**labels)} {h.sum}")
+        lines.append(f"{name}_count{_labels(**labels)} {h.count}")
+    return lines
+
+
+def render_prometheus(pools=None) -> str:
+    """All metrics in Prometheus text format. pools: {"sync": snapshot, "async": snapshot}."""
+    with registry._lock:
+        lines = [
+            "# HELP crm_http_request_duration_seconds HTTP request latency by route.",
+            "# TYPE crm_http_request_duration_seconds histogram",
+            *_histogram_lines("crm_http_request_duration_seconds", registry.latency, ("method", "route", "status")),
+            "# HELP crm_db_queries_per_request SQL statements executed per HTTP request.",
+            "# TYPE crm_db_queries_per_request histogram",
+            *_histogram_lines("crm_db_queries_per_request", registry.queries, ("method", "route")),
+            "# HELP crm_db_seconds_total Time spent in SQL statements by route.",
+            "# TYPE crm_db_seconds_total counter",
+            *(f"crm_db_seconds_total{_labels(method=m, route=r)} {v}" for (m, r), v in sorted(registry.db_seconds.items())),
+            "# HELP crm_n_plus_one_requests_total Requests that repeated one statement at least the N+1 threshold.",
+            "# TYPE crm_n_plus_one_requests_total counter",
+            *(f"crm_n_plus_one_requests_total{_labels(method=m, route=r)} {v}" for (m, r), v in sorted(registry.n_plus_one.items())),
+            "# HELP crm_db_background_queries_total SQL statements executed outside HTTP requests.",
+            "# TYPE crm_db_background_queries_total counter",
+            f"crm_db_background_queries_total {registry.background_queries}",
+            f"crm_db_background_seconds_total {registry.background_db_seconds}",
+        ]
+    for pool, snapshot in (pools or {}).items():
+        if not snapshot:
+            continue
+        for key, value in snapshot.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f"crm_db_pool_{key}{_labels(pool=pool)} {value}")
+    return "\n".join(lines) + "\n"
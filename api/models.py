@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 # Auth Models
@@ -33,6 +33,8 @@ class TransactionCreate(BaseModel):
     recipient: str
     package_type: str
     count: int
+    batch_id: Optional[int] = None # Only draw leads from this import batch
+    max_age_days: Optional[int] = None # Only draw leads created within this many days
 
 class TransactionResponse(BaseModel):
     id: int
@@ -81,16 +83,53 @@ class LeadResponse(LeadBase):
     next_contact_date: Optional[datetime] = None
     is_archived: bool = False
     batch_id: Optional[int] = None
+    transaction_id: Optional[int] = None
+    assigned_at: Optional[datetime] = None
+    owner_id: Optional[int] = None
     interactions: List[InteractionResponse] = []
 
     class Config:
         from_attributes = True
 
+# Kanban Board
+class BoardCard(BaseModel):
+    id: int
+    full_name: Optional[str] = None
+    username: Optional[str] = None
+    phone: Optional[str] = None
+    stage: str
+    telegram_id: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    next_contact_date: Optional[datetime] = None
+
+class BoardColumn(BaseModel):
+    stage: str
+    total: int
+    cards: List[BoardCard]
+    next_cursor: Optional[str] = None
+
+class BoardResponse(BaseModel):
+    order: str
+    columns: List[BoardColumn]
+
 # Lead Batch Models
 class LeadBatchCreate(BaseModel):
     name: str
     description: Optional[str] = None
 
+class BatchMetricsResponse(BaseModel):
+    leads: int
+    by_stage: Dict[str, int]
+    archived: int
+    archived_share: float
+    contacted: int
+    contacted_share: float
+    converted: int
+    conversion_rate: float
+    median_hours_to_first_contact: Optional[float] = None
+    stale: bool = False
+    refreshed_at: Optional[datetime] = None
+
 class LeadBatchResponse(BaseModel):
     id: int
     name: str
@@ -98,6 +137,8 @@ class LeadBatchResponse(BaseModel):
     file_name: Optional[str] = None
     imported_at: datetime
     count: int
+    state: Optional[str] = None # processing, done, failed
+    metrics: Optional[BatchMetricsResponse] = None # Filled from batch_metrics, not the ORM object
 
     class Config:
         from_attributes = True
@@ -111,5 +152,55 @@ class StatsResponse(BaseModel):
     telegram_connected: bool = False
     recent_transactions: List[TransactionResponse] = []
     daily_outreach_count: int = 0
+    daily_conversion_count: int = 0
     daily_goal: int = 30
     daily_growth: str = "0%"
+
+# Background jobs
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    params: dict = {}
+    status: str
+    progress: int = 0
+    total: Optional[int] = None
+    message: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+# Dedupe
+class DuplicateGroupsResponse(BaseModel):
+    group_count: int
+    groups: List[List[int]]
+
+class MergeRequest(BaseModel):
+    groups: List[List[int]]
+
+class BulkStageMove(BaseModel):
+    lead_ids: List[int]
+    stage: str
+
+# Full-text search
+class SearchMatch(BaseModel):
+    source: str # bio, interaction
+    interaction_id: Optional[int] = None
+    snippet: str # HTML-escaped, matched terms in <mark>
+
+class SearchHit(BaseModel):
+    id: int
+    full_name: Optional[str] = None
+    username: Optional[str] = None
+    phone: Optional[str] = None
+    stage: Optional[str] = None
+    owner_id: Optional[int] = None
+    score: float
+    matches: List[SearchMatch]
+
+class SearchResponse(BaseModel):
+    query: str
+    total: int
+    skip: int
+    limit: int
+    items: List[SearchHit]
@@ -0,0 +1,150 @@
+"""
+Lead ownership: which manager a lead belongs to.
+
+leads.owner_id references users.id and is what every list, board, count and
+stats query scopes on. Composite indexes lead with owner_id, so one
+manager's board is read from that manager's slice of the index. The scope
+is resolved per request:
+
+  * mine (default): the caller's leads
+  * all: every lead (admins only)
+  * owner_id=N: one manager's leads (admins only, or N is the caller)
+
+Endpoints that take lead IDs (detail, interactions, stage moves, archive,
+restore, delete) go through check_lead()/check_leads(): the lead's owner
+or an admin, nobody else.
+
+manager_name stays as display text. Distribution still writes the
+recipient there and now also sets owner_id when the recipient is a user:
+the recipient is matched against usernames first, then Telegram chat IDs.
+Leads assigned before owner_id existed are backfilled from manager_name
+the same way, in one set-based UPDATE per tier:
+
+    python -m api.ownership backfill
+
+Names that match no user are left unowned and reported, so they can be
+fixed by hand (or by creating the user) and backfilled again.
+"""
+import sys
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import Lead, ArchivedLead, User, SessionLocal
+
+SCOPES = ("mine", "all")
+ID_CHUNK = 10000
+
+
+def resolve_scope(user: User, scope: str = "mine", owner_id: Optional[int] = None) -> Optional[int]:
+    """Owner to filter on, or None for every lead. Raises PermissionError when a manager widens."""
+    is_admin = user.role == "admin"
+    if owner_id is not None:
+        if owner_id != user.id and not is_admin:
+            raise PermissionError("Only admins can view other managers' leads")
+        return owner_id
+    if scope == "all":
+        if not is_admin:
+            raise PermissionError("Only admins can view all leads")
+        return None
+    return user.id
+
+
+def conditions(model, owner_id: Optional[int]) -> list:
+    return [] if owner_id is None else [model.owner_id == owner_id]
+
+
+def check_lead(user: User, lead) -> None:
+    """Endpoints that take a lead ID: its owner and admins only. Raises LookupError or PermissionError."""
+    if lead is None:
+        raise LookupError("Lead not found")
+    if user.role != "admin" and lead.owner_id != user.id:
+        raise PermissionError("This lead belongs to another manager")
+
+
+def check_leads(db: Session, user: User, lead_ids: Iterable[int]) -> None:
+    """check_lead() for bulk endpoints, in one query per ID chunk; IDs that don't exist are left to the caller."""
+    if user.role == "admin":
+        return
+    lead_ids = list(lead_ids)
+    for i in range(0, len(lead_ids), ID_CHUNK):
+        foreign = db.execute(
+            select(Lead.id).where(Lead.id.in_(lead_ids[i:i + ID_CHUNK]), Lead.owner_id.is_distinct_from(user.id)).limit(1)
+        ).first()
+        if foreign is not None:
+            raise PermissionError(f"Lead {foreign[0]} belongs to another manager")
+
+
+def _match(recipient_column):
+    """Scalar subquery: the user a manager_name/recipient refers to (username, then chat ID)."""
+    by_name = select(User.id).where(User.username == recipient_column).limit(1).scalar_subquery()
+    by_chat = select(User.id).where(User.telegram_chat_id == recipient_column).limit(1).scalar_subquery()
+    return func.coalesce(by_name, by_chat)
+
+
+def _owner_query(recipient: str):
+    return (
+        select(User.id)
+        .where(or_(User.username == recipient, User.telegram_chat_id == recipient))
+        .order_by((User.username == recipient).desc())
+        .limit(1)
+    )
+
+
+def owner_for(db: Session, recipient: Optional[str]) -> Optional[int]:
+    return db.execute(_owner_query(recipient)).scalar() if recipient else None
+
+
+async def owner_for_async(db: AsyncSession, recipient: Optional[str]) -> Optional[int]:
+    return (await db.execute(_owner_query(recipient))).scalar() if recipient else None
+
+
+def backfill(db: Session) -> Dict[str, int]:
+    """Set owner_id from manager_name on unowned leads, hot and cold. Commits."""
+    updated = {}
+    for model in (Lead, ArchivedLead):
+        pending = (model.owner_id.is_(None), model.manager_name.isnot(None))
+        result = db.execute(
+            update(model)
+            .where(*pending, _match(model.manager_name).isnot(None))
+            .values(owner_id=_match(model.manager_name))
+            .execution_options(synchronize_session=False)
+        )
+        updated[model.__table__.name] = result.rowcount
+    db.commit()
+    return updated
+
+
+def unmatched(db: Session, limit: int = 50) -> List[dict]:
+    """manager_name values on unowned leads that match no user, most common first."""
+    count = func.count(Lead.id)
+    rows = db.execute(
+        select(Lead.manager_name, count)
+        .where(Lead.owner_id.is_(None), Lead.manager_name.isnot(None))
+        .group_by(Lead.manager_name)
+        .order_by(count.desc())
+        .limit(limit)
+    )
+    return [{"manager_name": name, "leads": leads} for name, leads in rows]
+
+
+def backfill_job(job) -> dict:
+    db = SessionLocal()
+    try:
+        return {"updated": backfill(db), "unmatched": unmatched(db)}
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m api.ownership backfill")
+    session = SessionLocal()
+    try:
+        print(f"Owners set: {backfill(session)}")
+        for row in unmatched(session):
+            print(f"  no user for {row['manager_name']!r} ({row['leads']} leads)")
+    finally:
+        session.close()
@@ -0,0 +1,200 @@
+"""
+Import preview: column mapping detection and sampled profiling.
+
+Opens the workbook with openpyxl in read-only mode, which streams sheet
+XML instead of building the whole workbook, and reads only the header and
+the first `sample_rows` rows. Row counts come from the sheet dimension
+metadata. The cost depends on the sample size, not on the file size. CSV and
+Parquet files are sampled from their first chunk (api/importing.py).
+
+Mapping detection scores every column for every lead field. Header
+synonyms give the strongest signal; value patterns in the sample (phone-like
+digits, @usernames, long numeric IDs) come next. Each field then takes its
+best column, greedily. /api/import uses the same detect_mapping(), so what
+the preview proposes is what an import without an explicit mapping does.
+
+Duplicates are estimated by checking the sample's telegram IDs against the
+hot and cold lead tables in one set-based query and scaling the hit rate to
+the sheet's row count.
+"""
+import re
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+from .repository import existing_telegram_ids
+
+FIELDS = ("telegram_id", "phone", "full_name", "username", "bio")
+# Without one of these a row can't be told apart from an empty lead
+IDENTIFYING_FIELDS = ("telegram_id", "phone", "full_name", "username")
+SYNONYMS = {
+    "telegram_id": ["id", "telegram id", "tg id", "user id", "userid", "айди", "ид"],
+    "phone": ["номер телефона", "телефон", "phone", "phone number", "тел", "мобильный", "номер"],
+    "full_name": ["полное имя", "фио", "имя", "name", "full name", "клиент", "контакт"],
+    "username": ["юзернейм", "username", "user name", "ник", "никнейм", "telegram", "логин"],
+    "bio": ["описание профиля", "описание", "bio", "about", "запрос", "комментарий", "примечание"],
+}
+MIN_SCORE = 0.5
+DEFAULT_SAMPLE_ROWS = 200
+MAX_SAMPLE_ROWS = 2000
+
+_PHONE = re.compile(r"^\+?[78]\d{10}$|^\+?\d{11,15}$")
+_USERNAME = re.compile(r"^@[A-Za-z0-9_]{3,}$")
+
+
+def _header_key(value) -> str:
+    return re.sub(r"[\s_\-]+", " ", str(value or "")).strip().lower()
+
+
+def _digits(value) -> Optional[str]:
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip().lstrip("=")
+    return text if text.lstrip("+").isdigit() else None
+
+
+def _header_score(field: str, header: str) -> float:
+    names = SYNONYMS[field]
+    if header in names:
+        return 1.0
+    if any(name in header for name in names if len(name) > 3):
+        return 0.8
+    return 0.0
+
+
+def _value_score(field: str, values: list) -> float:
+    """Share of sampled values that look like `field`, discounted below header evidence."""
+    if not values:
+        return 0.0
+    if field == "phone":
+        hits = sum(1 for v in values if (d := _digits(v)) and _PHONE.match(d))
+    elif field == "username":
+        hits = sum(1 for v in values if isinstance(v, str) and _USERNAME.match(v.strip()))
+    elif field == "telegram_id":
+        hits = sum(1 for v in values if (d := _digits(v)) and not d.startswith("+") and 5 <= len(d) <= 12)
+    else:
+        return 0.0
+    return 0.6 * hits / len(values)
+
+
+def detect_mapping(headers: List, samples: Dict[int, list]) -> Dict[str, dict]:
+    """{field: {"column": header or None, "score": float}} from headers and per-column sample values."""
+    candidates = []
+    for index, header in enumerate(headers):
+        key = _header_key(header)
+        if not key:
+            continue
+        values = samples.get(index, [])
+        for field in FIELDS:
+            score = max(_header_score(field, key), _value_score(field, values))
+            if score >= MIN_SCORE:
+                candidates.append((score, field, index))
+
+    mapping = {field: {"column": None, "score": 0.0} for field in FIELDS}
+    used = set()
+    for score, field, index in sorted(candidates, key=lambda c: (-c[0], FIELDS.index(c[1]), c[2])):
+        if mapping[field]["column"] is None and index not in used:
+            mapping[field] = {"column": str(headers[index]), "score": round(score, 2)}
+            used.add(index)
+    return mapping
+
+
+def _type_name(value) -> str:
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int"
+    if isinstance(value, float):
+        return "int" if value.is_integer() else "float"
+    if isinstance(value, (datetime, date)):
+        return "datetime"
+    return "str"
+
+
+def profile_column(values: list) -> dict:
+    present = [v for v in values if v is not None and str(v).strip() != ""]
+    types = Counter(_type_name(v) for v in present)
+    return {
+        "null_rate": round(1 - len(present) / len(values), 4) if values else 1.0,
+        "type": types.most_common(1)[0][0] if types else None,
+        "types": dict(types),
+        "distinct": len(set(map(str, present))),
+        "examples": [str(v)[:80] for v in present[:3]],
+    }
+
+
+def read_sample(fileobj, sample_rows: int = DEFAULT_SAMPLE_ROWS, sheet: Optional[str] = None) -> dict:
+    """Sheet metadata, header and the first sample_rows rows of a workbook (read-only, streamed)."""
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        sheets = []
+        for ws in workbook.worksheets:
+            # Dimension metadata; None when the writer didn't record one
+            sheets.append({"name": ws.title, "rows": max(ws.max_row - 1, 0) if ws.max_row else None, "columns": ws.max_column})
+        ws = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = ws.iter_rows(max_row=sample_rows + 1, values_only=True)
+        headers = list(next(rows, ()))
+        while headers and headers[-1] is None:
+            headers.pop()
+        sample = [list(row[:len(headers)]) + [None] * (len(headers) - len(row)) for row in rows]
+        sample = [row for row in sample if any(v is not None for v in row)]
+        return {"sheets": sheets, "sheet": ws.title, "headers": headers, "rows": sample}
+    finally:
+        workbook.close()
+
+
+def preview(fileobj, db=None, sample_rows: int = DEFAULT_SAMPLE_ROWS, sheet: Optional[str] = None,
+            fmt: str = "xlsx", encoding: Optional[str] = None) -> dict:
+    if fmt == "xlsx":
+        data = read_sample(fileobj, min(sample_rows, MAX_SAMPLE_ROWS), sheet)
+    else:
+        from .importing import read_sample as read_columnar_sample
+
+        data = read_columnar_sample(fileobj, fmt, min(sample_rows, MAX_SAMPLE_ROWS), encoding)
+    headers, rows = data["headers"], data["rows"]
+    columns = {i: [row[i] for row in rows] for i in range(len(headers))}
+    mapping = detect_mapping(headers, {i: [v for v in vals if v is not None] for i, vals in columns.items()})
+    total_rows = next((s["rows"] for s in data["sheets"] if s["name"] == data["sheet"]), None)
+
+    warnings = []
+    if not any(mapping[f]["column"] for f in IDENTIFYING_FIELDS):
+        warnings.append("No ID, phone, name or username column found; import would create empty leads")
+    elif not mapping["telegram_id"]["column"]:
+        warnings.append("No ID column: import can't skip leads that already exist")
+
+    position = {field: [str(h) for h in headers].index(m["column"]) for field, m in mapping.items() if m["column"]}
+    duplicates = None
+    if "telegram_id" in position:
+        ids = [int(d) for v in columns[position["telegram_id"]] if (d := _digits(v))]
+        existing = existing_telegram_ids(db, set(ids)) if db is not None else set()
+        in_file = sum(count - 1 for count in Counter(ids).values())
+        rate = len([i for i in ids if i in existing]) / len(ids) if ids else 0.0
+        duplicates = {
+            "sample_ids": len(ids),
+            "existing_in_sample": len([i for i in ids if i in existing]),
+            "repeated_in_sample": in_file,
+            "existing_rate": round(rate, 4),
+            "estimated_existing": round(rate * total_rows) if total_rows else None,
+        }
+
+    sample_leads = [
+        {field: (str(row[i]) if row[i] is not None else None) for field, i in position.items()}
+        for row in rows[:5]
+    ]
+
+    return {
+        "sheets": data["sheets"],
+        "sheet": data["sheet"],
+        "total_rows": total_rows,
+        "sampled_rows": len(rows),
+        "headers": [str(h) if h is not None else None for h in headers],
+        "mapping": mapping,
+        "warnings": warnings,
+        "profile": {str(headers[i]): profile_column(values) for i, values in columns.items() if headers[i] is not None},
+        "sample": sample_leads,
+        "duplicates": duplicates,
+    }
@@ -0,0 +1,114 @@
+"""
+Set-based lead deletion.
+
+Leads are never loaded to be deleted. A batch purge works in bounded chunks
+of lead IDs, each chunk delimited by an upper ID bound so the statements use
+subqueries instead of giant IN (...) lists:
+
+    DELETE FROM interactions WHERE lead_id IN (SELECT id FROM leads WHERE batch_id = :b AND id <= :upper)
+    DELETE FROM leads WHERE batch_id = :b AND id <= :upper
+
+and each chunk is committed on its own, so locks are short. When the
+database enforces ON DELETE CASCADE for a dependent table, the explicit
+child delete is skipped and the cascade does the work.
+"""
+from sqlalchemy import delete, func, inspect, select, text, update
+from sqlalchemy.orm import Session
+
+from .database import Lead, LeadBatch, ArchivedLead, LEAD_DEPENDENTS, SessionLocal
+
+CHUNK_SIZE = 1000
+
+_cascade_cache = {}
+
+
+def _cascades(db: Session, model) -> bool:
+    """Whether deleting a lead already deletes `model` rows through ON DELETE CASCADE."""
+    bind = db.get_bind()
+    key = (str(bind.url), model.__table__.name)
+    if key not in _cascade_cache:
+        foreign_keys = inspect(bind).get_foreign_keys(model.__table__.name)
+        enabled = any(
+            fk["referred_table"] == Lead.__tablename__
+            and (fk.get("options") or {}).get("ondelete", "").upper() == "CASCADE"
+            for fk in foreign_keys
+        )
+        if enabled and bind.dialect.name == "sqlite":
+            enabled = bool(db.execute(text("PRAGMA foreign_keys")).scalar())
+        _cascade_cache[key] = enabled
+    return _cascade_cache[key]
+
+
+def _delete_leads(db: Session, condition):
+    """Delete leads matching `condition` plus their dependents (unless the FK cascades)."""
+    lead_ids = select(Lead.id).where(condition)
+    for model in LEAD_DEPENDENTS:
+        if not _cascades(db, model):
+            db.execute(delete(model).where(model.lead_id.in_(lead_ids)).execution_options(synchronize_session=False))
+    return db.execute(delete(Lead).where(condition).execution_options(synchronize_session=False)).rowcount
+
+
+def _delete_cold_leads(db: Session, condition) -> int:
+    """Same for leads compacted into the cold tier (no foreign keys there)."""
+    lead_ids = select(ArchivedLead.id).where(condition)
+    for model in LEAD_DEPENDENTS:
+        # Hot tables with a lead FK can't hold rows for cold leads
+        if not model.__table__.c.lead_id.foreign_keys:
+            db.execute(delete(model).where(model.lead_id.in_(lead_ids)).execution_options(synchronize_session=False))
+    return db.execute(delete(ArchivedLead).where(condition).execution_options(synchronize_session=False)).rowcount
+
+
+def delete_lead(db: Session, lead_id: int) -> bool:
+    """Permanently delete one lead and its history, hot or cold. Caller commits."""
+    if _delete_leads(db, Lead.id == lead_id) > 0:
+        return True
+    return _delete_cold_leads(db, ArchivedLead.id == lead_id) > 0
+
+
+def purge_batch_leads(db: Session, batch_id: int, job=None, chunk_size: int = CHUNK_SIZE) -> int:
+    """Delete all leads of a batch in committed chunks. Returns the number of leads deleted."""
+    total = db.execute(select(func.count(Lead.id)).where(Lead.batch_id == batch_id)).scalar()
+    if job:
+        job.update(progress=0, total=total)
+    deleted = 0
+    while True:
+        upper = db.execute(
+            select(Lead.id).where(Lead.batch_id == batch_id).order_by(Lead.id).offset(chunk_size - 1).limit(1)
+        ).scalar()
+        if upper is None:
+            upper = db.execute(select(func.max(Lead.id)).where(Lead.batch_id == batch_id)).scalar()
+        if upper is None:
+            break
+        deleted += _delete_leads(db, (Lead.batch_id == batch_id) & (Lead.id <= upper))
+        db.commit()
+        if job:
+            job.update(progress=deleted)
+    deleted += _delete_cold_leads(db, ArchivedLead.batch_id == batch_id)
+    db.commit()
+    return deleted
+
+
+def delete_batch(db: Session, batch_id: int, delete_leads: bool = False, job=None) -> int:
+    """Delete a batch, purging or unlinking its leads. Returns the number of leads deleted."""
+    deleted = 0
+    if delete_leads:
+        deleted = purge_batch_leads(db, batch_id, job)
+    else:
+        # Just unlink leads from batch
+        for model in (Lead, ArchivedLead):
+            db.execute(
+                update(model).where(model.batch_id == batch_id).values(batch_id=None)
+                .execution_options(synchronize_session=False)
+            )
+    db.execute(delete(LeadBatch).where(LeadBatch.id == batch_id))
+    db.commit()
+    return deleted
+
+
+def delete_batch_job(job, batch_id: int, delete_leads: bool) -> dict:
+    """Background job wrapper for delete_batch()."""
+    db = SessionLocal()
+    try:
+        return {"deleted_leads": delete_batch(db, batch_id, delete_leads, job)}
+    finally:
+        db.close()
@@ -0,0 +1,160 @@
+"""
+Read-replica routing.
+
+When DATABASE_REPLICA_URL is set, read-only GET endpoints take their session
+from get_read_db, which opens it on a replica engine. Everything else stays
+on the primary engine in api/database.py: writes, GETs that refresh derived
+tables on the way (batch detail, funnel analytics), background jobs and
+auth lookups. Without the variable get_read_db is get_db.
+
+Read-your-writes: ReadYourWritesMiddleware pins a client to the primary for
+REPLICA_PIN_SECONDS (default 5) after any successful POST/PUT/PATCH/DELETE.
+So a manager who moves a lead and reloads the board sees the move even
+while the replica is behind. The pin is taken when the response starts,
+before the client can send its next request. Clients are identified by
+their bearer token, falling back to the remote address. Pins live in
+process memory, like the login rate limiter. With several API processes,
+either route a client to one process (sticky sessions) or accept that the
+pin only covers the process that handled the write.
+
+Local testing with two SQLite files: the replica connection runs with
+PRAGMA query_only, so an endpoint that writes through it fails loudly.
+
+    python -m api.replicas sync
+
+copies the primary file onto the replica through the SQLite backup API,
+standing in for replication. Between syncs the replica lags like a real one.
+With two PostgreSQL instances, make the second a streaming-replication
+standby (or a logical subscriber) of the first and point
+DATABASE_REPLICA_URL at it.
+"""
+import hashlib
+import os
+import sys
+import threading
+import time
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+from . import database
+
+REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+PIN_SECONDS = float(os.getenv("REPLICA_PIN_SECONDS", "5"))
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+MAX_PINS = 10000
+
+_engine = None
+_ReplicaSession = None
+_engine_lock = threading.Lock()
+_pins = {}
+_pins_lock = threading.Lock()
+
+
+def configured() -> bool:
+    return bool(REPLICA_URL)
+
+
+def get_replica_engine():
+    """The replica engine, created on first use with the same profile logic as the primary."""
+    global _engine, _ReplicaSession
+    with _engine_lock:
+        if _engine is None:
+            _engine = database.make_engine(REPLICA_URL)
+            if _engine.dialect.name == "sqlite":
+                @event.listens_for(_engine, "connect")
+                def _read_only(dbapi_conn, conn_record):
+                    dbapi_conn.execute("PRAGMA query_only=ON")
+            _ReplicaSession = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+        return _engine
+
+
+# --- Read-your-writes pins ---
+
+def client_key(scope) -> str:
+    for name, value in scope.get("headers") or ():
+        if name == b"authorization":
+            return hashlib.sha256(value).hexdigest()[:32]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def pin(key: str, seconds: float = None) -> None:
+    now = time.monotonic()
+    with _pins_lock:
+        if len(_pins) >= MAX_PINS:
+            for stale in [k for k, until in _pins.items() if until <= now]:
+                del _pins[stale]
+        _pins[key] = now + (PIN_SECONDS if seconds is None else seconds)
+
+
+def pinned(key: str) -> bool:
+    with _pins_lock:
+        until = _pins.get(key)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del _pins[key]
+            return False
+        return True
+
+
+class ReadYourWritesMiddleware:
+    """Pins the client to the primary after a successful write."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS or not configured():
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                pin(client_key(scope))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+# --- Sessions ---
+
+def session_factory(scope=None):
+    """Replica sessionmaker for a request, or the primary one when unconfigured or pinned."""
+    if not configured() or (scope is not None and pinned(client_key(scope))):
+        return database.SessionLocal
+    get_replica_engine()
+    return _ReplicaSession
+
+
+def get_read_db(request: Request):
+    db = session_factory(request.scope)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def sync_sqlite() -> str:
+    """Copy the primary SQLite file onto the replica (local testing only)."""
+    primary, replica = database.engine.url, make_url(REPLICA_URL or "")
+    if primary.get_backend_name() != "sqlite" or replica.get_backend_name() != "sqlite":
+        raise SystemExit("sync needs sqlite DATABASE_URL and DATABASE_REPLICA_URL")
+    import sqlite3
+
+    source, target = sqlite3.connect(primary.database), sqlite3.connect(replica.database)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    return replica.database
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["sync"]:
+        sys.exit("usage: python -m api.replicas sync")
+    print(f"Copied the primary database to {sync_sqlite()}")
@@ -0,0 +1,197 @@
+"""
+Shared data access for the API, the Streamlit console (app.py) and the
+reminder scheduler (scheduler.py).
+
+All three open sessions on api.database's engine (the root database.py
+re-exports it), so they see one schema and one set of engine settings:
+pool profile, SQLite pragmas, slow-query log.
+
+Statements are built once per shape and keep every value in a bind
+parameter. A built statement memoizes its cache key, and the engine's
+compiled cache then serves it without recompiling. Building a select()
+and computing its key costs tens of microseconds per call; reusing one
+costs nothing. The lead filters have a handful of shapes (search or not,
+stages or not, owner or not), so each is built on first use and kept.
+
+Writes (insert_leads, record_interaction) leave the commit to the caller.
+
+Only sqlalchemy and sibling modules that need nothing else are imported
+here, so the scheduler and the console start without the web stack or
+pandas.
+"""
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence
+
+from sqlalchemy import bindparam, func, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from . import batch_metrics, transitions
+from .database import ArchivedLead, Interaction, Lead
+
+DEFAULT_STAGE = "Первый контакт"
+ID_CHUNK = 10000
+
+LIST_COLUMNS = (
+    Lead.id, Lead.full_name, Lead.phone, Lead.username, Lead.stage, Lead.manager_name, Lead.updated_at,
+)
+REMINDER_COLUMNS = (
+    Lead.id, Lead.full_name, Lead.phone, Lead.stage, Lead.updated_at, Lead.next_contact_date, Lead.owner_id,
+)
+
+
+def _params(search: Optional[str], stages: Sequence[str], owner_id: Optional[int]) -> dict:
+    params = {}
+    if search:
+        params["search"] = search
+    if stages:
+        params["stages"] = list(stages)
+    if owner_id is not None:
+        params["owner_id"] = owner_id
+    return params
+
+
+@lru_cache(maxsize=None)
+def _lead_filters(search: bool, stages: bool, owner: bool) -> tuple:
+    """WHERE clause of the active-lead lists for one filter shape."""
+    conditions = [Lead.is_archived == False]
+    if owner:
+        conditions.append(Lead.owner_id == bindparam("owner_id"))
+    if search:
+        term = bindparam("search")
+        conditions.append(or_(Lead.full_name.contains(term), Lead.phone.contains(term), Lead.username.contains(term)))
+    if stages:
+        conditions.append(Lead.stage.in_(bindparam("stages", expanding=True)))
+    return tuple(conditions)
+
+
+@lru_cache(maxsize=None)
+def _list_stmt(search: bool, stages: bool, owner: bool):
+    return (
+        select(*LIST_COLUMNS).where(*_lead_filters(search, stages, owner))
+        .order_by(Lead.id).offset(bindparam("offset")).limit(bindparam("limit"))
+    )
+
+
+@lru_cache(maxsize=None)
+def _count_stmt(search: bool, stages: bool, owner: bool):
+    return select(func.count(Lead.id)).where(*_lead_filters(search, stages, owner))
+
+
+@lru_cache(maxsize=None)
+def _stage_counts_stmt(owner: bool):
+    return select(Lead.stage, func.count(Lead.id)).where(*_lead_filters(False, False, owner)).group_by(Lead.stage)
+
+
+@lru_cache(maxsize=None)
+def _stage_cards_stmt(owner: bool):
+    return (
+        select(Lead.id, Lead.full_name, Lead.phone)
+        .where(*_lead_filters(False, False, owner), Lead.stage == bindparam("stage"))
+        .order_by(Lead.updated_at.desc(), Lead.id.desc()).limit(bindparam("limit"))
+    )
+
+
+_DUE_REMINDERS = (
+    select(*REMINDER_COLUMNS)
+    .where(
+        Lead.is_archived == False,
+        Lead.next_contact_date >= bindparam("start"),
+        Lead.next_contact_date < bindparam("end"),
+    )
+    .order_by(Lead.next_contact_date, Lead.id)
+)
+
+_EXISTING_TELEGRAM_IDS = union_all(
+    select(Lead.telegram_id).where(Lead.telegram_id.in_(bindparam("ids", expanding=True))),
+    select(ArchivedLead.telegram_id).where(ArchivedLead.telegram_id.in_(bindparam("ids", expanding=True))),
+)
+
+
+# --- Reads ---
+
+def list_leads(db: Session, search: Optional[str] = None, stages: Sequence[str] = (), owner_id: Optional[int] = None,
+               offset: int = 0, limit: int = 50) -> list:
+    """One page of active leads (LIST_COLUMNS rows), by ID."""
+    stmt = _list_stmt(bool(search), bool(stages), owner_id is not None)
+    return db.execute(stmt, {**_params(search, stages, owner_id), "offset": offset, "limit": limit}).all()
+
+
+def count_leads(db: Session, search: Optional[str] = None, stages: Sequence[str] = (),
+                owner_id: Optional[int] = None) -> int:
+    """Active leads matching the same filters as list_leads()."""
+    stmt = _count_stmt(bool(search), bool(stages), owner_id is not None)
+    return db.execute(stmt, _params(search, stages, owner_id)).scalar()
+
+
+def stage_counts(db: Session, owner_id: Optional[int] = None) -> dict:
+    """{stage: active leads} in one GROUP BY."""
+    return dict(db.execute(_stage_counts_stmt(owner_id is not None), _params(None, (), owner_id)).all())
+
+
+def stage_cards(db: Session, stages: Iterable[str], limit: int, owner_id: Optional[int] = None) -> dict:
+    """{stage: first `limit` (id, full_name, phone) rows, most recently updated first}.
+
+    One LIMIT query per stage, each a range on the board index.
+    """
+    stmt = _stage_cards_stmt(owner_id is not None)
+    params = _params(None, (), owner_id)
+    return {stage: db.execute(stmt, {**params, "stage": stage, "limit": limit}).all() for stage in stages}
+
+
+def due_reminders(db: Session, day: Optional[date] = None) -> list:
+    """Active leads whose next contact falls on `day` (default today), a range on ix_leads_next_contact."""
+    start = datetime.combine(day or date.today(), time.min)
+    return db.execute(_DUE_REMINDERS, {"start": start, "end": start + timedelta(days=1)}).all()
+
+
+def existing_telegram_ids(db: Session, telegram_ids: Iterable[int]) -> set:
+    """Which of telegram_ids already exist, hot or cold, in ID_CHUNK-sized queries."""
+    telegram_ids = list(telegram_ids)
+    existing = set()
+    for i in range(0, len(telegram_ids), ID_CHUNK):
+        existing.update(db.execute(_EXISTING_TELEGRAM_IDS, {"ids": telegram_ids[i:i + ID_CHUNK]}).scalars())
+    return existing
+
+
+# --- Writes ---
+
+def insert_leads(db: Session, rows: List[dict], stage: str = DEFAULT_STAGE, batch_id: Optional[int] = None,
+                 seen_ids: Optional[set] = None) -> int:
+    """Insert normalized import rows with one executemany; returns how many were new.
+
+    Rows whose telegram ID is already stored, or in seen_ids, or earlier in
+    rows are skipped. seen_ids is updated so callers can carry it across
+    chunks and sources. Caller commits.
+    """
+    seen_ids = set() if seen_ids is None else seen_ids
+    ids = {r["telegram_id"] for r in rows if r.get("telegram_id")} - seen_ids
+    seen_ids |= existing_telegram_ids(db, ids)
+    fresh = []
+    for row in rows:
+        telegram_id = row.get("telegram_id")
+        if telegram_id:
+            if telegram_id in seen_ids:
+                continue
+            seen_ids.add(telegram_id)
+        fresh.append({**row, "stage": stage, "batch_id": batch_id})
+    if fresh:
+        db.execute(Lead.__table__.insert(), fresh)
+    return len(fresh)
+
+
+def record_interaction(db: Session, lead: Lead, contact_method: Optional[str], content: Optional[str],
+                       new_stage: Optional[str] = None, next_contact_date: Optional[datetime] = None,
+                       user_id: Optional[int] = None) -> Interaction:
+    """Add an interaction and apply its stage move and next contact date to the lead. Caller commits."""
+    interaction = Interaction(lead_id=lead.id, contact_method=contact_method, content=content)
+    db.add(interaction)
+    if new_stage and new_stage != lead.stage:
+        db.flush()
+        transitions.record(db, lead, new_stage, user_id, interaction.id)
+        batch_metrics.mark_stale(db, [lead.id])
+        lead.stage = new_stage
+    if next_contact_date:
+        lead.next_contact_date = next_contact_date
+    lead.updated_at = datetime.now()
+    return interaction
@@ -0,0 +1,348 @@
+"""
+Daily funnel rollups over stage events.
+
+funnel_daily holds one row per (day, stage, user, batch) with the number of
+moves into and out of the stage and the total time the exiting leads spent
+in it (from the previous event for the lead, or the lead's creation for its
+first move). Analytics read these rows, so a quarter of history is a few
+thousand rows however many interactions there are.
+
+Rollups are recomputed a whole day at a time (upsert the day's aggregates
+on the natural key, drop keys the day no longer has), which makes every run
+idempotent. Only one writer runs at a time: refresh() and rebuild() take a
+lease on the rollup_state row with a conditional UPDATE (locked_until), and
+a refresh that finds it taken skips its turn.
+
+  * refresh(): incremental. Finds the days touched by events past the
+    high-water mark in rollup_state (backfilled events carry old
+    timestamps, so the days come from the events, not from the clock) and
+    recomputes only those. An event ID can commit after a higher one was
+    already counted, so each run also re-scans events stamped within
+    RESCAN_MINUTES before the previous run. The scheduler calls it every
+    minute and the analytics endpoint queues it in the background when
+    there are new events; the endpoint itself only reads.
+  * rebuild(): the backfill, every day that has events, in month windows.
+
+    python -m api.rollups backfill
+
+Purged or merged leads' events change history; refresh() does not notice
+removals, rebuild() does.
+"""
+import os
+import sys
+import time as clock
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import DateTime, delete, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .database import Lead, ArchivedLead, StageEvent, FunnelDaily, RollupState, SessionLocal
+
+STATE_NAME = "funnel_daily"
+REBUILD_WINDOW_DAYS = 31
+RESCAN_MINUTES = int(os.getenv("ROLLUP_RESCAN_MINUTES", "10"))
+LOCK_SECONDS = int(os.getenv("ROLLUP_LOCK_SECONDS", "600"))
+_UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+_KEY = ("day", "stage", "user_id", "batch_id")
+# Pipeline order for conversion; "Пропал" (lost) is reported but is not a step
+FUNNEL_STAGES = [
+    "Новый", "Первое сообщение", "2 сообщение", "3 сообщение", "Заинтересован",
+    "На этапе формирования запроса", "Видеосозвон", "На этапе согласования условий",
+    "Этап договор", "Заключен",
+]
+LOST_STAGE = "Пропал"
+
+
+def _start_of(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _aggregate(db: Session, first_day: date, last_day: date) -> dict:
+    """{(day, stage, user_id, batch_id): [entered, exited, dwell_seconds]} for events in the days."""
+    start, end = _start_of(first_day), _start_of(last_day + timedelta(days=1))
+    in_range = (StageEvent.timestamp >= start) & (StageEvent.timestamp < end)
+    # Previous event per lead needs the lead's whole history, not just the window
+    history = select(
+        StageEvent.lead_id, StageEvent.from_stage, StageEvent.to_stage, StageEvent.user_id, StageEvent.timestamp,
+        func.lag(StageEvent.timestamp, type_=DateTime).over(
+            partition_by=StageEvent.lead_id, order_by=(StageEvent.timestamp, StageEvent.id)
+        ).label("previous"),
+    ).where(StageEvent.lead_id.in_(select(StageEvent.lead_id).where(in_range))).subquery()
+    rows = db.execute(
+        select(
+            history,
+            func.coalesce(Lead.batch_id, ArchivedLead.batch_id),
+            func.coalesce(Lead.created_at, ArchivedLead.created_at),
+        )
+        .outerjoin(Lead, Lead.id == history.c.lead_id)
+        .outerjoin(ArchivedLead, ArchivedLead.id == history.c.lead_id)
+        .where(history.c.timestamp >= start, history.c.timestamp < end)
+    )
+
+    totals = defaultdict(lambda: [0, 0, 0.0])
+    for lead_id, from_stage, to_stage, user_id, timestamp, previous, batch_id, created_at in rows:
+        day, user_id, batch_id = timestamp.date(), user_id or 0, batch_id or 0
+        totals[(day, to_stage, user_id, batch_id)][0] += 1
+        if from_stage:
+            exit_row = totals[(day, from_stage, user_id, batch_id)]
+            exit_row[1] += 1
+            since = previous or created_at
+            if since is not None and since <= timestamp:
+                exit_row[2] += (timestamp - since).total_seconds()
+    return totals
+
+
+def _write(db: Session, rows: list) -> None:
+    upsert = _UPSERTS.get(db.get_bind().dialect.name)
+    if upsert is None:
+        # No ON CONFLICT: rollup_days() deleted the days first, and the lease keeps other writers out
+        db.execute(insert(FunnelDaily), rows)
+        return
+    stmt = upsert(FunnelDaily)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=list(_KEY),
+        set_={c: stmt.excluded[c] for c in ("entered", "exited", "dwell_seconds")},
+    ), rows)
+
+
+def rollup_days(db: Session, first_day: date, last_day: date) -> int:
+    """Recompute the rollup rows for [first_day, last_day]. Returns rows written; caller commits."""
+    totals = _aggregate(db, first_day, last_day)
+    in_days = (FunnelDaily.day >= first_day) & (FunnelDaily.day <= last_day)
+    if db.get_bind().dialect.name not in _UPSERTS:
+        db.execute(delete(FunnelDaily).where(in_days))
+    else:
+        stale = [
+            row_id for row_id, *key in db.execute(
+                select(FunnelDaily.id, *(getattr(FunnelDaily, c) for c in _KEY)).where(in_days)
+            )
+            if tuple(key) not in totals
+        ]
+        if stale:
+            db.execute(delete(FunnelDaily).where(FunnelDaily.id.in_(stale)))
+    if totals:
+        _write(db, [
+            {"day": day, "stage": stage, "user_id": user_id, "batch_id": batch_id,
+             "entered": entered, "exited": exited, "dwell_seconds": dwell}
+            for (day, stage, user_id, batch_id), (entered, exited, dwell) in totals.items()
+        ])
+    return len(totals)
+
+
+def _day_ranges(days):
+    """Collapse a set of days into contiguous (first, last) ranges."""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+
+def _state(db: Session) -> RollupState:
+    state = db.get(RollupState, STATE_NAME, populate_existing=True)
+    if state is None:
+        db.add(RollupState(name=STATE_NAME, last_id=0))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback() # another worker created it first
+        state = db.get(RollupState, STATE_NAME, populate_existing=True)
+    return state
+
+
+def _lease(db: Session, held: bool = False) -> bool:
+    """Take (or, when held, extend) the writer lease. Commits; False if someone else holds it."""
+    now = datetime.now()
+    free = RollupState.locked_until.is_not(None) if held else or_(
+        RollupState.locked_until.is_(None), RollupState.locked_until < now,
+    )
+    claimed = db.execute(
+        update(RollupState).where(RollupState.name == STATE_NAME, free)
+        .values(locked_until=now + timedelta(seconds=LOCK_SECONDS))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return claimed == 1
+
+
+def _release(db: Session, **state) -> None:
+    db.rollback()
+    db.execute(
+        update(RollupState).where(RollupState.name == STATE_NAME).values(locked_until=None, **state)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def pending(db: Session) -> bool:
+    """Whether events past the high-water mark are waiting for a refresh (read-only)."""
+    last_id = db.execute(select(RollupState.last_id).where(RollupState.name == STATE_NAME)).scalar() or 0
+    return db.execute(select(StageEvent.id).where(StageEvent.id > last_id).limit(1)).first() is not None
+
+
+def refreshed_at(db: Session) -> Optional[datetime]:
+    return db.execute(select(RollupState.scanned_at).where(RollupState.name == STATE_NAME)).scalar()
+
+
+def refresh(db: Session) -> Optional[int]:
+    """Roll up the days touched since the last run. Returns days recomputed, or None if another writer runs."""
+    state = _state(db)
+    if not _lease(db):
+        return None
+    scanned = {}
+    try:
+        last_id, since = state.last_id, state.scanned_at
+        started = datetime.now()
+        high = db.execute(select(func.max(StageEvent.id))).scalar() or 0
+        touched = {
+            ts.date() for (ts,) in db.execute(
+                select(StageEvent.timestamp).where(StageEvent.id > last_id, StageEvent.id <= high)
+            )
+        }
+        if since is not None:
+            touched |= {
+                ts.date() for (ts,) in db.execute(
+                    select(StageEvent.timestamp)
+                    .where(StageEvent.timestamp >= since - timedelta(minutes=RESCAN_MINUTES), StageEvent.id <= high)
+                )
+            }
+        for first_day, last_day in _day_ranges(touched):
+            rollup_days(db, first_day, last_day)
+        db.commit()
+        scanned = {"last_id": max(high, last_id), "scanned_at": started}
+        return len(touched)
+    finally:
+        _release(db, **scanned)
+
+
+def refresh_job(job=None) -> dict:
+    db = SessionLocal()
+    try:
+        return {"days": refresh(db)}
+    finally:
+        db.close()
+
+
+def rebuild(db: Session, job=None) -> int:
+    """Recompute every day from scratch. Returns the number of rollup rows written.
+
+    Waits up to LOCK_SECONDS for a running refresh, after which any lease has expired.
+    """
+    _state(db)
+    deadline = clock.monotonic() + LOCK_SECONDS
+    while not _lease(db):
+        if clock.monotonic() > deadline:
+            raise RuntimeError("Funnel rollups are locked by another refresh")
+        clock.sleep(1)
+    scanned = {}
+    try:
+        started = datetime.now()
+        high = db.execute(select(func.max(StageEvent.id))).scalar() or 0
+        first, last = db.execute(select(func.min(StageEvent.timestamp), func.max(StageEvent.timestamp))).one()
+        written = 0
+        if first is None:
+            db.execute(delete(FunnelDaily))
+        else:
+            day, last_day = first.date(), last.date()
+            db.execute(delete(FunnelDaily).where(or_(FunnelDaily.day < day, FunnelDaily.day > last_day)))
+            if job:
+                job.update(progress=0, total=(last_day - day).days + 1)
+            while day <= last_day:
+                window_end = min(day + timedelta(days=REBUILD_WINDOW_DAYS - 1), last_day)
+                written += rollup_days(db, day, window_end)
+                db.commit()
+                _lease(db, held=True)
+                day = window_end + timedelta(days=1)
+                if job:
+                    job.update(progress=(day - first.date()).days)
+        db.commit()
+        scanned = {"last_id": high, "scanned_at": started}
+        return written
+    finally:
+        _release(db, **scanned)
+
+
+def rebuild_job(job) -> dict:
+    db = SessionLocal()
+    try:
+        return {"rows": rebuild(db, job)}
+    finally:
+        db.close()
+
+
+# --- Reads ---
+
+def _filtered(stmt, start: date, end: date, user_id: Optional[int], batch_id: Optional[int]):
+    stmt = stmt.where(FunnelDaily.day >= start, FunnelDaily.day <= end)
+    if user_id is not None:
+        stmt = stmt.where(FunnelDaily.user_id == user_id)
+    if batch_id is not None:
+        stmt = stmt.where(FunnelDaily.batch_id == batch_id)
+    return stmt
+
+
+def _avg_days(dwell_seconds, exited):
+    return round(dwell_seconds / exited / 86400, 2) if exited else None
+
+
+def series(db: Session, start: date, end: date, interval: str = "day", user_id=None, batch_id=None) -> list:
+    """Per-period, per-stage entered/exited counts and average days in stage."""
+    rows = db.execute(_filtered(
+        select(FunnelDaily.day, FunnelDaily.stage, func.sum(FunnelDaily.entered),
+               func.sum(FunnelDaily.exited), func.sum(FunnelDaily.dwell_seconds))
+        .group_by(FunnelDaily.day, FunnelDaily.stage),
+        start, end, user_id, batch_id,
+    ))
+    buckets = defaultdict(lambda: [0, 0, 0.0])
+    for day, stage, entered, exited, dwell in rows:
+        period = day - timedelta(days=day.weekday()) if interval == "week" else day
+        bucket = buckets[(period, stage)]
+        bucket[0] += entered or 0
+        bucket[1] += exited or 0
+        bucket[2] += dwell or 0.0
+    return [
+        {"period": period, "stage": stage, "entered": entered, "exited": exited,
+         "avg_days_in_stage": _avg_days(dwell, exited)}
+        for (period, stage), (entered, exited, dwell) in sorted(buckets.items())
+    ]
+
+
+def funnel(db: Session, start: date, end: date, user_id=None, batch_id=None) -> dict:
+    """Stage-to-stage conversion over the range: entries into each step relative to the step before."""
+    totals = {
+        stage: (entered or 0, exited or 0, dwell or 0.0)
+        for stage, entered, exited, dwell in db.execute(_filtered(
+            select(FunnelDaily.stage, func.sum(FunnelDaily.entered), func.sum(FunnelDaily.exited),
+                   func.sum(FunnelDaily.dwell_seconds)).group_by(FunnelDaily.stage),
+            start, end, user_id, batch_id,
+        ))
+    }
+    steps, previous = [], None
+    for stage in FUNNEL_STAGES:
+        entered, exited, dwell = totals.get(stage, (0, 0, 0.0))
+        steps.append({
+            "stage": stage,
+            "entered": entered,
+            "exited": exited,
+            "avg_days_in_stage": _avg_days(dwell, exited),
+            "conversion": round(entered / previous, 4) if previous else None,
+        })
+        previous = entered
+    lost = totals.get(LOST_STAGE, (0, 0, 0.0))
+    return {"steps": steps, "lost": lost[0]}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m api.rollups backfill")
+    session = SessionLocal()
+    try:
+        print(f"Wrote {rebuild(session)} rollup rows")
+    finally:
+        session.close()
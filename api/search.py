@@ -0,0 +1,314 @@
+"""
+Ranked full-text search over lead bios and interaction notes.
+
+SQLite: an FTS5 table, lead_search, with one row per non-empty bio (rowid
+-lead_id) and one per interaction note (rowid interaction_id), ranked by
+bm25. Keying rows by rowid lets triggers on leads and interactions keep
+it current with point updates. The unicode61 tokenizer folds case but has
+no stemmer. Query terms therefore lose a common Russian ending and then
+match as prefixes: "директора" searches for директор*, which also finds
+"директору". It also treats ё as a letter of its own, so ё is folded to е
+in both the index and the query.
+
+PostgreSQL: GIN expression indexes on to_tsvector('russian', ...) of
+leads.bio and interactions.content, queried with websearch_to_tsquery and
+ranked with ts_rank. The russian configuration stems words itself.
+
+Either way the index is updated incrementally, in the transaction that
+writes the text: an interaction insert, a bulk import's executemany, a
+merge, a purge or an archive move. "Move Stage" notes written by the board
+are left out; they would match every stage name. ensure_index() creates
+whatever is missing and fills a new FTS table from existing rows.
+upgrade_schema() calls it. Only active leads and hot interactions are
+searched; rows compacted into the cold tier (api/archive.py) drop out.
+
+A search ranks leads by their best matching text, counts them, and builds
+snippets for the requested page only (ts_headline re-parses every document
+it is given). Snippets are HTML: the text is escaped and the matched terms
+are wrapped in <mark>.
+
+    python -m api.search rebuild
+"""
+import html
+import re
+import sys
+from typing import List, Optional
+
+from sqlalchemy import Integer, column, distinct, func, literal, literal_column, select, table, text, union_all
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from . import ownership
+from .database import Interaction, Lead, SessionLocal
+from .logs import get_logger
+from .transitions import MOVE_METHOD
+
+logger = get_logger(__name__)
+
+FTS_TABLE = "lead_search"
+PG_CONFIG = "russian"
+PG_INDEXES = {
+    "ix_leads_bio_fts": f"ON leads USING gin (to_tsvector('{PG_CONFIG}', coalesce(bio, '')))",
+    "ix_interactions_content_fts": (
+        f"ON interactions USING gin (to_tsvector('{PG_CONFIG}', coalesce(content, ''))) "
+        f"WHERE coalesce(contact_method, '') <> '{MOVE_METHOD}'"
+    ),
+}
+MATCHES_PER_LEAD = 3
+SNIPPET_WORDS = 16
+# Marker characters around matched terms; replaced by <mark> after escaping
+_START, _STOP = "\x02", "\x03"
+_TERM = re.compile(r"\w+")
+_CYRILLIC = re.compile(r"^[а-я]+$", re.I)
+# Inflection endings trimmed from query terms before prefix matching, longest first
+_ENDINGS = sorted((
+    "ами", "ями", "иями", "ах", "ях", "иях", "ов", "ев", "ей", "ой", "ий", "ый", "ом", "ем", "ам", "ям",
+    "ая", "яя", "ое", "ее", "ые", "ие", "ых", "их", "ым", "им", "ую", "юю",
+    "а", "я", "ы", "и", "у", "ю", "е", "о", "ь",
+), key=len, reverse=True)
+MIN_STEM = 4
+
+fts = table(FTS_TABLE, column(FTS_TABLE), column("lead_id"), column("interaction_id"), column("rank"))
+
+
+class SearchUnavailableError(RuntimeError):
+    pass
+
+
+# --- Index maintenance ---
+
+def _fold_sql(value: str) -> str:
+    return f"replace(replace({value}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+_IS_NOTE = f"coalesce({{0}}.content, '') != '' AND coalesce({{0}}.contact_method, '') != '{MOVE_METHOD}'"
+_INSERT_BIO = f"INSERT INTO {FTS_TABLE}(rowid, body, lead_id) SELECT -{{0}}.id, {_fold_sql('{0}.bio')}, {{0}}.id"
+_INSERT_NOTE = (
+    f"INSERT INTO {FTS_TABLE}(rowid, body, lead_id, interaction_id) "
+    f"SELECT {{0}}.id, {_fold_sql('{0}.content')}, {{0}}.lead_id, {{0}}.id"
+)
+
+SQLITE_TRIGGERS = {
+    "lead_search_leads_insert": (
+        f"AFTER INSERT ON leads BEGIN {_INSERT_BIO.format('new')} WHERE coalesce(new.bio, '') != ''; END"
+    ),
+    "lead_search_leads_update": (
+        f"AFTER UPDATE OF bio ON leads BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = -old.id; "
+        f"{_INSERT_BIO.format('new')} WHERE coalesce(new.bio, '') != ''; END"
+    ),
+    "lead_search_leads_delete": f"AFTER DELETE ON leads BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = -old.id; END",
+    "lead_search_interactions_insert": (
+        f"AFTER INSERT ON interactions BEGIN {_INSERT_NOTE.format('new')} WHERE {_IS_NOTE.format('new')}; END"
+    ),
+    "lead_search_interactions_update": (
+        f"AFTER UPDATE OF content, contact_method, lead_id ON interactions BEGIN "
+        f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; "
+        f"{_INSERT_NOTE.format('new')} WHERE {_IS_NOTE.format('new')}; END"
+    ),
+    "lead_search_interactions_delete": (
+        f"AFTER DELETE ON interactions BEGIN DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END"
+    ),
+}
+
+
+def _fill(conn) -> None:
+    conn.execute(text(f"{_INSERT_BIO.format('leads')} FROM leads WHERE coalesce(leads.bio, '') != ''"))
+    conn.execute(text(f"{_INSERT_NOTE.format('interactions')} FROM interactions WHERE {_IS_NOTE.format('interactions')}"))
+
+
+def _ensure_sqlite(conn) -> List[str]:
+    existing = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")).scalars())
+    if "leads" not in existing or "interactions" not in existing:
+        return []
+    added = []
+    if FTS_TABLE not in existing:
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(body, lead_id UNINDEXED, interaction_id UNINDEXED, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            ))
+        except OperationalError as e:
+            logger.warning("full-text search disabled: SQLite has no FTS5", extra={"error": str(e)})
+            return []
+        _fill(conn)
+        added.append(FTS_TABLE)
+    for name, body in SQLITE_TRIGGERS.items():
+        if name not in existing:
+            conn.execute(text(f"CREATE TRIGGER {name} {body}"))
+            added.append(name)
+    return added
+
+
+def _ensure_postgresql(conn) -> List[str]:
+    existing = set(conn.execute(text("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")).scalars())
+    added = []
+    for name, definition in PG_INDEXES.items():
+        if name not in existing:
+            conn.execute(text(f"CREATE INDEX {name} {definition}"))
+            added.append(name)
+    return added
+
+
+def ensure_index(conn) -> List[str]:
+    """Create the search index for this dialect if it is missing. Returns what was created."""
+    if conn.dialect.name == "sqlite":
+        return _ensure_sqlite(conn)
+    if conn.dialect.name == "postgresql":
+        return _ensure_postgresql(conn)
+    return []
+
+
+def rebuild(db: Session) -> int:
+    """Refill the SQLite FTS table from leads and interactions (PostgreSQL indexes need no rebuild)."""
+    if db.get_bind().dialect.name != "sqlite":
+        return 0
+    conn = db.connection()
+    _ensure_sqlite(conn)
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    _fill(conn)
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    db.commit()
+    return db.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar()
+
+
+# --- Queries ---
+
+def _stem(term: str) -> str:
+    """Drop one inflection ending from a Russian word, keeping at least MIN_STEM letters."""
+    if _CYRILLIC.match(term):
+        for ending in _ENDINGS:
+            if term.lower().endswith(ending) and len(term) - len(ending) >= MIN_STEM:
+                return term[:-len(ending)]
+    return term
+
+
+def fts_query(query: str) -> str:
+    """FTS5 MATCH expression: every word of `query`, stemmed and quoted, as a prefix; all must match."""
+    terms = _TERM.findall(query.replace("ё", "е").replace("Ё", "Е"))
+    if not terms:
+        raise ValueError("Search query has no words")
+    return " ".join(f'"{_stem(term)}"*' for term in terms)
+
+
+def _pg_vector(col):
+    # Spelled like the PG_INDEXES expressions, constants inline, so the planner matches the GIN indexes
+    return func.to_tsvector(literal_column(f"'{PG_CONFIG}'"), func.coalesce(col, literal_column("''")))
+
+
+def _pg_query(query: str):
+    return func.websearch_to_tsquery(literal_column(f"'{PG_CONFIG}'"), query)
+
+
+def _pg_is_note():
+    return func.coalesce(Interaction.contact_method, literal_column("''")).op("<>")(literal_column(f"'{MOVE_METHOD}'"))
+
+
+def _documents(dialect: str, query: str, conditions: list):
+    """(lead_id, score) per matching document of an active lead in scope; higher score ranks first."""
+    if dialect == "sqlite":
+        return (
+            select(fts.c.lead_id.label("lead_id"), (-fts.c.rank).label("score"))
+            .select_from(fts).join(Lead, Lead.id == fts.c.lead_id)
+            .where(fts.c[FTS_TABLE].match(fts_query(query)), *conditions)
+        )
+    if dialect == "postgresql":
+        if not _TERM.search(query):
+            raise ValueError("Search query has no words")
+        tsquery, bio, note = _pg_query(query), _pg_vector(Lead.bio), _pg_vector(Interaction.content)
+        return union_all(
+            select(Lead.id.label("lead_id"), func.ts_rank(bio, tsquery).label("score"))
+            .where(bio.bool_op("@@")(tsquery), *conditions),
+            select(Interaction.lead_id, func.ts_rank(note, tsquery))
+            .join(Lead, Lead.id == Interaction.lead_id)
+            .where(note.bool_op("@@")(tsquery), _pg_is_note(), *conditions),
+        )
+    raise SearchUnavailableError(f"Full-text search is not supported on {dialect}")
+
+
+def _snippet(raw: Optional[str]) -> str:
+    return html.escape(raw or "").replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def _matches(db: Session, dialect: str, query: str, lead_ids: List[int]) -> dict:
+    """{lead_id: [match]} for the page's leads, best first, at most MATCHES_PER_LEAD each."""
+    if dialect == "sqlite":
+        rows = db.execute(
+            select(
+                fts.c.lead_id, fts.c.interaction_id,
+                func.snippet(literal_column(FTS_TABLE), 0, _START, _STOP, "…", SNIPPET_WORDS),
+            )
+            .where(fts.c[FTS_TABLE].match(fts_query(query)), fts.c.lead_id.in_(lead_ids))
+            .order_by(fts.c.rank)
+        )
+    else:
+        tsquery, bio, note = _pg_query(query), _pg_vector(Lead.bio), _pg_vector(Interaction.content)
+        docs = union_all(
+            select(
+                Lead.id.label("lead_id"), literal(None, Integer).label("interaction_id"),
+                Lead.bio.label("body"), func.ts_rank(bio, tsquery).label("score"),
+            ).where(bio.bool_op("@@")(tsquery), Lead.id.in_(lead_ids)),
+            select(Interaction.lead_id, Interaction.id, Interaction.content, func.ts_rank(note, tsquery))
+            .where(note.bool_op("@@")(tsquery), _pg_is_note(), Interaction.lead_id.in_(lead_ids)),
+        ).subquery()
+        ranked = select(
+            docs,
+            func.row_number().over(partition_by=docs.c.lead_id, order_by=docs.c.score.desc()).label("n"),
+        ).subquery()
+        options = f"StartSel={_START}, StopSel={_STOP}, MaxWords={SNIPPET_WORDS}, MinWords=5"
+        rows = db.execute(
+            select(
+                ranked.c.lead_id, ranked.c.interaction_id,
+                func.ts_headline(literal_column(f"'{PG_CONFIG}'"), ranked.c.body, _pg_query(query), options),
+            )
+            .where(ranked.c.n <= MATCHES_PER_LEAD)
+            .order_by(ranked.c.lead_id, ranked.c.n)
+        )
+    matches = {lead_id: [] for lead_id in lead_ids}
+    for lead_id, interaction_id, raw in rows:
+        if len(matches[lead_id]) < MATCHES_PER_LEAD:
+            matches[lead_id].append({
+                "source": "bio" if interaction_id is None else "interaction",
+                "interaction_id": interaction_id,
+                "snippet": _snippet(raw),
+            })
+    return matches
+
+
+def search(db: Session, query: str, owner_id: Optional[int] = None, skip: int = 0, limit: int = 20) -> dict:
+    """One page of leads whose bio or notes match `query`, best match first, with highlighted snippets."""
+    dialect = db.get_bind().dialect.name
+    conditions = [Lead.is_archived == False, *ownership.conditions(Lead, owner_id)]
+    docs = _documents(dialect, query, conditions).subquery()
+    best = func.max(docs.c.score).label("score")
+    total = db.execute(select(func.count(distinct(docs.c.lead_id)))).scalar()
+    page = db.execute(
+        select(docs.c.lead_id, best).group_by(docs.c.lead_id)
+        .order_by(best.desc(), docs.c.lead_id).offset(skip).limit(limit)
+    ).all()
+
+    items = []
+    if page:
+        lead_ids = [lead_id for lead_id, _ in page]
+        leads = {
+            row["id"]: dict(row)
+            for row in db.execute(
+                select(Lead.id, Lead.full_name, Lead.username, Lead.phone, Lead.stage, Lead.owner_id)
+                .where(Lead.id.in_(lead_ids))
+            ).mappings()
+        }
+        matches = _matches(db, dialect, query, lead_ids)
+        items = [
+            {**leads[lead_id], "score": score, "matches": matches[lead_id]}
+            for lead_id, score in page if lead_id in leads
+        ]
+    return {"query": query, "total": total, "skip": skip, "limit": limit, "items": items}
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m api.search rebuild")
+    session = SessionLocal()
+    try:
+        print(f"Indexed {rebuild(session)} documents")
+    finally:
+        session.close()
@@ -0,0 +1,193 @@
+"""
+Opt-in slow-query log with EXPLAIN capture.
+
+Enabled by setting SLOW_QUERY_MS; make_engine()/make_async_engine() then
+install() it on every engine they build. Each statement is timed with two
+perf_counter() calls. One that takes longer than the threshold is, with
+probability SLOW_QUERY_SAMPLE_RATE:
+
+  * logged with its duration, the endpoint that issued it and the *shape* of
+    its bound parameters (types and lengths, never values, since they carry
+    phone numbers and names);
+  * explained on the same connection right away: EXPLAIN QUERY PLAN on
+    SQLite, EXPLAIN (ANALYZE off) on PostgreSQL. Neither executes the
+    statement. On PostgreSQL the EXPLAIN runs inside a savepoint so a failure
+    can't abort the caller's transaction. Plans are cached per statement
+    text for EXPLAIN_TTL seconds, so a hot slow query is explained once, not
+    on every execution;
+  * kept in a ring buffer of the last SLOW_QUERY_BUFFER entries, served by
+    GET /api/admin/slow-queries.
+
+    SLOW_QUERY_MS            threshold in ms; unset disables the recorder
+    SLOW_QUERY_SAMPLE_RATE   fraction of slow statements recorded (default 1.0)
+    SLOW_QUERY_BUFFER        ring buffer size (default 200)
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import event
+
+from .logs import get_logger
+from .metrics import current_stats
+
+logger = get_logger(__name__)
+
+EXPLAIN_TTL = 300
+MAX_STATEMENT_CHARS = 4000
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms, sample_rate=1.0, capacity=200):
+        self.threshold = threshold_ms / 1000
+        self.sample_rate = sample_rate
+        self.entries = deque(maxlen=capacity)
+        self.seen = 0
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def should_record(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def cached_plan(self, statement):
+        with self._lock:
+            cached = self._plans.get(statement)
+        if cached and time.monotonic() - cached[0] < EXPLAIN_TTL:
+            return cached[1]
+        return None
+
+    def remember_plan(self, statement, plan):
+        with self._lock:
+            if len(self._plans) > 1000:
+                self._plans.clear()
+            self._plans[statement] = (time.monotonic(), plan)
+
+    def add(self, entry):
+        with self._lock:
+            self.seen += 1
+            self.entries.append(entry)
+
+    def snapshot(self, limit=None):
+        with self._lock:
+            entries = list(self.entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self._plans.clear()
+
+
+recorder = None
+
+
+def configured():
+    """The recorder from SLOW_QUERY_* settings, or None when disabled."""
+    global recorder
+    threshold = os.getenv("SLOW_QUERY_MS")
+    if not threshold:
+        return None
+    if recorder is None:
+        recorder = SlowQueryLog(
+            _env_float("SLOW_QUERY_MS", threshold),
+            sample_rate=_env_float("SLOW_QUERY_SAMPLE_RATE", 1.0),
+            capacity=int(_env_float("SLOW_QUERY_BUFFER", 200)),
+        )
+    return recorder
+
+
+def parameter_shape(parameters):
+    """Types (and lengths for strings/sequences) of bound parameters, without values."""
+    def shape(value):
+        if value is None:
+            return "null"
+        name = type(value).__name__
+        if isinstance(value, (str, bytes, list, tuple)):
+            return f"{name}[{len(value)}]"
+        return name
+
+    if isinstance(parameters, dict):
+        return {k: shape(v) for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [shape(v) for v in parameters]
+    return shape(parameters)
+
+
+def explain(conn, statement, parameters):
+    """Plan lines for statement on conn's DBAPI connection (the statement itself is not run)."""
+    dialect = conn.dialect.name
+    raw = conn.connection.dbapi_connection
+    cursor = raw.cursor()
+    try:
+        if dialect == "sqlite":
+            cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        if dialect == "postgresql":
+            cursor.execute("SAVEPOINT slow_query_explain")
+            try:
+                cursor.execute(f"EXPLAIN (ANALYZE off) {statement}", parameters)
+                plan = [row[0] for row in cursor.fetchall()]
+            except Exception:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+                raise
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+            return plan
+        return None
+    finally:
+        cursor.close()
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("slow_query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    log = recorder
+    if log is None or elapsed < log.threshold or not log.should_record():
+        return
+
+    stats = current_stats()
+    entry = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "duration_ms": round(elapsed * 1000, 2),
+        "endpoint": stats.endpoint() if stats else None,
+        "statement": statement[:MAX_STATEMENT_CHARS],
+        "parameters": parameter_shape(parameters[0] if executemany and parameters else parameters),
+        "executemany": executemany,
+        "plan": None,
+    }
+    if not executemany:
+        plan = log.cached_plan(statement)
+        if plan is None:
+            try:
+                plan = explain(conn, statement, parameters)
+                log.remember_plan(statement, plan)
+            except Exception as e:
+                entry["explain_error"] = str(e)[:500]
+        entry["plan"] = plan
+    log.add(entry)
+    logger.warning("slow query", extra={k: v for k, v in entry.items() if k != "plan"})
+
+
+def install(engine):
+    """Time statements on engine (sync, or the sync side of an async engine) if enabled."""
+    engine = getattr(engine, "sync_engine", engine)
+    if configured() is None or event.contains(engine, "after_cursor_execute", _after_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_execute)
+    event.listen(engine, "after_cursor_execute", _after_execute)
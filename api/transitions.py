@@ -0,0 +1,161 @@
+"""
+Structured stage-transition events.
+
+Every funnel move is one stage_events row (lead, from, to, user, time), so
+outreach and conversion metrics are range counts on
+ix_stage_events_to_stage_time instead of LIKE scans over interaction text.
+
+  * record(): a single move, from add_interaction (alongside the
+    "Move Stage" interaction the board writes);
+  * move_leads(): bulk moves, set-based: one INSERT ... SELECT for the
+    interactions, one for the events, one UPDATE for the leads. Events
+    find their interactions by the IDs RETURNING gave back, or by a
+    per-call tag where the dialect has no RETURNING, never by timestamp;
+  * backfill(): rebuilds events from existing "Moved from X to Y"
+    interactions, hot and cold, in ID-ordered chunks. Each event keeps its
+    interaction_id, so reruns skip what was already converted.
+
+    python -m api.transitions backfill
+"""
+import re
+import sys
+from datetime import datetime
+from typing import Iterable, Optional
+from uuid import uuid4
+
+from sqlalchemy import and_, distinct, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from .database import Lead, Interaction, ArchivedInteraction, StageEvent, SessionLocal
+
+MOVE_METHOD = "Move Stage"
+OUTREACH_STAGE = "Первое сообщение"
+CONVERSION_STAGE = "Заключен"
+CHUNK_SIZE = 5000
+
+_MOVE_TEXT = re.compile(r"^Moved from (.*) to (.+)$", re.S)
+
+
+def parse_move(content: Optional[str]):
+    """(from_stage, to_stage) from "Moved from X to Y", or None."""
+    match = _MOVE_TEXT.match(content or "")
+    if not match:
+        return None
+    return match.group(1).strip() or None, match.group(2).strip()
+
+
+def record(db: Session, lead: Lead, to_stage: str, user_id=None, interaction_id=None, source="interaction"):
+    """Add the event for moving `lead` to `to_stage` (call before changing lead.stage). Caller commits."""
+    if not to_stage or lead.stage == to_stage:
+        return None
+    event = StageEvent(
+        lead_id=lead.id, from_stage=lead.stage, to_stage=to_stage, user_id=user_id,
+        timestamp=datetime.now(), source=source, interaction_id=interaction_id,
+    )
+    db.add(event)
+    return event
+
+
+def move_leads(db: Session, lead_ids: Iterable[int], to_stage: str, user_id=None, source="bulk") -> int:
+    """Move leads to `to_stage` with one event and one "Move Stage" interaction each. Caller commits."""
+    lead_ids = list(lead_ids)
+    if not lead_ids:
+        return 0
+    now = datetime.now()
+    moving = and_(Lead.id.in_(lead_ids), Lead.stage.is_distinct_from(to_stage))
+    # Without RETURNING, this call's interactions carry a one-off method until their events are linked
+    returning = db.get_bind().dialect.insert_returning
+    method = MOVE_METHOD if returning else f"{MOVE_METHOD}:{uuid4().hex}"
+    write = insert(Interaction).from_select(
+        ["lead_id", "timestamp", "contact_method", "content"],
+        select(
+            Lead.id, literal(now), literal(method),
+            literal("Moved from ") + func.coalesce(Lead.stage, "") + literal(f" to {to_stage}"),
+        ).where(moving),
+    )
+    if returning:
+        written = Interaction.id.in_(db.execute(write.returning(Interaction.id)).scalars().all())
+    else:
+        db.execute(write)
+        written = and_(Interaction.lead_id.in_(lead_ids), Interaction.contact_method == method)
+    # Events point at the interactions just written, so backfill() won't convert them again
+    db.execute(insert(StageEvent).from_select(
+        ["lead_id", "from_stage", "to_stage", "user_id", "timestamp", "source", "interaction_id"],
+        select(
+            Lead.id, Lead.stage, literal(to_stage), literal(user_id), literal(now), literal(source), Interaction.id,
+        ).join(Interaction, Interaction.lead_id == Lead.id)
+        .where(moving, written),
+    ))
+    if not returning:
+        db.execute(
+            update(Interaction).where(written).values(contact_method=MOVE_METHOD)
+            .execution_options(synchronize_session=False)
+        )
+    return db.execute(
+        update(Lead).where(moving).values(stage=to_stage, updated_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def count_moves(db: Session, to_stage: str, start: datetime, end: Optional[datetime] = None,
+                user_id: Optional[int] = None) -> int:
+    """Distinct leads moved into `to_stage` in [start, end), by one user unless user_id is None."""
+    stmt = select(func.count(distinct(StageEvent.lead_id))).where(
+        StageEvent.to_stage == to_stage, StageEvent.timestamp >= start,
+    )
+    if end is not None:
+        stmt = stmt.where(StageEvent.timestamp < end)
+    if user_id is not None:
+        stmt = stmt.where(StageEvent.user_id == user_id)
+    return db.execute(stmt).scalar() or 0
+
+
+def _backfill_table(db: Session, model, chunk_size: int, job=None) -> int:
+    created, last_id = 0, 0
+    converted = select(StageEvent.interaction_id).where(StageEvent.interaction_id == model.id).exists()
+    while True:
+        rows = db.execute(
+            select(model.id, model.lead_id, model.timestamp, model.content)
+            .where(model.id > last_id, model.contact_method == MOVE_METHOD, ~converted)
+            .order_by(model.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            return created
+        events = []
+        for interaction_id, lead_id, timestamp, content in rows:
+            move = parse_move(content)
+            if move and lead_id is not None:
+                events.append({
+                    "lead_id": lead_id, "from_stage": move[0], "to_stage": move[1],
+                    "timestamp": timestamp or datetime.now(), "source": "backfill", "interaction_id": interaction_id,
+                })
+        if events:
+            db.execute(insert(StageEvent), events)
+        db.commit()
+        created += len(events)
+        last_id = rows[-1][0]
+        if job:
+            job.update(progress=created)
+
+
+def backfill(db: Session, chunk_size: int = CHUNK_SIZE, job=None) -> int:
+    """Create events for "Move Stage" interactions that don't have one yet. Returns events created."""
+    return sum(_backfill_table(db, model, chunk_size, job) for model in (Interaction, ArchivedInteraction))
+
+
+def backfill_job(job) -> dict:
+    db = SessionLocal()
+    try:
+        return {"created": backfill(db, job=job)}
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["backfill"]:
+        sys.exit("usage: python -m api.transitions backfill")
+    session = SessionLocal()
+    try:
+        print(f"Created {backfill(session)} stage events")
+    finally:
+        session.close()
@@ -1,111 +1,149 @@
 import streamlit as st
 import pandas as pd
-from database import get_db, init_db, Lead, Interaction
-from sqlalchemy.orm import Session
+from database import SessionLocal, init_db, Lead, Interaction
+from api import repository
+from sqlalchemy import select
 import plotly.express as px
 from datetime import datetime
 
-# Initialize DB
-init_db()
-
 st.set_page_config(page_title="B2B Sales Tracker", layout="wide")
 
-# Helper Functions
-def load_data(db: Session):
-    return db.query(Lead).all()
+STAGES = ["Первый контакт", "Презентация предложения", "Переговоры", "Заключение сделки"]
+PAGE_SIZES = [50, 100, 200]
+CARDS_PER_STAGE = 20
+# Reads are cached per argument set; writes from this app clear them, the TTL bounds staleness
+# when something else (the API, the scheduler) writes to the same database
+CACHE_TTL = 30
+
+# Labels for repository.LIST_COLUMNS, in order
+CONTACT_COLUMNS = ["ID", "Имя", "Телефон", "Username", "Этап", "Менеджер", "Последнее обновление"]
+
+
+@st.cache_resource
+def get_sessionmaker():
+    """Create tables once per server process, not on every rerun."""
+    init_db()
+    return SessionLocal
+
+
+# Cached reads: each opens its own short session and returns plain data
+
+@st.cache_data(ttl=CACHE_TTL)
+def stage_counts():
+    with get_sessionmaker()() as db:
+        return repository.stage_counts(db)
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def interaction_count():
+    with get_sessionmaker()() as db:
+        return db.query(Interaction).count()
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def contacts_page(search, stages, page, page_size):
+    """One page of the contacts grid (projected columns) and the filtered total."""
+    with get_sessionmaker()() as db:
+        total = repository.count_leads(db, search, stages)
+        rows = repository.list_leads(db, search, stages, offset=page * page_size, limit=page_size)
+    return pd.DataFrame(rows, columns=CONTACT_COLUMNS), total
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def stage_cards(limit):
+    """First `limit` cards of every stage, most recently updated first."""
+    with get_sessionmaker()() as db:
+        return repository.stage_cards(db, STAGES, limit)
+
+
+def clear_read_caches():
+    for cached in (stage_counts, interaction_count, contacts_page, stage_cards):
+        cached.clear()
+
+
+# Writes
+
+def lead_summary(lead_id):
+    with get_sessionmaker()() as db:
+        return db.execute(select(Lead.id, Lead.full_name, Lead.stage).where(Lead.id == lead_id)).first()
+
+
+def save_interaction(lead_id, method, content, new_stage, next_contact):
+    """Interaction plus the lead's stage move and next contact date, in one transaction."""
+    with get_sessionmaker()() as db:
+        repository.record_interaction(db, db.get(Lead, lead_id), method, content, new_stage, next_contact)
+        db.commit()
+    clear_read_caches()
+
+
+def import_leads(uploaded_file):
+    """Parse the workbook column-wise and insert the new leads with one executemany."""
+    from api import importing  # pandas/openpyxl readers, only needed on this page
+
+    uploaded_file.seek(0)
+    rows = importing.parse_rows(uploaded_file, "xlsx")
+    with get_sessionmaker()() as db:
+        count = repository.insert_leads(db, rows)
+        db.commit()
+    clear_read_caches()
+    return count
 
-def save_interaction(db: Session, lead_id, method, content):
-    interaction = Interaction(lead_id=lead_id, contact_method=method, content=content)
-    db.add(interaction)
-    
-    # Update last contact date (optional logic)
-    lead = db.query(Lead).filter(Lead.id == lead_id).first()
-    lead.updated_at = datetime.now()
-    
-    db.commit()
 
 # Sidebar
 st.sidebar.title("Меню")
 page = st.sidebar.radio("Перейти к", ["Дашборд", "Контакты", "Воронка продаж", "Импорт", "Настройки"])
 
-# Database session
-db = next(get_db())
-
 if page == "Дашборд":
     st.title("Дашборд эффективности")
-    
-    leads = db.query(Lead).all()
-    if not leads:
+
+    counts = stage_counts()
+    if not counts:
         st.info("Нет данных. Пожалуйста, импортируйте контакты.")
     else:
         col1, col2, col3 = st.columns(3)
-        col1.metric("Всего лидов", len(leads))
-        
-        # Interactions count
-        interaction_count = db.query(Interaction).count()
-        col2.metric("Всего взаимодействий", interaction_count)
-        
-        # Leads by Stage
-        df_leads = pd.DataFrame([l.__dict__ for l in leads])
-        if 'stage' in df_leads.columns:
-            stage_counts = df_leads['stage'].value_counts()
-            col3.metric("Этапов воронки", len(stage_counts))
-            
-            st.subheader("Лиды по этапам")
-            fig = px.bar(stage_counts, x=stage_counts.index, y=stage_counts.values, labels={'x': 'Этап', 'y': 'Количество'})
-            st.plotly_chart(fig)
+        col1.metric("Всего лидов", sum(counts.values()))
+        col2.metric("Всего взаимодействий", interaction_count())
+        col3.metric("Этапов воронки", len(counts))
+
+        st.subheader("Лиды по этапам")
+        by_stage = pd.Series(counts).sort_values(ascending=False)
+        fig = px.bar(by_stage, x=by_stage.index, y=by_stage.values, labels={'x': 'Этап', 'y': 'Количество'})
+        st.plotly_chart(fig)
 
 elif page == "Контакты":
     st.title("База контактов")
-    
+
     # Filters
     search = st.text_input("Поиск (Имя, Телефон, Username)")
-    stage_filter = st.multiselect("Фильтр по этапу", ["Первый контакт", "Презентация предложения", "Переговоры", "Заключение сделки"])
-    
-    query = db.query(Lead)
-    if search:
-        query = query.filter((Lead.full_name.contains(search)) | (Lead.phone.contains(search)) | (Lead.username.contains(search)))
-    if stage_filter:
-        query = query.filter(Lead.stage.in_(stage_filter))
-        
-    leads = query.all()
-    
-    # Display as dataframe
-    data = []
-    for l in leads:
-        data.append({
-            "ID": l.id,
-            "Имя": l.full_name,
-            "Телефон": l.phone,
-            "Username": l.username,
-            "Этап": l.stage,
-            "Менеджер": l.manager_name,
-            "Последнее обновление": l.updated_at
-        })
-    
-    df = pd.DataFrame(data)
+    stage_filter = st.multiselect("Фильтр по этапу", STAGES)
+
+    col_size, col_page = st.columns(2)
+    page_size = col_size.selectbox("Строк на странице", PAGE_SIZES)
+    # Page numbers are 1-based in the UI
+    page_number = col_page.number_input("Страница", min_value=1, step=1)
+    df, total = contacts_page(search, tuple(stage_filter), int(page_number) - 1, page_size)
+
+    start = (int(page_number) - 1) * page_size
+    st.caption(f"Показано {start + 1 if len(df) else 0}–{start + len(df)} из {total}")
     st.dataframe(df, use_container_width=True)
-    
+
     # Interaction Form
     st.subheader("Добавить взаимодействие")
     selected_lead_id = st.number_input("ID Лида", min_value=1, step=1)
-    
+
     if selected_lead_id:
-        lead = db.query(Lead).filter(Lead.id == selected_lead_id).first()
+        lead = lead_summary(int(selected_lead_id))
         if lead:
             st.write(f"Выбран лид: **{lead.full_name}**")
             with st.form("interaction_form"):
                 method = st.selectbox("Способ связи", ["Телефон", "Email", "Мессенджер", "Встреча"])
                 content = st.text_area("Содержание разговора")
-                new_stage = st.selectbox("Обновить этап", ["Первый контакт", "Презентация предложения", "Переговоры", "Заключение сделки"], index=["Первый контакт", "Презентация предложения", "Переговоры", "Заключение сделки"].index(lead.stage) if lead.stage in ["Первый контакт", "Презентация предложения", "Переговоры", "Заключение сделки"] else 0)
+                new_stage = st.selectbox("Обновить этап", STAGES, index=STAGES.index(lead.stage) if lead.stage in STAGES else 0)
                 next_contact = st.date_input("Дата следующего контакта")
-                
+
                 submitted = st.form_submit_button("Сохранить")
                 if submitted:
-                    save_interaction(db, lead.id, method, content)
-                    lead.stage = new_stage
-                    lead.next_contact_date = datetime.combine(next_contact, datetime.min.time())
-                    db.commit()
+                    save_interaction(lead.id, method, content, new_stage, datetime.combine(next_contact, datetime.min.time()))
                     st.success("Взаимодействие сохранено!")
                     st.rerun()
         else:
@@ -113,75 +151,55 @@ elif page == "Контакты":
 
 elif page == "Воронка продаж":
     st.title("Воронка продаж")
-    
-    leads = db.query(Lead).all()
-    if leads:
-        df = pd.DataFrame([l.__dict__ for l in leads])
-        if 'stage' in df.columns:
-            funnel_data = df['stage'].value_counts().reset_index()
-            funnel_data.columns = ['stage', 'count']
-            
-            # Sort by custom order
-            stage_order = ["Первый контакт", "Презентация предложения", "Переговоры", "Заключение сделки"]
-            funnel_data['stage'] = pd.Categorical(funnel_data['stage'], categories=stage_order, ordered=True)
-            funnel_data = funnel_data.sort_values('stage')
-            
-            fig = px.funnel(funnel_data, x='count', y='stage', title='Воронка продаж')
-            st.plotly_chart(fig)
-            
-            # Show leads in each stage (Kanban-like simplified)
-            st.subheader("Детализация по этапам")
-            cols = st.columns(4)
-            for i, stage in enumerate(stage_order):
-                with cols[i]:
-                    st.markdown(f"### {stage}")
-                    stage_leads = [l for l in leads if l.stage == stage]
-                    for l in stage_leads:
-                        st.info(f"**{l.full_name}**\n\n{l.phone or 'Нет телефона'}")
+
+    counts = stage_counts()
+    if counts:
+        # Sort by custom order
+        funnel_data = pd.DataFrame({'stage': STAGES, 'count': [counts.get(stage, 0) for stage in STAGES]})
+
+        fig = px.funnel(funnel_data, x='count', y='stage', title='Воронка продаж')
+        st.plotly_chart(fig)
+
+        # Show leads in each stage (Kanban-like simplified)
+        st.subheader("Детализация по этапам")
+        cards = stage_cards(CARDS_PER_STAGE)
+        cols = st.columns(len(STAGES))
+        for i, stage in enumerate(STAGES):
+            with cols[i]:
+                st.markdown(f"### {stage}")
+                for _, full_name, phone in cards[stage]:
+                    st.info(f"**{full_name}**\n\n{phone or 'Нет телефона'}")
+                hidden = counts.get(stage, 0) - len(cards[stage])
+                if hidden > 0:
+                    st.caption(f"и ещё {hidden}")
 
 elif page == "Импорт":
     st.title("Импорт данных")
-    
+
     uploaded_file = st.file_uploader("Загрузите Excel файл", type=["xlsx"])
-    
+
     if uploaded_file:
         df = pd.read_excel(uploaded_file)
         st.write("Предпросмотр данных:")
         st.dataframe(df.head())
-        
+
         if st.button("Импортировать в базу"):
-            count = 0
-            for index, row in df.iterrows():
-                # Check for existing
-                existing = None
-                if 'ID' in row and pd.notna(row['ID']):
-                     existing = db.query(Lead).filter(Lead.telegram_id == row['ID']).first()
-                
-                if not existing:
-                    lead = Lead(
-                        telegram_id=row.get('ID'),
-                        phone=str(row.get('Номер телефона')) if pd.notna(row.get('Номер телефона')) else None,
-                        full_name=row.get('Полное имя'),
-                        username=row.get('Юзернейм'),
-                        bio=row.get('Описание профиля'),
-                        stage="Первый контакт"
-                    )
-                    db.add(lead)
-                    count += 1
-            
-            db.commit()
-            st.success(f"Успешно импортировано {count} контактов!")
+            try:
+                count = import_leads(uploaded_file)
+            except ValueError as e:
+                st.error(f"Не удалось импортировать файл: {e}")
+            else:
+                st.success(f"Успешно импортировано {count} контактов!")
 
 elif page == "Настройки":
     st.title("Настройки")
     st.info("Здесь будет конфигурация Telegram бота.")
-    
+
     tg_token = st.text_input("Telegram Bot Token", type="password")
     chat_id = st.text_input("Ваш Chat ID для уведомлений")
-    
+
     if st.button("Сохранить настройки"):
         # Save to a .env file or DB (mock for now)
         with open(".env", "a") as f:
             f.write(f"\nTG_TOKEN={tg_token}\nCHAT_ID={chat_id}")
         st.success("Настройки сохранены")
-
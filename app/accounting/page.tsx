@@ -5,6 +5,15 @@ import ProtectedLayout from "@/components/ProtectedLayout";
 import api from "@/lib/api";
 import { Package, Upload, Trash2, Calendar, FileSpreadsheet, Users, AlertCircle } from "lucide-react";
 
+interface BatchMetrics {
+    leads: number;
+    contacted_share: number;
+    converted: number;
+    conversion_rate: number;
+    median_hours_to_first_contact: number | null;
+    stale: boolean;
+}
+
 interface LeadBatch {
     id: number;
     name: string;
@@ -12,8 +21,11 @@ interface LeadBatch {
     file_name: string | null;
     imported_at: string;
     count: number;
+    metrics: BatchMetrics | null;
 }
 
+const percent = (value: number) => `${(value * 100).toFixed(1)}%`;
+
 export default function AccountingPage() {
     const [batches, setBatches] = useState<LeadBatch[]>([]);
     const [loading, setLoading] = useState(true);
@@ -194,6 +206,9 @@ export default function AccountingPage() {
                                     <th className="px-6 py-4 text-left text-xs font-semibold text-slate-400 uppercase tracking-wider">
                                         Лидов
                                     </th>
+                                    <th className="px-6 py-4 text-left text-xs font-semibold text-slate-400 uppercase tracking-wider">
+                                        Конверсия
+                                    </th>
                                     <th className="px-6 py-4 text-left text-xs font-semibold text-slate-400 uppercase tracking-wider">
                                         Дата импорта
                                     </th>
@@ -229,6 +244,23 @@ export default function AccountingPage() {
                                                 {batch.count}
                                             </span>
                                         </td>
+                                        <td className="px-6 py-4">
+                                            {batch.metrics ? (
+                                                <div className="text-sm">
+                                                    <div className="text-white">
+                                                        {percent(batch.metrics.conversion_rate)}
+                                                        <span className="text-slate-500"> ({batch.metrics.converted})</span>
+                                                    </div>
+                                                    <div className="text-xs text-slate-500">
+                                                        Контакт: {percent(batch.metrics.contacted_share)}
+                                                        {batch.metrics.median_hours_to_first_contact !== null &&
+                                                            ` · ${batch.metrics.median_hours_to_first_contact.toFixed(0)} ч до первого`}
+                                                    </div>
+                                                </div>
+                                            ) : (
+                                                <span className="text-slate-500 text-sm">—</span>
+                                            )}
+                                        </td>
                                         <td className="px-6 py-4">
                                             <div className="flex items-center gap-2 text-slate-400 text-sm">
                                                 <Calendar className="w-4 h-4" />
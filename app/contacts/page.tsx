@@ -2,7 +2,7 @@
 
 import { useEffect, useState, useMemo } from "react";
 import ProtectedLayout from "@/components/ProtectedLayout";
-import api from "@/lib/api";
+import api, { leadScope } from "@/lib/api";
 import { Upload, Search, Users, Calendar, ChevronDown, ArrowUpDown, X } from "lucide-react";
 
 const STAGES = [
@@ -48,7 +48,7 @@ export default function ContactsPage() {
 
   const fetchLeads = async () => {
     try {
-      const res = await api.get("/leads");
+      const res = await api.get("/leads", { params: { scope: await leadScope() } });
       setLeads(res.data);
     } catch (err) {
       console.error(err);
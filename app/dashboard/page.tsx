@@ -2,7 +2,7 @@
 
 import { useEffect, useState } from "react";
 import ProtectedLayout from "@/components/ProtectedLayout";
-import api from "@/lib/api";
+import api, { leadScope } from "@/lib/api";
 import { BarChart, Bar, XAxis, YAxis, Tooltip, CartesianGrid, ResponsiveContainer, Cell } from 'recharts';
 import { ArrowUpRight, TrendingUp, MessageCircle, Kanban, Target, Users, Zap, Calendar, Activity, Send, CheckCircle, Clock, Archive, RotateCcw, Trash2, User } from "lucide-react";
 import KanbanBoard from "@/components/KanbanBoard";
@@ -17,7 +17,9 @@ export default function Dashboard() {
   const [loadingArchive, setLoadingArchive] = useState(false);
 
   useEffect(() => {
-    api.get("/stats").then((res) => setStats(res.data));
+    leadScope()
+      .then((scope) => api.get("/stats", { params: { scope } }))
+      .then((res) => setStats(res.data));
   }, []);
 
   useEffect(() => {
@@ -29,7 +31,7 @@ export default function Dashboard() {
   const fetchArchivedLeads = async () => {
     setLoadingArchive(true);
     try {
-      const res = await api.get("/leads?include_archived=true");
+      const res = await api.get("/leads", { params: { include_archived: true, scope: await leadScope() } });
       setArchivedLeads(res.data.filter((l: any) => l.is_archived));
     } catch (e) {
       console.error(e);
@@ -0,0 +1,105 @@
+"""
+Allocation engine throughput: several managers claiming from one lead pool in parallel.
+
+Seeds an unassigned Cold pool, then runs --workers threads that each keep
+claiming --batch leads for their own transaction until the pool is empty.
+Reports claims/s and leads/s, and fails if any lead was assigned twice or
+left behind.
+
+    python -m benchmarks.allocation_throughput --leads 20000 --workers 16 --batch 25
+
+Uses a throwaway SQLite file unless --database-url is given. Run against
+PostgreSQL to exercise FOR UPDATE SKIP LOCKED.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+def _run(args):
+    from sqlalchemy import func
+    from api import allocation, database
+    from api.database import SessionLocal, Lead, LeadTransaction
+
+    database.init_db()
+    db = SessionLocal()
+    tag = f"alloc_{int(time.time() * 1000)}"
+    db.execute(Lead.__table__.insert(), [
+        {"full_name": f"{tag} {i}", "stage": "Новый", "is_archived": False} for i in range(args.leads)
+    ])
+    db.commit()
+    db.close()
+
+    claimed = []
+    claims = 0
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.workers)
+
+    def worker(n):
+        nonlocal claims
+        barrier.wait()
+        while True:
+            session = SessionLocal()
+            try:
+                tx = LeadTransaction(user_id=None, recipient=f"{tag}_manager_{n}", package_type="Cold", count=args.batch)
+                session.add(tx)
+                session.flush()
+                ids = allocation.claim_leads(session, tx.id, tx.recipient, args.batch, package_type="Cold")
+                session.commit()
+            finally:
+                session.close()
+            if not ids:
+                return
+            with lock:
+                claims += 1
+                claimed.extend(ids)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.workers)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    left = db.query(func.count(Lead.id)).filter(Lead.full_name.like(f"{tag} %"), Lead.transaction_id.is_(None)).scalar()
+    db.close()
+
+    print(f"workers={args.workers} batch={args.batch} leads={args.leads}")
+    print(f"claims={claims} leads_claimed={len(claimed)} elapsed={elapsed:.2f}s "
+          f"({claims / elapsed:.0f} claims/s, {len(claimed) / elapsed:.0f} leads/s)")
+
+    failures = []
+    if len(claimed) != len(set(claimed)):
+        failures.append(f"{len(claimed) - len(set(claimed))} leads assigned twice")
+    if left:
+        failures.append(f"{left} leads left unassigned")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--batch", type=int, default=25)
+    parser.add_argument("--database-url")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        return _run(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'alloc.db')}"
+        return _run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Concurrency benchmark: throughput of mixed read/write traffic against the API.
+
+Runs the FastAPI app in-process (httpx ASGI transport) on a throwaway SQLite
+database and fires concurrent requests: reads (/api/stats, /api/leads/count,
+/api/users/me) mixed with writes (/api/distribute).
+
+    python -m benchmarks.async_concurrency --requests 2000 --concurrency 50 --write-ratio 0.2
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _setup_env(db_path):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("ADMIN_PASSWORD", "Bench@2024Secure!Password")
+
+
+def _seed_leads(count):
+    """Unassigned Cold-pool leads for /api/distribute to claim."""
+    from api.database import SessionLocal, Lead
+
+    db = SessionLocal()
+    try:
+        db.execute(Lead.__table__.insert(), [{"full_name": f"Lead {i}", "stage": "Новый", "is_archived": False} for i in range(count)])
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _run(args):
+    import httpx
+    from api.index import app, on_startup
+
+    on_startup()
+    _seed_leads(args.leads)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        resp = await client.post("/api/token", data={"username": "admin", "password": os.environ["ADMIN_PASSWORD"]})
+        resp.raise_for_status()
+        headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+        rng = random.Random(args.seed)
+        plan = ["write" if rng.random() < args.write_ratio else "read" for _ in range(args.requests)]
+        read_paths = ["/api/stats", "/api/leads/count", "/api/users/me"]
+        latencies = {"read": [], "write": []}
+        errors = 0
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(kind):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                if kind == "write":
+                    r = await client.post("/api/distribute", headers=headers,
+                                          json={"recipient": "bench", "package_type": "Cold", "count": 1})
+                else:
+                    r = await client.get(rng.choice(read_paths), headers=headers)
+                latencies[kind].append(time.perf_counter() - start)
+                if r.status_code >= 400:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(kind) for kind in plan))
+        elapsed = time.perf_counter() - start
+
+    print(f"requests={args.requests} concurrency={args.concurrency} write_ratio={args.write_ratio}")
+    print(f"elapsed={elapsed:.2f}s throughput={args.requests / elapsed:.1f} req/s errors={errors}")
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        p95 = values[int(len(values) * 0.95) - 1] if len(values) > 1 else values[0]
+        print(f"  {kind:5s} n={len(values):5d} p50={statistics.median(values) * 1000:.1f}ms p95={p95 * 1000:.1f}ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--leads", type=int, default=5000, help="unassigned leads to seed for distribution")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _setup_env(os.path.join(tmp, "bench.db"))
+        asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
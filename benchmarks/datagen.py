@@ -0,0 +1,182 @@
+"""
+Deterministic synthetic data for benchmarks.
+
+generate() fills a database with users, import batches, leads and their
+interaction history: leads walk through the Kanban funnel and every step is
+a "Move Stage" interaction worded exactly like the board writes it
+("Moved from X to Y"), interleaved with free-text notes. write_xlsx()
+produces upload files in the member-export layout /api/import reads, or in
+the Example_leads.xlsx layout.
+
+Same seed -> same data.
+"""
+import io
+import random
+from datetime import datetime, timedelta
+
+# Funnel order used by components/KanbanBoard.tsx
+STAGES = [
+    "Новый", "Первое сообщение", "2 сообщение", "3 сообщение", "Заинтересован",
+    "На этапе формирования запроса", "Пропал", "Видеосозвон",
+    "На этапе согласования условий", "Этап договор", "Заключен",
+]
+FIRST_NAMES = ["Александр", "Сергей", "Дмитрий", "Андрей", "Алексей", "Мария", "Елена", "Ольга", "Анна", "Наталья"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков", "Фёдоров"]
+BIOS = [
+    "Эксперт | Коммерческая недвижимость | Москва и МО",
+    "Премиальная недвижимость | Москва | Дубай",
+    "Брокер | Новостройки | ипотека",
+    "Инвестиции в недвижимость",
+    None,
+]
+NOTES = [
+    ("Telegram", "Отправил презентацию проекта"),
+    ("Звонок", "Не дозвонился, перезвонить завтра"),
+    ("Telegram", "Интересует 2 спальни, бюджет до 25 млн"),
+    ("Встреча", "Обсудили условия, ждёт договор"),
+]
+MEMBER_COLUMNS = ["ID", "Номер телефона", "Полное имя", "Юзернейм", "Описание профиля", "Премиум", "Бот", "Статус", "Дата сбора"]
+EXAMPLE_COLUMNS = ["Телефон", "ФИО", "Запрос", "Дата"]
+CHUNK_SIZE = 10000
+
+
+def _person(rng, i):
+    full_name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    return {
+        "telegram_id": 5 * 10 ** 9 + i,
+        "phone": f"79{rng.randrange(10 ** 9):09d}" if rng.random() < 0.6 else None,
+        "full_name": full_name,
+        "username": f"@{full_name.split()[1].lower()}_{i}" if rng.random() < 0.85 else None,
+        "bio": rng.choice(BIOS),
+    }
+
+
+def _insert(db, table, rows):
+    for i in range(0, len(rows), CHUNK_SIZE):
+        db.execute(table.insert(), rows[i:i + CHUNK_SIZE])
+
+
+def generate(db, leads=10000, interactions_per_lead=3, batches=5, users=5, seed=42, now=None, password_hash=None):
+    """Insert a deterministic dataset. Returns counts of what was created."""
+    from api.database import User, LeadBatch, Lead, Interaction
+    from api.dedupe import lead_keys
+
+    rng = random.Random(seed)
+    now = now or datetime.now().replace(microsecond=0)
+
+    _insert(db, User.__table__, [
+        {"username": f"bench_user_{u}", "hashed_password": password_hash or "!", "role": "manager", "balance": 1000}
+        for u in range(users)
+    ])
+    _insert(db, LeadBatch.__table__, [
+        {"name": f"Синтетический импорт {b}", "file_name": f"members_{b}.xlsx",
+         "imported_at": now - timedelta(days=90 - b), "count": 0}
+        for b in range(batches)
+    ])
+    db.flush()
+    batch_ids = [b.id for b in db.query(LeadBatch.id).order_by(LeadBatch.id.desc()).limit(batches)]
+    user_ids = dict(db.query(User.username, User.id).filter(User.username.like("bench_user_%")))
+
+    lead_rows, walks = [], []
+    batch_counts = {}
+    for i in range(leads):
+        created = now - timedelta(days=rng.randrange(1, 90), minutes=rng.randrange(1440))
+        steps = min(len(STAGES) - 1, int(rng.expovariate(0.6)))
+        batch_id = batch_ids[i % len(batch_ids)] if batch_ids else None
+        batch_counts[batch_id] = batch_counts.get(batch_id, 0) + 1
+        lead = _person(rng, i)
+        manager = f"bench_user_{rng.randrange(users)}" if users and steps else None
+        lead.update(
+            stage=STAGES[steps],
+            manager_name=manager,
+            owner_id=user_ids.get(manager),
+            created_at=created,
+            updated_at=created,
+            next_contact_date=now + timedelta(days=rng.randrange(-3, 14)) if rng.random() < 0.3 else None,
+            is_archived=rng.random() < 0.05,
+            batch_id=batch_id,
+            **lead_keys(lead["phone"], lead["username"], lead["full_name"]),
+        )
+        lead_rows.append(lead)
+        walks.append(steps)
+    _insert(db, Lead.__table__, lead_rows)
+    db.flush()
+    for batch_id, count in batch_counts.items():
+        if batch_id is not None:
+            db.query(LeadBatch).filter(LeadBatch.id == batch_id).update({"count": count})
+
+    first_id = db.query(Lead.id).order_by(Lead.id.desc()).limit(1).scalar() - leads + 1
+    interaction_rows = []
+    for offset, (lead, steps) in enumerate(zip(lead_rows, walks)):
+        when = lead["created_at"]
+        span = max(1, int((now - when).total_seconds()))
+        for step in range(steps):
+            when = when + timedelta(seconds=rng.randrange(span // (steps + 1) + 1))
+            interaction_rows.append({
+                "lead_id": first_id + offset, "timestamp": when, "contact_method": "Move Stage",
+                "content": f"Moved from {STAGES[step]} to {STAGES[step + 1]}",
+            })
+        for _ in range(max(0, interactions_per_lead - steps)):
+            method, content = rng.choice(NOTES)
+            interaction_rows.append({
+                "lead_id": first_id + offset, "contact_method": method, "content": content,
+                "timestamp": lead["created_at"] + timedelta(seconds=rng.randrange(span)),
+            })
+    _insert(db, Interaction.__table__, interaction_rows)
+    db.commit()
+    return {"users": users, "batches": batches, "leads": leads, "interactions": len(interaction_rows)}
+
+
+def xlsx_rows(rows, seed=42, id_offset=0, layout="members"):
+    """Rows for an upload file, as a list of dicts keyed by the file's column names."""
+    rng = random.Random(seed)
+    collected = datetime(2025, 10, 6, 16, 46, 24)
+    data = []
+    for i in range(rows):
+        person = _person(rng, id_offset + i)
+        if layout == "example":
+            data.append({
+                "Телефон": float(person["phone"] or f"79{rng.randrange(10 ** 9):09d}"),
+                "ФИО": person["full_name"],
+                "Запрос": rng.choice(NOTES)[1],
+                "Дата": (collected + timedelta(days=i % 30)).date(),
+            })
+            continue
+        data.append({
+            "ID": person["telegram_id"],
+            "Номер телефона": float(person["phone"]) if person["phone"] else None,
+            "Полное имя": person["full_name"],
+            "Юзернейм": person["username"],
+            "Описание профиля": person["bio"],
+            "Премиум": rng.choice(["Да", "Нет"]),
+            "Бот": "Нет",
+            "Статус": "MEMBER",
+            "Дата сбора": collected + timedelta(seconds=i),
+        })
+    return data
+
+
+def write_xlsx(rows, seed=42, id_offset=0, layout="members") -> bytes:
+    """An .xlsx upload mimicking a member export (or Example_leads.xlsx with layout="example")."""
+    import pandas as pd
+
+    columns = EXAMPLE_COLUMNS if layout == "example" else MEMBER_COLUMNS
+    buffer = io.BytesIO()
+    pd.DataFrame(xlsx_rows(rows, seed, id_offset, layout), columns=columns).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def write_upload(rows, fmt="xlsx", seed=42, id_offset=0, layout="members", encoding="utf-8") -> bytes:
+    """The same upload as write_xlsx, as xlsx, csv (';'-separated, in `encoding`) or parquet."""
+    import pandas as pd
+
+    if fmt == "xlsx":
+        return write_xlsx(rows, seed, id_offset, layout)
+    columns = EXAMPLE_COLUMNS if layout == "example" else MEMBER_COLUMNS
+    frame = pd.DataFrame(xlsx_rows(rows, seed, id_offset, layout), columns=columns)
+    if fmt == "csv":
+        return frame.to_csv(index=False, sep=";").encode(encoding)
+    buffer = io.BytesIO()
+    frame.to_parquet(buffer, index=False)
+    return buffer.getvalue()
+
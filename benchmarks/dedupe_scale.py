@@ -0,0 +1,112 @@
+"""
+Duplicate detection at scale.
+
+Inserts --leads synthetic leads (without blocking keys) of which --dup-rate
+are re-imports of an earlier lead with a different phone format, username
+case or missing ID, then times the full background job: key backfill and
+the blocked duplicate scan.
+
+    python -m benchmarks.dedupe_scale --leads 1000000 --dup-rate 0.05
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def _phone_variant(rng, digits):
+    formats = [
+        lambda d: d,
+        lambda d: "+" + d,
+        lambda d: "8" + d[1:],
+        lambda d: f"+7 ({d[1:4]}) {d[4:7]}-{d[7:9]}-{d[9:]}",
+    ]
+    return rng.choice(formats)(digits)
+
+
+def _generate(rng, count, dup_rate):
+    originals = []
+    for i in range(count):
+        if originals and rng.random() < dup_rate:
+            src = rng.choice(originals)
+            yield {
+                "telegram_id": None,
+                "phone": _phone_variant(rng, src["digits"]) if src["digits"] and rng.random() < 0.7 else None,
+                "username": src["username"].upper() if src["username"] else None,
+                "full_name": src["full_name"],
+                "bio": src["bio"],
+                "stage": "Новый",
+                "is_archived": False,
+            }
+            continue
+        digits = f"79{rng.randrange(10 ** 9):09d}" if rng.random() < 0.6 else None
+        username = f"@user_{i}" if rng.random() < 0.8 else None
+        full_name = f"Имя{rng.randrange(5000)} Фамилия{rng.randrange(20000)}"
+        bio = f"Брокер | Недвижимость | {rng.randrange(100000)}" if rng.random() < 0.5 else None
+        originals.append({"digits": digits, "username": username, "full_name": full_name, "bio": bio})
+        if len(originals) > 50000:
+            originals.pop(0)
+        yield {
+            "telegram_id": 10 ** 9 + i,
+            "phone": digits,
+            "username": username,
+            "full_name": full_name,
+            "bio": bio,
+            "stage": "Новый",
+            "is_archived": False,
+        }
+
+
+def _run(args):
+    from api import database, dedupe, jobs
+    from api.database import SessionLocal, Lead
+
+    database.init_db()
+    rng = random.Random(args.seed)
+    db = SessionLocal()
+    start = time.perf_counter()
+    chunk = []
+    for row in _generate(rng, args.leads, args.dup_rate):
+        chunk.append(row)
+        if len(chunk) == 10000:
+            db.execute(Lead.__table__.insert(), chunk)
+            chunk = []
+    if chunk:
+        db.execute(Lead.__table__.insert(), chunk)
+    db.commit()
+    db.close()
+    print(f"inserted {args.leads} leads in {time.perf_counter() - start:.1f}s")
+
+    job = jobs.create_job("dedupe_scan")
+    start = time.perf_counter()
+    jobs.run_job(job, dedupe.scan_job)
+    elapsed = time.perf_counter() - start
+    if job.status != "done":
+        print(f"FAIL: {job.error}")
+        return 1
+    grouped = sum(len(g) for g in job.result["groups"])
+    print(f"backfilled={job.result['backfilled']} groups={job.result['group_count']} "
+          f"leads_in_groups={grouped} elapsed={elapsed:.1f}s ({args.leads / elapsed:.0f} leads/s)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=200000)
+    parser.add_argument("--dup-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        return _run(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'dedupe.db')}"
+        return _run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Import format benchmark: rows/sec for xlsx, csv and parquet on the same data.
+
+One synthetic member export (benchmarks/datagen.py) is written in every
+format, then
+  * parse: api.importing.parse_rows (read + mapping detection + normalization),
+    the CPU-bound part of an import
+  * import: end-to-end POST /api/import through the test client, which adds
+    the duplicate check and inserts
+are timed per format. Each import uses fresh IDs so nothing is skipped.
+
+    python -m benchmarks.import_formats --rows 50000 --repeat 3
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from . import datagen
+
+FORMATS = ("xlsx", "csv", "parquet")
+
+
+def _parse_rate(data, fmt, repeat):
+    from api import importing
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = importing.parse_rows(io.BytesIO(data), fmt)
+        times.append(time.perf_counter() - start)
+    return len(rows) / statistics.median(times), statistics.median(times)
+
+
+def _run(args):
+    from fastapi.testclient import TestClient
+    from api import database
+    from api.index import app
+
+    database.init_db()
+    print(f"rows={args.rows} repeat={args.repeat}")
+    print(f"{'format':8s} {'bytes':>11s} {'parse s':>9s} {'parse rows/s':>13s} {'import s':>9s} {'import rows/s':>14s}")
+    with TestClient(app) as client:
+        token = client.post("/api/token", data={"username": "admin", "password": os.environ["ADMIN_PASSWORD"]}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for n, fmt in enumerate(args.formats):
+            data = datagen.write_upload(args.rows, fmt)
+            rate, elapsed = _parse_rate(data, fmt, args.repeat)
+
+            upload = datagen.write_upload(args.rows, fmt, id_offset=(n + 1) * args.rows)
+            start = time.perf_counter()
+            resp = client.post("/api/import", headers=headers, files={"file": (f"bench.{fmt}", upload)})
+            import_elapsed = time.perf_counter() - start
+            imported = resp.json().get("imported_count", 0) if resp.status_code == 200 else 0
+            if imported != args.rows:
+                print(f"  {fmt}: imported {imported} of {args.rows} ({resp.status_code} {resp.text[:200]})")
+            print(f"{fmt:8s} {len(data):11d} {elapsed:9.2f} {rate:13.0f} {import_elapsed:9.2f} {args.rows / import_elapsed:14.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'import_formats.db')}"
+        os.environ.setdefault("ADMIN_PASSWORD", "Bench@2024Secure!Password")
+        _run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
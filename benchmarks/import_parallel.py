@@ -0,0 +1,84 @@
+"""
+Multi-source import benchmark: parse throughput against process pool size.
+
+Writes --files member exports (benchmarks/datagen.py, distinct IDs) to a
+temporary directory and
+  * parses all of them with api.importing.parse_source in spawned process
+    pools of each --workers size (1 means inline, no pool),
+  * runs api.importing.import_many_job once end to end (pool parse + the
+    single writer) with IMPORT_WORKERS set to the largest size,
+reporting rows/sec. Parse throughput should scale with workers up to the
+number of cores; the writer stays serial.
+
+    python -m benchmarks.import_parallel --files 8 --rows 20000 --workers 1 2 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from . import datagen
+
+
+def _parse_all(sources, workers):
+    from api import importing
+
+    start = time.perf_counter()
+    if workers == 1:
+        rows = sum(len(importing.parse_source(s)) for s in sources)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            # Warm the workers up so interpreter start-up isn't counted as parsing
+            list(pool.map(abs, range(workers)))
+            start = time.perf_counter()
+            rows = sum(len(r) for r in pool.map(importing.parse_source, sources))
+    return rows, time.perf_counter() - start
+
+
+def _run(args, tmp):
+    from api import database, importing, jobs
+
+    database.init_db()
+    files = []
+    for i in range(args.files):
+        path = os.path.join(tmp, f"{i}.{args.format}")
+        with open(path, "wb") as f:
+            f.write(datagen.write_upload(args.rows, args.format, seed=i, id_offset=i * args.rows))
+        files.append({"path": path, "file_name": f"export_{i}.{args.format}", "format": args.format})
+    sources = importing.sources(files)
+
+    print(f"files={args.files} rows/file={args.rows} format={args.format} cpus={os.cpu_count()}")
+    print(f"{'workers':>7s} {'parse s':>9s} {'rows/s':>10s} {'speedup':>8s}")
+    base = None
+    for workers in args.workers:
+        rows, elapsed = _parse_all(sources, workers)
+        base = base or elapsed
+        print(f"{workers:7d} {elapsed:9.2f} {rows / elapsed:10.0f} {base / elapsed:7.2f}x")
+
+    os.environ["IMPORT_WORKERS"] = str(max(args.workers))
+    job = jobs.create_job("import_many")
+    start = time.perf_counter()
+    result = importing.import_many_job(job, files)
+    elapsed = time.perf_counter() - start
+    print(f"import_many_job workers={max(args.workers)}: {result['imported_count']} leads in {elapsed:.2f}s "
+          f"({result['imported_count'] / elapsed:.0f} rows/s, {result['failed']} failed)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--format", choices=("xlsx", "csv", "parquet"), default="xlsx")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'import_parallel.db')}"
+        _run(args, tmp)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
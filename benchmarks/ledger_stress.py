@@ -0,0 +1,117 @@
+"""
+Multi-threaded stress test for the balance ledger.
+
+Hundreds of threads debit the same user concurrently. Demand is larger than
+the starting balance, so many debits must be refused. Afterwards we check:
+
+  * the balance never went negative,
+  * final balance == starting balance - successful debits (no lost updates),
+  * there is exactly one ledger entry per successful debit.
+
+    python -m benchmarks.ledger_stress --threads 200 --debits-per-thread 5 --balance 500
+
+Uses a throwaway SQLite file unless --database-url is given (e.g. a scratch PostgreSQL).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+
+def _run(args):
+    from api import database, ledger
+    from api.database import SessionLocal, User, BalanceLedgerEntry
+
+    database.init_db()
+    db = SessionLocal()
+    user = User(username=f"stress_{int(time.time() * 1000)}", hashed_password="x", balance=args.balance)
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+
+    successes = 0
+    refusals = 0
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def worker():
+        nonlocal successes, refusals
+        barrier.wait()
+        for _ in range(args.debits_per_thread):
+            session = SessionLocal()
+            try:
+                ledger.debit(session, user_id, args.amount, "stress")
+                session.commit()
+                with lock:
+                    successes += 1
+            except ledger.InsufficientBalanceError:
+                session.rollback()
+                with lock:
+                    refusals += 1
+            except Exception as e:
+                session.rollback()
+                with lock:
+                    errors.append(repr(e))
+            finally:
+                session.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    final_balance = db.get(User, user_id).balance
+    entries = db.query(BalanceLedgerEntry).filter(BalanceLedgerEntry.user_id == user_id).count()
+    total = ledger.ledger_total(db, user_id)
+    db.close()
+
+    attempts = args.threads * args.debits_per_thread
+    print(f"attempts={attempts} successes={successes} refusals={refusals} errors={len(errors)} "
+          f"elapsed={elapsed:.2f}s ({attempts / elapsed:.0f} debits/s)")
+    print(f"start_balance={args.balance} final_balance={final_balance} ledger_entries={entries} ledger_total={total}")
+
+    failures = []
+    if final_balance < 0:
+        failures.append("balance went negative")
+    if final_balance != args.balance - successes * args.amount:
+        failures.append("lost update: final balance does not match successful debits")
+    if entries != successes or total != -successes * args.amount:
+        failures.append("ledger does not match successful debits")
+    if attempts * args.amount > args.balance and final_balance >= args.amount:
+        failures.append("debits were refused while balance was still available")
+    if errors:
+        failures.append(f"unexpected errors, e.g. {errors[0]}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print("OK")
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--debits-per-thread", type=int, default=5)
+    parser.add_argument("--amount", type=int, default=1)
+    parser.add_argument("--balance", type=int, default=500)
+    parser.add_argument("--database-url")
+    args = parser.parse_args(argv)
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+        return _run(args)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'stress.db')}"
+        return _run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
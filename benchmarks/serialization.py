@@ -0,0 +1,115 @@
+"""
+Serialization benchmark: default FastAPI path vs the fast response layer.
+
+For /api/leads-sized payloads, compares
+  * orm+pydantic: ORM objects -> LeadResponse (from_attributes) -> jsonable JSON (the old path)
+  * rows+orjson:  plain rows -> dicts -> orjson (api/listing.py + FastJSONResponse)
+reporting wall time, CPU time, raw bytes and gzip/brotli bytes, then the
+end-to-end /api/leads latency through the test client with and without
+compression.
+
+    python -m benchmarks.serialization --leads 20000 --interactions 3 --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _seed(n_leads, per_lead):
+    from api.database import SessionLocal, Lead, Interaction
+
+    db = SessionLocal()
+    db.execute(Lead.__table__.insert(), [
+        {
+            "telegram_id": 10 ** 9 + i, "phone": f"7916{i:07d}", "full_name": f"Иван Петров {i}",
+            "username": f"@user_{i}", "bio": "Эксперт | Коммерческая недвижимость | Москва и МО",
+            "stage": "Новый", "is_archived": False,
+        }
+        for i in range(n_leads)
+    ])
+    db.commit()
+    ids = [i for (i,) in db.query(Lead.id)]
+    rows = [
+        {"lead_id": lead_id, "contact_method": "Move Stage", "content": "Moved from Новый to Первое сообщение"}
+        for lead_id in ids for _ in range(per_lead)
+    ]
+    for i in range(0, len(rows), 10000):
+        db.execute(Interaction.__table__.insert(), rows[i:i + 10000])
+    db.commit()
+    db.close()
+
+
+def _measure(fn, repeat):
+    walls, cpus, body = [], [], None
+    for _ in range(repeat):
+        wall, cpu = time.perf_counter(), time.process_time()
+        body = fn()
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return statistics.median(walls), statistics.median(cpus), body
+
+
+def _run(args):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.testclient import TestClient
+    from api import database, listing, responses
+    from api.database import SessionLocal, Lead, Interaction
+    from api.index import app
+    from api.models import LeadResponse
+
+    database.init_db()
+    _seed(args.leads, args.interactions)
+
+    def old_path():
+        db = SessionLocal()
+        try:
+            leads = db.query(Lead).filter(Lead.is_archived == False).all()
+            models = [LeadResponse.model_validate(l) for l in leads]
+            return json.dumps(jsonable_encoder(models), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        finally:
+            db.close()
+
+    def new_path():
+        db = SessionLocal()
+        try:
+            stmt = listing.lead_select(Lead).filter(Lead.is_archived == False)
+            return responses.dumps(listing.lead_dicts(db, stmt, Interaction))
+        finally:
+            db.close()
+
+    print(f"leads={args.leads} interactions/lead={args.interactions} repeat={args.repeat}")
+    print(f"{'path':14s} {'wall ms':>9s} {'cpu ms':>9s} {'bytes':>10s} {'gzip':>9s} {'br':>9s}")
+    for name, fn in (("orm+pydantic", old_path), ("rows+orjson", new_path)):
+        wall, cpu, body = _measure(fn, args.repeat)
+        gz = len(responses.compress(body, "gzip"))
+        br = len(responses.compress(body, "br")) if responses.brotli else None
+        print(f"{name:14s} {wall * 1000:9.1f} {cpu * 1000:9.1f} {len(body):10d} {gz:9d} {br if br is not None else '-':>9}")
+
+    with TestClient(app) as client:
+        token = client.post("/api/token", data={"username": "admin", "password": os.environ["ADMIN_PASSWORD"]}).json()["access_token"]
+        for encoding in ("identity", "gzip", "br"):
+            headers = {"Authorization": f"Bearer {token}", "Accept-Encoding": encoding}
+            wall, _, resp = _measure(lambda: client.get("/api/leads", headers=headers), args.repeat)
+            print(f"GET /api/leads accept-encoding={encoding:8s} {wall * 1000:8.1f} ms "
+                  f"{resp.headers.get('content-length')} bytes on the wire")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=20000)
+    parser.add_argument("--interactions", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'serialization.db')}"
+        os.environ.setdefault("ADMIN_PASSWORD", "Bench@2024Secure!Password")
+        _run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
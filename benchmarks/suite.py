@@ -0,0 +1,216 @@
+"""
+End-to-end API benchmark suite on synthetic data.
+
+Seeds a database with benchmarks/datagen.py, then drives the hot endpoints
+through the test client: lead list (plain, search, stage filter), count,
+stats, board, lead details, interactions, distribution, import and batch
+deletion. Each scenario reports p50/p95/p99 latency and the number of SQL
+statements per request (counted with engine cursor events, sync and async),
+so regressions in both speed and query shape show up.
+
+    python -m benchmarks.suite --leads 20000 --iterations 30
+    python -m benchmarks.suite --save benchmarks/baseline.json
+    python -m benchmarks.suite --compare benchmarks/baseline.json --tolerance 0.25
+
+--compare exits with status 1 when a scenario's p95 got slower than the
+tolerance allows or it issues more queries per request than the baseline.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks import datagen
+
+
+class QueryCounter:
+    """Counts statements executed on the given engines."""
+
+    def __init__(self, *engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def _summary(latencies, queries):
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2),
+        "queries": max(queries),
+    }
+
+
+def _scenarios(ctx):
+    """(name, request builder) pairs; builders take the iteration number and return a response."""
+    client, headers, rng = ctx["client"], ctx["headers"], ctx["rng"]
+    lead_ids = ctx["lead_ids"]
+
+    def post_interaction(i):
+        stage = datagen.STAGES[i % len(datagen.STAGES)]
+        return client.post("/api/interactions", headers=headers, json={
+            "lead_id": rng.choice(lead_ids), "contact_method": "Move Stage",
+            "content": f"Moved to {stage}", "new_stage": stage,
+        })
+
+    def import_file(i):
+        upload = ctx["uploads"][i]
+        response = client.post(
+            "/api/import", headers=headers, params={"batch_name": f"bench import {i}"},
+            files={"file": ("members.xlsx", upload, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")},
+        )
+        ctx["imported_batches"].append(response.json()["batch_id"])
+        return response
+
+    # The admin reads company-wide (scope=all); the *_mine scenarios are one manager's view
+    everyone, mine = {"scope": "all"}, {"owner_id": ctx["manager_id"]}
+    return [
+        ("leads_list", lambda i: client.get("/api/leads", headers=headers, params={"limit": 100, "skip": i * 100, **everyone})),
+        ("leads_search", lambda i: client.get("/api/leads", headers=headers, params={"search": rng.choice(datagen.LAST_NAMES)[:4], "limit": 100, **everyone})),
+        ("leads_stage", lambda i: client.get("/api/leads", headers=headers, params={"stage": datagen.STAGES[i % 5], "limit": 100, **everyone})),
+        ("leads_count", lambda i: client.get("/api/leads/count", headers=headers, params=everyone)),
+        ("stats", lambda i: client.get("/api/stats", headers=headers, params=everyone)),
+        ("board", lambda i: client.get("/api/board", headers=headers, params={"per_column": 50, **everyone})),
+        ("leads_mine", lambda i: client.get("/api/leads", headers=headers, params={"limit": 100, **mine})),
+        ("stats_mine", lambda i: client.get("/api/stats", headers=headers, params=mine)),
+        ("board_mine", lambda i: client.get("/api/board", headers=headers, params={"per_column": 50, **mine})),
+        ("lead_details", lambda i: client.get(f"/api/leads/{rng.choice(lead_ids)}", headers=headers)),
+        ("batches", lambda i: client.get("/api/batches", headers=headers)),
+        ("add_interaction", post_interaction),
+        ("distribute", lambda i: client.post("/api/distribute", headers=headers, json={
+            "recipient": "bench_user_0", "package_type": "Cold", "count": 10,
+        })),
+        ("import", import_file),
+        ("delete_batch", lambda i: client.delete(
+            f"/api/batches/{ctx['imported_batches'][i]}", headers=headers, params={"delete_leads": True},
+        )),
+    ]
+
+
+def run(args):
+    from fastapi.testclient import TestClient
+    from api import database
+    from api.database import SessionLocal, Lead, User
+    from api.index import app
+
+    database.init_db()
+    db = SessionLocal()
+    started = time.perf_counter()
+    created = datagen.generate(
+        db, leads=args.leads, interactions_per_lead=args.interactions,
+        batches=args.batches, users=args.users, seed=args.seed,
+    )
+    lead_ids = [i for (i,) in db.query(Lead.id)]
+    manager_id = db.query(User.id).filter(User.username == "bench_user_0").scalar()
+    db.close()
+    print(f"seeded {created} in {time.perf_counter() - started:.1f}s")
+
+    counter = QueryCounter(database.engine, database.get_async_engine().sync_engine)
+    results = {}
+    with TestClient(app) as client:
+        token = client.post("/api/token", data={"username": "admin", "password": os.environ["ADMIN_PASSWORD"]}).json()["access_token"]
+        ctx = {
+            "client": client, "headers": {"Authorization": f"Bearer {token}"},
+            "rng": random.Random(args.seed), "lead_ids": lead_ids, "manager_id": manager_id, "imported_batches": [],
+            "uploads": [
+                datagen.write_xlsx(args.import_rows, seed=args.seed + i, id_offset=10 ** 8 * (i + 1))
+                for i in range(args.iterations)
+            ],
+        }
+        selected = set(args.only or [])
+        for name, request in _scenarios(ctx):
+            if selected and name not in selected and not (name == "import" and "delete_batch" in selected):
+                continue
+            latencies, queries = [], []
+            for i in range(args.iterations):
+                counter.count = 0
+                start = time.perf_counter()
+                response = request(i)
+                latencies.append(time.perf_counter() - start)
+                queries.append(counter.count)
+                if response.status_code >= 400:
+                    raise SystemExit(f"{name}: HTTP {response.status_code} {response.text[:200]}")
+            results[name] = _summary(latencies, queries)
+
+    return {
+        "config": {k: getattr(args, k) for k in ("leads", "interactions", "batches", "users", "iterations", "import_rows", "seed")},
+        "scenarios": results,
+    }
+
+
+def print_report(report, baseline=None, tolerance=0.2):
+    """Print the results table; returns the names of regressed scenarios."""
+    regressions = []
+    base = (baseline or {}).get("scenarios", {})
+    print(f"{'scenario':16s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'queries':>8s}" + ("  vs baseline" if baseline else ""))
+    for name, s in report["scenarios"].items():
+        line = f"{name:16s} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['p99_ms']:9.1f} {s['queries']:8d}"
+        old = base.get(name)
+        if old:
+            change = (s["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+            line += f"  p95 {change:+.0%}, queries {old['queries']}->{s['queries']}"
+            if change > tolerance or s["queries"] > old["queries"]:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+    if baseline and baseline.get("config") != report["config"]:
+        print(f"note: baseline config differs: {baseline.get('config')}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=20000)
+    parser.add_argument("--interactions", type=int, default=3, help="interactions per lead (stage moves count towards it)")
+    parser.add_argument("--batches", type=int, default=5)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=20, help="requests per scenario")
+    parser.add_argument("--import-rows", type=int, default=2000, help="rows per uploaded file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", nargs="*", help="run only these scenarios")
+    parser.add_argument("--save", metavar="PATH", help="write results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 slowdown before flagging (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'suite.db')}"
+        os.environ.setdefault("ADMIN_PASSWORD", "Bench@2024Secure!Password")
+        report = run(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = print_report(report, baseline, args.tolerance)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"baseline saved to {args.save}")
+    if regressions:
+        print(f"regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,7 @@ import React, { useState, useEffect } from 'react';
 import { DndContext, DragOverlay, closestCorners, KeyboardSensor, PointerSensor, useSensor, useSensors, DragStartEvent, DragEndEvent } from '@dnd-kit/core';
 import { SortableContext, sortableKeyboardCoordinates, verticalListSortingStrategy, useSortable } from '@dnd-kit/sortable';
 import { CSS } from '@dnd-kit/utilities';
-import api from '@/lib/api';
+import api, { leadScope } from '@/lib/api';
 import LeadModal from './LeadModal';
 import { User, AtSign, GripVertical } from 'lucide-react';
 
@@ -114,7 +114,23 @@ function SortableItem({ lead, onClick }: { lead: Lead; onClick: () => void }) {
   );
 }
 
-function DroppableColumn({ id, items, onCardClick }: { id: string; items: Lead[]; onCardClick: (id: number) => void }) {
+const CARDS_PER_COLUMN = 50;
+
+interface BoardColumn {
+  stage: string;
+  total: number;
+  cards: Lead[];
+  next_cursor: string | null;
+}
+
+function DroppableColumn({ id, items, total, hasMore, onLoadMore, onCardClick }: {
+  id: string;
+  items: Lead[];
+  total: number;
+  hasMore: boolean;
+  onLoadMore: () => void;
+  onCardClick: (id: number) => void;
+}) {
   const { setNodeRef } = useSortable({ id });
   const colors = STAGE_COLORS[id] || STAGE_COLORS["Новый"];
 
@@ -128,7 +144,7 @@ function DroppableColumn({ id, items, onCardClick }: { id: string; items: Lead[]
             <span className={`font-semibold text-sm ${colors.text}`}>{id}</span>
           </div>
           <span className={`text-xs font-bold px-2.5 py-1 rounded-full bg-white/10 ${colors.text}`}>
-            {items.length}
+            {total}
           </span>
         </div>
       </div>
@@ -141,6 +157,15 @@ function DroppableColumn({ id, items, onCardClick }: { id: string; items: Lead[]
           ))}
         </SortableContext>
 
+        {hasMore && (
+          <button
+            onClick={onLoadMore}
+            className="w-full py-2 text-xs text-slate-400 hover:text-white rounded-lg bg-white/5 hover:bg-white/10 transition-colors"
+          >
+            Загрузить ещё ({total - items.length})
+          </button>
+        )}
+
         {/* Empty State */}
         {items.length === 0 && (
           <div className="flex flex-col items-center justify-center py-8 text-center">
@@ -157,6 +182,8 @@ function DroppableColumn({ id, items, onCardClick }: { id: string; items: Lead[]
 
 export default function KanbanBoard() {
   const [leads, setLeads] = useState<Lead[]>([]);
+  const [totals, setTotals] = useState<Record<string, number>>({});
+  const [cursors, setCursors] = useState<Record<string, string | null>>({});
   const [activeId, setActiveId] = useState<number | null>(null);
   const [selectedLeadId, setSelectedLeadId] = useState<number | null>(null);
 
@@ -166,13 +193,40 @@ export default function KanbanBoard() {
 
   const fetchLeads = async () => {
     try {
-      const res = await api.get("/leads");
-      setLeads(res.data);
+      const res = await api.get("/board", {
+        params: { per_column: CARDS_PER_COLUMN, stages: STAGES, scope: await leadScope() },
+        paramsSerializer: { indexes: null },
+      });
+      const columns: BoardColumn[] = res.data.columns;
+      setLeads(columns.flatMap(c => c.cards));
+      setTotals(Object.fromEntries(columns.map(c => [c.stage, c.total])));
+      setCursors(Object.fromEntries(columns.map(c => [c.stage, c.next_cursor])));
     } catch (err) {
       console.error("Failed to fetch leads", err);
     }
   };
 
+  const loadMore = async (stage: string) => {
+    const cursor = cursors[stage];
+    if (!cursor) return;
+    try {
+      const res = await api.get("/board", {
+        params: { per_column: CARDS_PER_COLUMN, cursor: [cursor], scope: await leadScope() },
+        paramsSerializer: { indexes: null },
+      });
+      const column: BoardColumn = res.data.columns[0];
+      setLeads(prev => [...prev, ...column.cards.filter(c => !prev.some(l => l.id === c.id))]);
+      setTotals(prev => ({ ...prev, [stage]: column.total }));
+      setCursors(prev => ({ ...prev, [stage]: column.next_cursor }));
+    } catch (err) {
+      console.error("Failed to load more leads", err);
+    }
+  };
+
+  const moveTotal = (from: string, to: string) => {
+    setTotals(prev => ({ ...prev, [from]: (prev[from] || 1) - 1, [to]: (prev[to] || 0) + 1 }));
+  };
+
   const sensors = useSensors(
     useSensor(PointerSensor, {
       activationConstraint: {
@@ -216,6 +270,7 @@ export default function KanbanBoard() {
     setLeads(prev => prev.map(l =>
       l.id === activeLeadId ? { ...l, stage: newStage } : l
     ));
+    moveTotal(oldStage, newStage);
 
     try {
       await api.post("/interactions", {
@@ -230,6 +285,7 @@ export default function KanbanBoard() {
       setLeads(prev => prev.map(l =>
         l.id === activeLeadId ? { ...l, stage: oldStage } : l
       ));
+      moveTotal(newStage, oldStage);
     }
   };
 
@@ -250,6 +306,9 @@ export default function KanbanBoard() {
               key={stage}
               id={stage}
               items={leads.filter(l => l.stage === stage)}
+              total={totals[stage] || 0}
+              hasMore={!!cursors[stage]}
+              onLoadMore={() => loadMore(stage)}
               onCardClick={setSelectedLeadId}
             />
           ))}
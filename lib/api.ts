@@ -14,4 +14,19 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+let cachedScope: { token: string | null; scope: Promise<string> } | null = null;
+
+// Lead lists, the board and stats default to the caller's own leads; admins ask for all of them
+export function leadScope(): Promise<string> {
+  const token = typeof window !== "undefined" ? localStorage.getItem("token") : null;
+  if (!cachedScope || cachedScope.token !== token) {
+    const scope = api
+      .get("/users/me")
+      .then((res) => (res.data.role === "admin" ? "all" : "mine"))
+      .catch(() => "mine");
+    cachedScope = { token, scope };
+  }
+  return cachedScope.scope;
+}
+
 export default api;
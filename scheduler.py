@@ -1,9 +1,8 @@
 import time
 import schedule
-import telebot
 import os
-from database import get_db, Lead
-from datetime import datetime
+from database import SessionLocal
+from api import repository, rollups
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -17,36 +16,44 @@ def send_daily_reminders():
         print("Telegram settings not found. Please configure in the Web UI.")
         return
 
+    # Today's reminders are an index range on next_contact_date, not a scan of every scheduled lead
+    with SessionLocal() as db:
+        leads = repository.due_reminders(db)
+    if not leads:
+        print("No reminders due today.")
+        return
+
+    import telebot  # Only needed once there is something to send
+
     bot = telebot.TeleBot(TG_TOKEN)
-    db = next(get_db())
-    
-    try:
-        today = datetime.now().date()
-        leads = db.query(Lead).filter(Lead.next_contact_date != None).all()
-        
-        count = 0
-        for lead in leads:
-            if lead.next_contact_date.date() == today:
-                message = (
-                    f"🔔 **Напоминание о контакте!**\n\n"
-                    f"👤 Клиент: {lead.full_name}\n"
-                    f"📱 Телефон: {lead.phone}\n"
-                    f"📊 Этап: {lead.stage}\n"
-                    f"📝 Последний раз: {lead.updated_at.strftime('%Y-%m-%d')}"
-                )
-                try:
-                    bot.send_message(CHAT_ID, message, parse_mode="Markdown")
-                    count += 1
-                except Exception as e:
-                    print(f"Failed to send message: {e}")
-        
-        print(f"Sent {count} reminders.")
-        
-    finally:
-        db.close()
+
+    count = 0
+    for lead in leads:
+        message = (
+            f"🔔 **Напоминание о контакте!**\n\n"
+            f"👤 Клиент: {lead.full_name}\n"
+            f"📱 Телефон: {lead.phone}\n"
+            f"📊 Этап: {lead.stage}\n"
+            f"📝 Последний раз: {lead.updated_at.strftime('%Y-%m-%d')}"
+        )
+        try:
+            bot.send_message(CHAT_ID, message, parse_mode="Markdown")
+            count += 1
+        except Exception as e:
+            print(f"Failed to send message: {e}")
+
+    print(f"Sent {count} reminders.")
+
+def refresh_rollups():
+    # Takes the rollup lease itself; skips the turn while another refresh or rebuild holds it
+    with SessionLocal() as db:
+        days = rollups.refresh(db)
+    if days:
+        print(f"Refreshed funnel rollups for {days} days.")
 
 # Schedule the job every day at 09:00 (or every minute for demo)
 schedule.every(1).minutes.do(send_daily_reminders)
+schedule.every(1).minutes.do(refresh_rollups)
 
 if __name__ == "__main__":
     print("Scheduler started. Press Ctrl+C to stop.")
@@ -0,0 +1,76 @@
+"""
+The API reads DATABASE_URL when api.database is imported, so point it at a
+throwaway SQLite file before any test imports the app.
+"""
+import os
+import tempfile
+
+import pytest
+
+_tmp = tempfile.mkdtemp(prefix="crm-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/test.db"
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+PASSWORD = "Manager@2024Password!"
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from api.index import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def _login(client, username, password):
+    response = client.post("/api/token", data={"username": username, "password": password})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def _user(client, username):
+    client.post("/api/register", json={"username": username, "password": PASSWORD})
+    headers = _login(client, username, PASSWORD)
+    return headers, client.get("/api/users/me", headers=headers).json()["id"]
+
+
+@pytest.fixture(scope="session")
+def admin_headers(client):
+    return _login(client, "admin", "Admin@2024Secure!Password")
+
+
+@pytest.fixture(scope="session")
+def manager(client):
+    """(headers, user id) of a manager."""
+    return _user(client, "manager_one")
+
+
+@pytest.fixture(scope="session")
+def other_manager(client):
+    return _user(client, "manager_two")
+
+
+@pytest.fixture
+def db(client):
+    from api.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_lead(db):
+    """Insert a hot lead and return its ID."""
+    from api.database import Lead
+
+    def make(**fields):
+        lead = Lead(full_name=fields.pop("full_name", "Тест"), stage=fields.pop("stage", "Новый"), **fields)
+        db.add(lead)
+        db.commit()
+        return lead.id
+
+    return make
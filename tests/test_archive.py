@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from api import archive, database, search
+from api.database import ArchivedInteraction, Interaction, Lead, StageEvent
+
+
+def test_archived_ids_are_not_reused(client, admin_headers, db, make_lead):
+    old_id = make_lead(full_name="Архивный", is_archived=True, updated_at=datetime.now() - timedelta(days=30))
+    db.add(Interaction(lead_id=old_id, contact_method="Call", content="cold note"))
+    db.add(StageEvent(lead_id=old_id, from_stage=None, to_stage="Новый"))
+    db.commit()
+    archive.archive_leads(db, older_than_days=1)
+    assert db.get(Lead, old_id) is None
+
+    new_id = make_lead(full_name="Новый")
+    assert new_id > old_id
+
+    detail = client.get(f"/api/leads/{new_id}", headers=admin_headers)
+    assert detail.status_code == 200
+    assert detail.json()["interactions"] == []
+
+    assert client.delete(f"/api/leads/{new_id}", headers=admin_headers).status_code == 200
+    db.expire_all()
+    cold_notes = db.execute(select(func.count()).where(ArchivedInteraction.lead_id == old_id)).scalar()
+    events = db.execute(select(func.count()).where(StageEvent.lead_id == old_id)).scalar()
+    assert (cold_notes, events) == (1, 1)
+
+
+def test_upgrade_adds_autoincrement(tmp_path):
+    """A crm.db created by the original console (no AUTOINCREMENT) is rebuilt in place."""
+    engine = database.make_engine(f"sqlite:///{tmp_path}/legacy.db")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE leads (id INTEGER PRIMARY KEY, telegram_id INTEGER UNIQUE, phone VARCHAR, "
+            "full_name VARCHAR, username VARCHAR, bio TEXT, stage VARCHAR, manager_name VARCHAR, "
+            "created_at DATETIME, updated_at DATETIME, next_contact_date DATETIME)"
+        ))
+        conn.execute(text(
+            "CREATE TABLE interactions (id INTEGER PRIMARY KEY, lead_id INTEGER REFERENCES leads(id), "
+            "timestamp DATETIME, contact_method VARCHAR, content TEXT)"
+        ))
+        conn.execute(text("INSERT INTO leads (id, full_name, stage) VALUES (1, 'Старый', 'Новый')"))
+        conn.execute(text("INSERT INTO interactions (id, lead_id, content) VALUES (1, 1, 'note')"))
+    database.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO leads_archive (id, full_name, stage) VALUES (7, 'Холодный', 'Новый')"))
+
+    added = database.upgrade_schema(engine)
+    assert {"leads AUTOINCREMENT", "interactions AUTOINCREMENT"} <= set(added)
+    assert database.upgrade_schema(engine) == []
+
+    with engine.begin() as conn:
+        assert conn.execute(text("SELECT content FROM interactions WHERE lead_id = 1")).scalar() == "note"
+        indexes = {name for (name,) in conn.execute(text("SELECT name FROM sqlite_master WHERE tbl_name = 'leads'"))}
+        assert {"ix_leads_board_updated", "ix_leads_next_contact"} <= indexes
+        triggers = set(conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+        assert set(search.SQLITE_TRIGGERS) <= triggers
+        new_id = conn.execute(text("INSERT INTO leads (full_name, stage) VALUES ('Новый', 'Новый') RETURNING id")).scalar()
+    assert new_id == 8
+    engine.dispose()
+
+
+def test_compaction_requires_admin(client, manager):
+    assert client.post("/api/archive/compact", headers=manager[0]).status_code == 403
@@ -0,0 +1,23 @@
+def test_metrics_refresh_requires_admin(client, manager, admin_headers):
+    assert client.post("/api/batches/metrics/refresh", headers=manager[0]).status_code == 403
+    assert client.post("/api/batches/metrics/refresh", headers=admin_headers).status_code == 200
+
+
+def test_batch_purge_requires_admin(client, manager, admin_headers, db, make_lead):
+    from api.database import Lead, LeadBatch
+
+    batch = LeadBatch(name="Чужая партия", count=2)
+    db.add(batch)
+    db.commit()
+    lead_ids = [make_lead(batch_id=batch.id), make_lead(batch_id=batch.id)]
+
+    for background in (False, True):
+        response = client.delete(
+            f"/api/batches/{batch.id}", headers=manager[0], params={"delete_leads": True, "background": background},
+        )
+        assert response.status_code == 403
+    db.expire_all()
+    assert all(db.get(Lead, lead_id) is not None for lead_id in lead_ids)
+
+    response = client.delete(f"/api/batches/{batch.id}", headers=admin_headers, params={"delete_leads": True})
+    assert response.json()["deleted_leads"] == 2
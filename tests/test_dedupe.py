@@ -0,0 +1,20 @@
+def test_merge_requires_admin(client, manager, make_lead):
+    headers, user_id = manager
+    keep, drop = make_lead(owner_id=user_id), make_lead(owner_id=user_id)
+    response = client.post("/api/dedupe/merge", json={"groups": [[keep, drop]]}, headers=headers)
+    assert response.status_code == 403
+
+
+def test_admin_merges(client, admin_headers, make_lead, db):
+    from api.database import Lead
+
+    keep, drop = make_lead(phone="79990001122"), make_lead(phone="79990001122")
+    response = client.post("/api/dedupe/merge", json={"groups": [[keep, drop]]}, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["survivor_ids"] == [keep]
+    assert db.get(Lead, drop) is None
+
+
+def test_scan_requires_admin(client, manager, admin_headers):
+    assert client.post("/api/dedupe/scan", headers=manager[0]).status_code == 403
+    assert client.post("/api/dedupe/scan", headers=admin_headers).status_code == 200
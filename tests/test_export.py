@@ -0,0 +1,34 @@
+import io
+
+import openpyxl
+from sqlalchemy import select
+
+from api.database import Lead, LeadBatch
+
+
+def test_xlsx_with_control_characters_round_trips(client, admin_headers, db, make_lead):
+    batch = LeadBatch(name="Экспорт", count=1)
+    db.add(batch)
+    db.commit()
+    lead_id = make_lead(full_name="Ив\x01ан", bio="строка\x0bвторая", telegram_id=777000111, batch_id=batch.id)
+
+    response = client.get(
+        "/api/leads/export", headers=admin_headers,
+        params={"format": "xlsx", "scope": "all", "batch_id": batch.id},
+    )
+    assert response.status_code == 200
+    sheet = openpyxl.load_workbook(io.BytesIO(response.content), read_only=True).active
+    header, row = [list(r) for r in sheet.iter_rows(values_only=True)]
+    assert row[:5] == [777000111, None, "Иван", None, "строкавторая"]
+
+    # The export is an import file: drop the lead and bring it back from the sheet
+    assert client.delete(f"/api/leads/{lead_id}", headers=admin_headers).status_code == 200
+    imported = client.post(
+        "/api/import", headers=admin_headers,
+        files={"file": ("leads.xlsx", response.content, "application/octet-stream")},
+    )
+    assert imported.status_code == 200, imported.text
+    assert imported.json()["inserted"] == 1
+    db.expire_all()
+    restored = db.execute(select(Lead.full_name, Lead.bio).where(Lead.telegram_id == 777000111)).one()
+    assert tuple(restored) == ("Иван", "строкавторая")
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select
+
+from api import importing
+from api.database import Lead, LeadBatch
+
+
+def _rows(first_id, n):
+    return [{"telegram_id": first_id + i, "full_name": f"Импорт {i}"} for i in range(n)]
+
+
+def _unfinished_batch(db, key, claimed_at):
+    batch = LeadBatch(name=key, content_hash=key, state="processing", processed_rows=0, count=0, claimed_at=claimed_at)
+    db.add(batch)
+    db.commit()
+    return batch.id
+
+
+def test_live_claim_is_refused(db):
+    _unfinished_batch(db, "live-claim", datetime.now())
+    with pytest.raises(importing.ImportInProgressError):
+        importing.import_source(db, "live-claim", lambda skip_rows: [_rows(900_000, 3)], "live", None)
+
+
+def test_stale_claim_is_taken_over(db):
+    batch_id = _unfinished_batch(db, "stale-claim", datetime.now() - timedelta(seconds=importing.CLAIM_STALE_SECONDS + 1))
+    result = importing.import_source(db, "stale-claim", lambda skip_rows: [_rows(910_000, 3)[skip_rows:]], "stale", None)
+    assert (result["batch_id"], result["inserted"]) == (batch_id, 3)
+    batch = db.get(LeadBatch, batch_id)
+    assert (batch.state, batch.claimed_at) == ("done", None)
+
+
+def test_taken_over_import_stops_writing(db):
+    claimed_at = datetime.now() - timedelta(hours=1)
+    batch_id = _unfinished_batch(db, "taken-over", claimed_at)
+    assert importing._claim(db, batch_id) is not None
+    batch = db.get(LeadBatch, batch_id)
+    with pytest.raises(importing.ImportInProgressError):
+        importing._write_chunks(db, batch, [_rows(920_000, 3)], set(), claimed_at)
+    assert db.execute(select(func.count()).where(Lead.batch_id == batch_id)).scalar() == 0
+
+
+def test_rows_are_written_as_they_are_read(db, monkeypatch):
+    from api.database import SessionLocal
+
+    monkeypatch.setattr(importing, "IMPORT_CHUNK_ROWS", 2)
+    committed = []
+
+    def load(skip_rows):
+        yield _rows(930_000, 2)
+        with SessionLocal() as other:
+            committed.append(other.execute(
+                select(func.count()).where(Lead.telegram_id.between(930_000, 930_099))
+            ).scalar())
+        yield _rows(930_002, 3)
+
+    result = importing.import_source(db, "streamed", load, "streamed", None)
+    assert committed == [2]
+    assert (result["inserted"], result["skipped"]) == (5, 0)
+
+
+def test_resume_skips_frames_before_the_offset(monkeypatch):
+    import pandas as pd
+
+    frame = pd.DataFrame({"ID": [str(940_000 + i) for i in range(9)], "Полное имя": [f"Имя {i}" for i in range(9)]})
+    monkeypatch.setattr(importing, "read_frames", lambda *args: iter([frame.iloc[i:i + 3] for i in (0, 3, 6)]))
+    normalized, normalize = [], importing.normalize_frame
+    monkeypatch.setattr(importing, "normalize_frame", lambda df, columns: normalized.append(len(df)) or normalize(df, columns))
+
+    chunks = list(importing.read_rows(None, "csv", skip_rows=4))
+    assert normalized == [2, 3]
+    assert [row["telegram_id"] for chunk in chunks for row in chunk] == list(range(940_004, 940_009))
+
+
+def test_failed_upload_resumes_from_its_offset(db):
+    import io
+
+    data = ("ID,Полное имя\n" + "".join(f"{950_000 + i},Имя {i}\n" for i in range(5))).encode()
+    key = importing.source_key(importing.file_digest(io.BytesIO(data)))
+    db.add(LeadBatch(name="resume", content_hash=key, state="failed", processed_rows=2, count=2))
+    db.commit()
+
+    result = importing.import_upload(io.BytesIO(data), "resume.csv", "csv")
+    assert (result["resumed_from"], result["inserted"], result["imported_count"]) == (2, 3, 5)
+    ids = db.execute(select(Lead.telegram_id).where(Lead.telegram_id.between(950_000, 950_099))).scalars().all()
+    assert sorted(ids) == list(range(950_002, 950_005))
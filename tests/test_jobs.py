@@ -0,0 +1,30 @@
+import logging
+
+from api import jobs
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_failed_job_is_logged_with_its_id():
+    def fail(job):
+        raise RuntimeError("boom")
+
+    handler = _Records()
+    jobs.logger.addHandler(handler)
+    try:
+        job = jobs.run_job(jobs.create_job("failing"), fail)
+    finally:
+        jobs.logger.removeHandler(handler)
+
+    assert (job.status, job.error) == ("failed", "boom")
+    [record] = handler.records
+    assert (record.getMessage(), record.levelname) == ("job failed", "ERROR")
+    assert (record.job_id, record.kind) == (job.id, "failing")
+    assert record.exc_info is not None
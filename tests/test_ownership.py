@@ -0,0 +1,48 @@
+import pytest
+
+from api.database import Lead
+
+
+@pytest.fixture
+def foreign_lead(make_lead, other_manager):
+    return make_lead(owner_id=other_manager[1])
+
+
+def test_other_managers_lead_is_forbidden(client, manager, foreign_lead):
+    headers = manager[0]
+    requests = [
+        ("get", f"/api/leads/{foreign_lead}", None),
+        ("post", "/api/interactions", {"lead_id": foreign_lead, "contact_method": "Call", "content": "x"}),
+        ("post", "/api/leads/bulk/stage", {"lead_ids": [foreign_lead], "stage": "Заключен"}),
+        ("post", f"/api/leads/{foreign_lead}/archive", None),
+        ("post", f"/api/leads/{foreign_lead}/restore", None),
+        ("delete", f"/api/leads/{foreign_lead}", None),
+    ]
+    for method, url, body in requests:
+        response = client.request(method, url, headers=headers, json=body)
+        assert response.status_code == 403, (url, response.text)
+
+
+def test_owner_and_admin_are_allowed(client, db, manager, admin_headers, make_lead):
+    headers, user_id = manager
+    lead_id = make_lead(owner_id=user_id)
+    assert client.get(f"/api/leads/{lead_id}", headers=headers).status_code == 200
+    moved = client.post("/api/leads/bulk/stage", headers=headers, json={"lead_ids": [lead_id], "stage": "Заключен"})
+    assert moved.json()["moved"] == 1
+    assert client.get(f"/api/leads/{lead_id}", headers=admin_headers).status_code == 200
+    assert client.delete(f"/api/leads/{lead_id}", headers=admin_headers).status_code == 200
+    assert db.get(Lead, lead_id) is None
+
+
+def test_missing_lead_is_not_found(client, manager):
+    assert client.get("/api/leads/987654321", headers=manager[0]).status_code == 404
+    assert client.delete("/api/leads/987654321", headers=manager[0]).status_code == 404
+
+
+def test_funnel_is_scoped(client, manager, other_manager, admin_headers):
+    headers = manager[0]
+    assert client.get("/api/analytics/funnel", headers=headers).status_code == 200
+    other = {"user_id": other_manager[1]}
+    assert client.get("/api/analytics/funnel", headers=headers, params=other).status_code == 403
+    assert client.get("/api/analytics/funnel", headers=headers, params={"scope": "all"}).status_code == 403
+    assert client.get("/api/analytics/funnel", headers=admin_headers, params=other).status_code == 200
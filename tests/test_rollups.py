@@ -0,0 +1,76 @@
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from api import rollups
+from api.database import FunnelDaily, RollupState, StageEvent
+
+
+def _entered(db, day, stage):
+    db.expire_all()
+    return db.execute(
+        select(func.sum(FunnelDaily.entered)).where(FunnelDaily.day == day, FunnelDaily.stage == stage)
+    ).scalar()
+
+
+def test_refresh_skips_while_leased(db, make_lead):
+    rollups.refresh(db)
+    db.add(StageEvent(lead_id=make_lead(), to_stage="Лиз", timestamp=datetime.now()))
+    db.commit()
+    db.execute(update(RollupState).values(locked_until=datetime.now() + timedelta(minutes=5)))
+    db.commit()
+    assert rollups.refresh(db) is None
+    assert rollups.pending(db)
+
+    db.execute(update(RollupState).values(locked_until=datetime.now() - timedelta(seconds=1)))
+    db.commit()
+    assert rollups.refresh(db) >= 1
+    assert not rollups.pending(db)
+    assert db.execute(select(RollupState.locked_until)).scalar() is None
+
+
+def test_refresh_rescans_late_commits(db, make_lead):
+    lead_id = make_lead()
+    rollups.refresh(db)
+    gap = (db.execute(select(func.max(StageEvent.id))).scalar() or 0) + 1
+    db.add(StageEvent(id=gap + 1, lead_id=lead_id, to_stage="Поздний", timestamp=datetime.now()))
+    db.commit()
+    rollups.refresh(db)
+    assert _entered(db, date.today(), "Поздний") == 1
+
+    # An ID below the watermark, committed after the run that moved past it
+    db.add(StageEvent(id=gap, lead_id=lead_id, to_stage="Поздний", timestamp=datetime.now()))
+    db.commit()
+    assert not rollups.pending(db)
+    rollups.refresh(db)
+    assert _entered(db, date.today(), "Поздний") == 2
+
+
+def test_rollup_days_upserts_and_prunes(db, make_lead):
+    day = date(2020, 3, 2)
+    stamp = datetime.combine(day, datetime.min.time()) + timedelta(hours=10)
+    lead_id = make_lead()
+    events = [StageEvent(lead_id=lead_id, to_stage=stage, timestamp=stamp) for stage in ("Один", "Два")]
+    db.add_all(events)
+    db.commit()
+    rollups.rollup_days(db, day, day)
+    rollups.rollup_days(db, day, day)
+    db.commit()
+    assert (_entered(db, day, "Один"), _entered(db, day, "Два")) == (1, 1)
+
+    db.delete(events[1])
+    db.commit()
+    rollups.rollup_days(db, day, day)
+    db.commit()
+    assert (_entered(db, day, "Один"), _entered(db, day, "Два")) == (1, None)
+
+
+def test_funnel_endpoint_reads_only(client, admin_headers, db, make_lead):
+    rollups.refresh(db)
+    db.add(StageEvent(lead_id=make_lead(), to_stage="Новый", timestamp=datetime.now()))
+    db.commit()
+    response = client.get("/api/analytics/funnel", headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["refresh_pending"] is True
+    # The queued background refresh has run by the time TestClient returns
+    assert not rollups.pending(db)
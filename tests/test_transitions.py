@@ -0,0 +1,38 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from api import transitions
+from api.database import Interaction, StageEvent
+
+FIXED = datetime(2026, 1, 5, 12, 0, 0)
+
+
+class _FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return FIXED
+
+
+@pytest.mark.parametrize("returning", [True, False])
+def test_move_leads_links_its_own_interactions(db, make_lead, monkeypatch, returning):
+    monkeypatch.setattr(transitions, "datetime", _FrozenDatetime)
+    monkeypatch.setattr(db.get_bind().dialect, "insert_returning", returning)
+    first, second = make_lead(stage="Новый"), make_lead(stage="Новый")
+    # An earlier move written in the same instant must not be picked up
+    db.add(Interaction(lead_id=first, timestamp=FIXED, contact_method=transitions.MOVE_METHOD, content="Moved from A to B"))
+    db.commit()
+
+    assert transitions.move_leads(db, [first, second], "Заключен") == 2
+    db.commit()
+
+    events = db.execute(
+        select(StageEvent.lead_id, StageEvent.from_stage, Interaction.lead_id, Interaction.contact_method, Interaction.content)
+        .join(Interaction, Interaction.id == StageEvent.interaction_id)
+        .where(StageEvent.lead_id.in_([first, second]))
+        .order_by(StageEvent.lead_id)
+    ).all()
+    assert events == [
+        (lead_id, "Новый", lead_id, transitions.MOVE_METHOD, "Moved from Новый to Заключен") for lead_id in (first, second)
+    ]